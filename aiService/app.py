@@ -1,20 +1,131 @@
-from fastapi import FastAPI
-
 from interface import DatabaseInput, DatabaseRequest, PlanRequest, PlanResponse, TripPlan , YoutubeLinkRequest, YoutubeLinkResponse, ChatRequest
+from interface import YoutubeBulkRequest, YoutubeBulkResponse, PlanJobRequest, PlanJobResponse
 from data_importer import DataImporter
 from utils.llm_caller import LLMCaller
+from utils.youtube_ingest import build_youtube_ingestor_from_env, parse_video_ids
+from utils.plan_jobs import WebhookURLError, build_plan_job_queue_from_env
+from utils.llm_guard import LLMUnavailableError, deadline_scope, remaining_time
+from utils.telemetry import REQUEST_SECONDS, render_metrics, request_trace, server_timing, span
+from class_mod.rest_qdrant import RestQdrantClient
+import os
 import asyncio
 import time
 from datetime import datetime
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Match
+import json
 import logging
 
-app = FastAPI()
+# LOG_LEVEL=DEBUG also logs prompts, retrieved context and raw LLM output
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s %(message)s",
+)
+logger = logging.getLogger(__name__)
+# httpx logs every upstream request at INFO; keep that off the hot path unless debugging
+if logging.getLogger().level > logging.DEBUG:
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+# One JSON line per request with its stage timings; silence with LOG_LEVEL=WARNING
+timing_logger = logging.getLogger("aiservice.timing")
+
+# Flipped by the lifespan warmup; /health stays 503 until then so cold pods get no traffic
+readiness = {"ready": False, "checks": {}}
+
+async def warmup():
+    start_time = time.time()
+    checks = {}
+    try:
+        with span("cold_start"):
+            checks["embedding_ms"] = await asyncio.to_thread(data_importer.embedder.warmup)
+            if agent.reranker is not None:
+                checks["rerank_ms"] = await asyncio.to_thread(agent.reranker.warmup)
+            checks.update(await agent.warmup())
+            checks["qdrant_search"] = await asyncio.to_thread(data_importer.coldStartDatabase)
+        readiness["ready"] = True
+    except Exception as e:
+        logger.error(f"Warmup failed: {e}")
+        checks["error"] = str(e)
+    checks["duration_s"] = round(time.time() - start_time, 2)
+    readiness["checks"] = checks
+    logger.info(f"Warmup finished: {checks}")
+
+async def sync_local_index():
+    """Keep the local index mirror of the RAG collection fresh with periodic incremental syncs"""
+    interval = float(os.getenv("LOCAL_INDEX_SYNC_INTERVAL", "300"))
+    qdrant = RestQdrantClient(url=os.getenv("QDRANT_HOST"), api_key=os.getenv("QDRANT_API_KEY") or None, timeout=30)
+    while True:
+        try:
+            await asyncio.to_thread(
+                agent.local_index.sync_from_qdrant,
+                qdrant,
+                agent.collection_name,
+                full=agent.local_index.count == 0
+            )
+        except Exception as e:
+            logger.warning(f"Local index sync failed: {e}")
+        if interval <= 0:
+            return
+        await asyncio.sleep(interval)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Run warmup in the background so the process answers liveness probes meanwhile
+    background_tasks = [asyncio.create_task(warmup())]
+    if agent.local_index is not None and os.getenv("QDRANT_HOST"):
+        background_tasks.append(asyncio.create_task(sync_local_index()))
+    plan_jobs.start()
+    yield
+    for task in background_tasks:
+        task.cancel()
+    await plan_jobs.stop()
+    await agent.aclose()
+
+app = FastAPI(lifespan=lifespan)
+# Default time budget of a request; clients can lower it with an X-Request-Timeout header (seconds)
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT_S", "180"))
+
+def _route_template(request: Request) -> str:
+    # Label metrics by route template, not raw path, so job ids do not explode the series count
+    for route in app.router.routes:
+        if route.matches(request.scope)[0] == Match.FULL:
+            return route.path
+    return "unmatched"
+
+@app.middleware("http")
+async def request_context(request: Request, call_next):
+    """Make the request's deadline visible to every LLM call it triggers, so none outlives the client,
+    and record its latency and per-stage timings (Server-Timing header, histograms, timing log)"""
+    try:
+        timeout = min(float(request.headers.get("X-Request-Timeout", REQUEST_TIMEOUT)), REQUEST_TIMEOUT)
+    except ValueError:
+        timeout = REQUEST_TIMEOUT
+    start = time.perf_counter()
+    with deadline_scope(timeout), request_trace() as trace:
+        response = await call_next(request)
+    elapsed = time.perf_counter() - start
+    route = _route_template(request)
+    REQUEST_SECONDS.observe(elapsed, method=request.method, route=route, status=str(response.status_code))
+    if trace:
+        # Streamed responses only include the stages finished before the first byte
+        response.headers["Server-Timing"] = server_timing(trace)
+        if timing_logger.isEnabledFor(logging.INFO):
+            timing_logger.info(json.dumps({
+                "method": request.method,
+                "route": route,
+                "status": response.status_code,
+                "duration_ms": round(elapsed * 1000, 1),
+                "stages_ms": {stage: round(value * 1000, 1) for stage, value in trace.items() if not stage.startswith("tokens_")},
+                "tokens_in": trace.get("tokens_in", 0),
+                "tokens_out": trace.get("tokens_out", 0),
+            }))
+    return response
+
 data_importer = DataImporter()
 agent = LLMCaller()
-
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+youtube_ingestor = build_youtube_ingestor_from_env(data_importer)
+data_importer.local_index = agent.local_index
 
 @app.get("/")
 def root():
@@ -25,14 +136,23 @@ def root():
         "timestamp": datetime.utcnow().isoformat()
     }
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus scrape endpoint: request latency, per-stage durations and LLM token histograms"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 @app.get("/health")
 def health_check():
-    """Health check endpoint"""
-    return {
-        "status": "healthy",
+    """Readiness endpoint - returns 503 until startup warmup has finished"""
+    body = {
+        "status": "healthy" if readiness["ready"] else "warming_up",
         "timestamp": datetime.utcnow().isoformat(),
-        "service": "PAN-SEA Travel Planning API"
+        "service": "PAN-SEA Travel Planning API",
+        "checks": readiness["checks"]
     }
+    if not readiness["ready"]:
+        return JSONResponse(status_code=503, content=body)
+    return body
 
 @app.get("/v1")
 def greet_json():
@@ -45,16 +165,66 @@ def greet_json():
         "checks": {}
     }
     return health_status
+
+@app.get("/v1/cache/stats")
+def cache_stats():
+    """Hit/miss counters of the trip-plan response cache"""
+    if agent.plan_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **agent.plan_cache.stats()}
+
+@app.get("/v1/cache/embeddings/stats")
+def embedding_cache_stats():
+    """Hit/miss counters of the embedding cache in front of the shared encoder"""
+    if agent.embedder.cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **agent.embedder.cache.stats()}
+
+@app.get("/v1/embeddings/batcher/stats")
+def embedding_batcher_stats():
+    """Queue depth and batch-size histograms of the embedding micro-batcher"""
+    if agent.embedder.batcher is None:
+        return {"enabled": False}
+    return {"enabled": True, **agent.embedder.batcher.stats()}
+
+@app.get("/v1/rerank/stats")
+def rerank_stats():
+    """Calls, score-cache hit rate, budget timeouts and latency of the cross-encoder rerank stage"""
+    if agent.reranker is None:
+        return {"enabled": False}
+    return {"enabled": True, **agent.reranker.stats()}
+
+@app.get("/v1/singleflight/stats")
+def single_flight_stats():
+    """Calls, executions and upstream calls saved by coalescing identical concurrent requests"""
+    return {
+        "plans_and_chat": agent.single_flight.stats() if agent.single_flight else {"enabled": False},
+        "search": data_importer.single_flight.stats() if data_importer.single_flight else {"enabled": False},
+    }
+
+@app.get("/v1/llm/guard/stats")
+def llm_guard_stats():
+    """Adaptive concurrency limit, circuit state and outcome counters per LLM model"""
+    return {model: guard.stats() for model, guard in agent.guards.items()}
+
+@app.get("/v1/llm/routing/stats")
+def llm_routing_stats():
+    """Routing decisions, escalation rates and per-model latency, tokens and cost"""
+    return agent.router.stats()
+
+@app.get("/v1/llm/repair/stats")
+def llm_repair_stats():
+    """How often plan JSON needed repair or section re-requests, and the tokens that saved"""
+    return agent.get_repair_stats()
+
 MAX_RETRIES = 3
 RETRY_DELAY = 2  # seconds
-@app.post("/v1/generateTripPlan", response_model=PlanResponse)
-def generate_trip_plan(request: PlanRequest):
-    data_importer.coldStartDatabase()
-    
+async def run_trip_plan(request: PlanRequest) -> PlanResponse:
+    """RAG pipeline with retries, shared by the synchronous endpoint and the job queue workers"""
     for attempt in range(MAX_RETRIES):
         try:
             logger.info(f"Generating trip plan - attempt {attempt + 1}/{MAX_RETRIES}")
-            trip_plan = asyncio.run(agent.query_with_rag(request))
+            trip_plan = await agent.query_with_rag(request)
             return PlanResponse(
                 tripOverview=trip_plan.tripOverview,
                 query_params=request,
@@ -64,11 +234,15 @@ def generate_trip_plan(request: PlanRequest):
                 meta={
                     "status": "success", 
                     "timestamp": datetime.utcnow().isoformat(),
-                    "attempt": attempt + 1
+                    "attempt": attempt + 1,
+                    "cache": trip_plan.meta.get("cache")
                 }
             )
         except Exception as e:
             logger.warning(f"Error on attempt {attempt + 1}: {e}")
+            # Fail fast while the LLM is shedding load; retrying would only add to it
+            if isinstance(e, HTTPException) and e.status_code == 503:
+                raise
 
             # If this was the last attempt, raise the error
             if attempt == MAX_RETRIES - 1:
@@ -82,9 +256,115 @@ def generate_trip_plan(request: PlanRequest):
                     }
                 )
             
-            # Wait before retrying
-            logger.info(f"Retrying in {RETRY_DELAY} seconds...")
-            time.sleep(RETRY_DELAY)
+            # Wait before retrying, backing off exponentially without blocking the event loop
+            delay = RETRY_DELAY * (2 ** attempt)
+            remaining = remaining_time()
+            if remaining is not None and remaining < delay:
+                raise HTTPException(
+                    status_code=504,
+                    detail={
+                        "error": "Request timeout",
+                        "message": f"Request deadline reached after {attempt + 1} attempt(s)",
+                        "details": "The service is experiencing high load. Please try again later."
+                    }
+                )
+            logger.info(f"Retrying in {delay} seconds...")
+            await asyncio.sleep(delay)
+
+@app.post("/v1/generateTripPlan", response_model=PlanResponse)
+async def generate_trip_plan(request: PlanRequest):
+    return await run_trip_plan(request)
+
+plan_jobs = build_plan_job_queue_from_env(run_trip_plan)
+
+@app.post("/v1/generateTripPlan/jobs", response_model=PlanJobResponse, status_code=202)
+async def submit_trip_plan_job(request: PlanJobRequest):
+    """Queue a trip plan and return immediately; poll /v1/generateTripPlan/jobs/{job_id} or pass a webhook_url.
+    Identical requests already queued or running share one job."""
+    try:
+        if request.webhook_url:
+            await plan_jobs.check_webhook(request.webhook_url)
+        job, coalesced = plan_jobs.submit(request.plan, request.webhook_url)
+    except WebhookURLError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid webhook_url: {e}")
+    except asyncio.QueueFull:
+        raise HTTPException(status_code=429, detail="Trip plan queue is full, try again later")
+    return PlanJobResponse(job_id=job.job_id, status=job.status, coalesced=coalesced)
+
+@app.post("/v1/generateTripPlan/draft")
+async def generate_trip_plan_draft(request: PlanJobRequest):
+    """Draft then refine: a plan from the fast model right away, with `meta.refine_job_id` naming the job
+    that generates the full plan (poll it or pass a webhook_url). Without a usable draft only the job is returned."""
+    try:
+        if request.webhook_url:
+            await plan_jobs.check_webhook(request.webhook_url)
+        job, coalesced = plan_jobs.submit(request.plan, request.webhook_url)
+    except WebhookURLError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid webhook_url: {e}")
+    except asyncio.QueueFull:
+        raise HTTPException(status_code=429, detail="Trip plan queue is full, try again later")
+    draft = None
+    if agent.drafts_enabled:
+        try:
+            draft = await agent.draft_with_rag(request.plan)
+        except Exception as e:
+            logger.warning(f"No draft plan, returning the refinement job only: {e}")
+    if draft is None:
+        return JSONResponse(
+            status_code=202,
+            content=PlanJobResponse(job_id=job.job_id, status=job.status, coalesced=coalesced).model_dump()
+        )
+    draft.query_params = request.plan
+    draft.meta = {
+        "status": "success",
+        "timestamp": datetime.utcnow().isoformat(),
+        "draft": draft.meta.get("draft", False),
+        "model": draft.meta.get("model"),
+        "cache": draft.meta.get("cache"),
+        "refine_job_id": job.job_id,
+    }
+    return draft
+
+@app.get("/v1/generateTripPlan/jobs/{job_id}", response_model=dict)
+async def get_trip_plan_job(job_id: str):
+    job = plan_jobs.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired job id: {job_id}")
+    return job.to_dict()
+
+@app.get("/v1/jobs/stats")
+def plan_job_stats():
+    """Queue depth, coalesced submissions and outcomes of the trip-plan job queue"""
+    return plan_jobs.stats()
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/v1/generateTripPlan/stream")
+async def generate_trip_plan_stream(request: PlanRequest):
+    """Server-sent events: tripOverview, preparation, day, spot and budget as soon as each is complete,
+    then a final `plan` event with the same shape as /v1/generateTripPlan"""
+    async def event_stream():
+        try:
+            async for event, data in agent.stream_with_rag(request):
+                if event == "plan":
+                    data["meta"] = {
+                        "status": "success",
+                        "timestamp": datetime.utcnow().isoformat(),
+                        "streamed": True,
+                        "cache": data.get("meta", {}).get("cache")
+                    }
+                yield _sse(event, data)
+        except Exception as e:
+            logger.error(f"Error streaming trip plan: {e}")
+            yield _sse("error", {"error": "Internal server error", "message": str(e)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 @app.post("/v1/addYoutubeLink", response_model=YoutubeLinkResponse)
@@ -108,13 +388,31 @@ def add_youtube_link(request: YoutubeLinkRequest):
             }
         )
 
+@app.post("/v1/addYoutubeLinks", response_model=YoutubeBulkResponse)
+def add_youtube_links(request: YoutubeBulkRequest):
+    """Queue a bulk ingestion job; poll /v1/youtubeJobs/{job_id} for progress"""
+    video_ids = parse_video_ids("\n".join(request.video_ids))
+    if request.playlist_export:
+        video_ids += [v for v in parse_video_ids(request.playlist_export) if v not in video_ids]
+    if not video_ids:
+        raise HTTPException(status_code=400, detail="No valid video ids found")
+    job = youtube_ingestor.start(video_ids)
+    return YoutubeBulkResponse(job_id=job.job_id, status=job.status, total=job.total)
+
+@app.get("/v1/youtubeJobs/{job_id}", response_model=dict)
+def get_youtube_job(job_id: str):
+    job = youtube_ingestor.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job id: {job_id}")
+    return job.to_dict()
+
 @app.post("/v1/addDirectlyToCollection", response_model=str)
 def add_text_to_collection(data: DatabaseInput) -> str:
     try:
         point_id = data_importer.insert_directly(collection=data.collection_name, data=data.data)
         return point_id
     except Exception as e:
-        print(f"Error inserting text: {e}")
+        logger.error(f"Error inserting text: {e}")
         return str(e)
     
 @app.post("/v1/searchSimilar", response_model=list[dict])
@@ -137,14 +435,20 @@ def search_similar(request: DatabaseRequest):
         )
 
 @app.post("/v1/basicChat", response_model=str)
-def basic_chat(request: ChatRequest):
+async def basic_chat(request: ChatRequest):
     try:
         user_message = request.message
-        print(f"User message: {user_message}")
-        llm_response = asyncio.run(agent.basic_query(
+        logger.debug("User message: %s", user_message)
+        llm_response = await agent.basic_query(
             user_prompt=user_message
-        ))
+        )
         return llm_response
+    except LLMUnavailableError as e:
+        raise HTTPException(
+            status_code=503,
+            detail={"error": "LLM unavailable", "message": str(e)},
+            headers={"Retry-After": str(max(1, round(e.retry_after)))}
+        )
     except Exception as e:
         logger.error(f"Error in basic_chat: {e}")
         raise HTTPException(
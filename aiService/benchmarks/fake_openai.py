@@ -0,0 +1,176 @@
+"""Minimal in-process stand-in for an OpenAI-compatible chat completions endpoint.
+
+Serves GET /v1/models and POST /v1/chat/completions (plain and `stream: true`). Responses come
+from `responder(messages, model)`; the default one answers prompts that end in a "Return ONLY
+this JSON ..." template with that template filled in, so trip-plan prompts (full or sectioned)
+get parseable plans back.
+Latency, a per-token decode speed, a concurrency capacity (429 above it), a random error
+rate and a full outage can be configured to exercise the client-side protections.
+"""
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+
+from utils.json_repair import extract_json_object, repair_json
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def handle_error(self, request, client_address):
+        # Clients that time out hang up mid-response; that is expected, not worth a traceback
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+
+def default_responder(messages: List[Dict], model: str) -> str:
+    prompt = messages[-1].get("content", "") if messages else ""
+    marker = prompt.rfind("Return ONLY this JSON")
+    if marker < 0:
+        return "Sawasdee! I can help you plan a trip around Southeast Asia. Where would you like to go?"
+    template = extract_json_object(prompt[marker:])
+    # The full-plan template uses bare `float` placeholders for coordinates
+    template = re.sub(r":\s*float\b", ": 18.7883", template)
+    return json.dumps(json.loads(repair_json(template)), ensure_ascii=False)
+
+
+class FakeOpenAI:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency_ms: float = 50.0,
+        tokens_per_s: Optional[float] = None,
+        capacity: Optional[int] = None,
+        error_rate: float = 0.0,
+        error_status: int = 503,
+        responder: Callable[[List[Dict], str], str] = default_responder,
+    ):
+        self.latency_ms = latency_ms
+        self.tokens_per_s = tokens_per_s
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.responder = responder
+        self.outage = False
+        self.in_flight = 0
+        self.stats = {"requests": 0, "completed": 0, "rejected": 0, "errors": 0, "max_in_flight": 0}
+        self._lock = threading.Lock()
+        self.server = _Server((host, port), self._handler())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeOpenAI":
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True, name="fake-openai")
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, body: Dict):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _error(self, status: int, message: str):
+                self._send(status, {"error": {"message": message, "type": "fake_error", "code": status}})
+
+            def do_GET(self):
+                if self.path.rstrip("/") == "/v1/models":
+                    return self._send(200, {"object": "list", "data": [{"id": "fake-model", "object": "model"}]})
+                self._error(404, f"Unknown path {self.path}")
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length)) if length else {}
+                if self.path.rstrip("/") != "/v1/chat/completions":
+                    return self._error(404, f"Unknown path {self.path}")
+
+                with fake._lock:
+                    fake.stats["requests"] += 1
+                    if fake.capacity is not None and fake.in_flight >= fake.capacity:
+                        fake.stats["rejected"] += 1
+                        return self._error(429, "Rate limit exceeded")
+                    fake.in_flight += 1
+                    fake.stats["max_in_flight"] = max(fake.stats["max_in_flight"], fake.in_flight)
+                try:
+                    if fake.outage or random.random() < fake.error_rate:
+                        with fake._lock:
+                            fake.stats["errors"] += 1
+                        time.sleep(fake.latency_ms / 1000)
+                        return self._error(fake.error_status, "Upstream unavailable")
+                    self._complete(body)
+                    with fake._lock:
+                        fake.stats["completed"] += 1
+                finally:
+                    with fake._lock:
+                        fake.in_flight -= 1
+
+            def _complete(self, body: Dict):
+                messages = body.get("messages", [])
+                model = body.get("model", "fake-model")
+                content = fake.responder(messages, model)
+                prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 4
+                completion_tokens = max(1, len(content) // 4)
+                completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+                time.sleep(fake.latency_ms / 1000)
+
+                if not body.get("stream"):
+                    if fake.tokens_per_s:
+                        time.sleep(completion_tokens / fake.tokens_per_s)
+                    return self._send(200, {
+                        "id": completion_id,
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": model,
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                                  "total_tokens": prompt_tokens + completion_tokens},
+                    })
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+                piece = 16
+                for i in range(0, len(content), piece):
+                    if fake.tokens_per_s:
+                        time.sleep((piece / 4) / fake.tokens_per_s)
+                    chunk = {
+                        "id": completion_id,
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": model,
+                        "choices": [{"index": 0, "delta": {"content": content[i:i + piece]}, "finish_reason": None}],
+                    }
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+
+        return Handler
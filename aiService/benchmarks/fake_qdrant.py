@@ -0,0 +1,291 @@
+"""Minimal in-process stand-in for the Qdrant REST API used by the benchmarks.
+
+Supports the endpoints the service calls: collection listing/creation, point upsert,
+scroll, search and batch search over brute-force cosine similarity. Collections can have a
+single unnamed vector or a named dense vector plus named sparse vectors (dot product over
+the shared indices), like the hybrid collections. Search filters (must/should/must_not with
+match, range and is_empty conditions) and payload projection are evaluated in Python; payload
+index requests are accepted and ignored. An optional fixed latency per request simulates the
+network hop to a real cluster.
+"""
+import re
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Sequence
+from urllib.parse import urlparse
+
+import numpy as np
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # The stdlib default backlog of 5 drops SYNs under concurrent clients and adds 1 s retransmits
+    request_queue_size = 1024
+
+
+def _values(payload: Dict, key: str) -> List:
+    """Values at a Qdrant payload key such as `country`, `destination_place.name` or `visited_place[].name`"""
+    values = [payload]
+    for part in key.split("."):
+        name = part[:-2] if part.endswith("[]") else part
+        found = []
+        for value in values:
+            if isinstance(value, dict) and value.get(name) is not None:
+                item = value[name]
+                found.extend(item if isinstance(item, list) else [item])
+        values = found
+    return values
+
+
+def _condition(payload: Dict, condition: Dict) -> bool:
+    if any(clause in condition for clause in ("must", "should", "must_not")):
+        return matches(payload, condition)
+    if "is_empty" in condition:
+        return not _values(payload, condition["is_empty"]["key"])
+    values = _values(payload, condition["key"])
+    if "match" in condition:
+        match = condition["match"]
+        if "text" in match:
+            return any(match["text"].lower() in str(value).lower() for value in values)
+        if "any" in match:
+            return any(value in match["any"] for value in values)
+        return match.get("value") in values
+    if "range" in condition:
+        bounds = condition["range"]
+        checks = {"gt": lambda v, b: v > b, "gte": lambda v, b: v >= b, "lt": lambda v, b: v < b, "lte": lambda v, b: v <= b}
+        return any(
+            isinstance(value, (int, float)) and all(checks[op](value, bound) for op, bound in bounds.items() if bound is not None)
+            for value in values
+        )
+    return False
+
+
+def matches(payload: Dict, query_filter: Optional[Dict]) -> bool:
+    if not query_filter:
+        return True
+    must = query_filter.get("must") or []
+    should = query_filter.get("should") or []
+    must_not = query_filter.get("must_not") or []
+    return (
+        all(_condition(payload, c) for c in must)
+        and (not should or any(_condition(payload, c) for c in should))
+        and not any(_condition(payload, c) for c in must_not)
+    )
+
+
+def project(payload: Dict, with_payload) -> Optional[Dict]:
+    if not with_payload:
+        return None
+    if isinstance(with_payload, list):
+        with_payload = {"include": with_payload}
+    if isinstance(with_payload, dict):
+        if "include" in with_payload:
+            return {k: v for k, v in payload.items() if k in with_payload["include"]}
+        return {k: v for k, v in payload.items() if k not in with_payload.get("exclude", [])}
+    return payload
+
+
+class FakeCollection:
+    def __init__(self, size: int, vector_name: Optional[str] = None, sparse_names: Sequence[str] = ()):
+        self.size = size
+        self.vector_name = vector_name
+        self.ids: List = []
+        self.payloads: List[Dict] = []
+        self.vectors = np.zeros((0, size), dtype=np.float32)
+        self.sparse: Dict[str, List[Dict[int, float]]] = {name: [] for name in sparse_names}
+        self.payload_indexes: Dict[str, object] = {}
+        self.lock = threading.Lock()
+
+    def config(self) -> Dict:
+        dense = {"size": self.size, "distance": "Cosine"}
+        params = {"vectors": {self.vector_name: dense} if self.vector_name else dense}
+        if self.sparse:
+            params["sparse_vectors"] = {name: {} for name in self.sparse}
+        return {"params": params}
+
+    def upsert(self, points: List[Dict]):
+        with self.lock:
+            index = {point_id: i for i, point_id in enumerate(self.ids)}
+            new_vectors = []
+            for point in points:
+                named = point["vector"] if isinstance(point["vector"], dict) else {self.vector_name: point["vector"]}
+                vector = np.asarray(named[self.vector_name], dtype=np.float32)
+                vector /= max(np.linalg.norm(vector), 1e-12)
+                sparse = {
+                    name: dict(zip(named[name]["indices"], named[name]["values"])) if name in named else {}
+                    for name in self.sparse
+                }
+                if point["id"] in index:
+                    row = index[point["id"]]
+                    self.vectors[row] = vector
+                    self.payloads[row] = point.get("payload") or {}
+                    for name, weights in sparse.items():
+                        self.sparse[name][row] = weights
+                else:
+                    self.ids.append(point["id"])
+                    self.payloads.append(point.get("payload") or {})
+                    new_vectors.append(vector)
+                    for name, weights in sparse.items():
+                        self.sparse[name].append(weights)
+            if new_vectors:
+                self.vectors = np.vstack([self.vectors, np.stack(new_vectors)])
+
+    def vector_of(self, row: int):
+        if not self.vector_name:
+            return self.vectors[row].tolist()
+        named = {self.vector_name: self.vectors[row].tolist()}
+        for name, rows in self.sparse.items():
+            named[name] = {"indices": list(rows[row]), "values": list(rows[row].values())}
+        return named
+
+    def search(self, request: Dict) -> List[Dict]:
+        vector = request["vector"]
+        name = vector.get("name") if isinstance(vector, dict) else None
+        limit = request.get("limit", 10)
+        with self.lock:
+            if not self.ids:
+                return []
+            allowed = np.asarray([matches(payload, request.get("filter")) for payload in self.payloads])
+            if name in self.sparse:
+                query = dict(zip(vector["vector"]["indices"], vector["vector"]["values"]))
+                scores = np.asarray([
+                    sum(weight * doc.get(index, 0.0) for index, weight in query.items()) for doc in self.sparse[name]
+                ])
+                scores = np.where(allowed, scores, 0.0)
+                # Like Qdrant, sparse search only returns points that share at least one index
+                top = [i for i in np.argsort(-scores)[:limit] if scores[i] > 0]
+            else:
+                query = np.asarray(vector["vector"] if name else vector, dtype=np.float32)
+                query /= max(np.linalg.norm(query), 1e-12)
+                scores = np.where(allowed, self.vectors @ query, -np.inf)
+                top = [i for i in np.argsort(-scores)[:limit] if allowed[i]]
+            return [
+                {
+                    "id": self.ids[i],
+                    "version": 0,
+                    "score": float(scores[i]),
+                    "payload": project(self.payloads[i], request.get("with_payload")),
+                }
+                for i in top
+            ]
+
+
+class FakeQdrant:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_ms: float = 0.0):
+        self.collections: Dict[str, FakeCollection] = {}
+        self.latency_ms = latency_ms
+        self.request_count = 0
+        self.server = _Server((host, port), self._handler())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def create_collection(self, name: str, size: int, vector_name: Optional[str] = None,
+                          sparse_names: Sequence[str] = ()) -> FakeCollection:
+        self.collections[name] = FakeCollection(size, vector_name, sparse_names)
+        return self.collections[name]
+
+    def start(self) -> "FakeQdrant":
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True, name="fake-qdrant")
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, body: Dict):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _ok(self, result):
+                self._send(200, {"result": result, "status": "ok", "time": 0.0})
+
+            def _body(self) -> Dict:
+                length = int(self.headers.get("Content-Length") or 0)
+                return json.loads(self.rfile.read(length)) if length else {}
+
+            def _route(self, method: str):
+                fake.request_count += 1
+                if fake.latency_ms:
+                    time.sleep(fake.latency_ms / 1000)
+                path = urlparse(self.path).path.rstrip("/")
+                body = self._body() if method in ("POST", "PUT") else {}
+
+                if method == "GET" and path == "/collections":
+                    return self._ok({"collections": [{"name": name} for name in fake.collections]})
+
+                match = re.fullmatch(r"/collections/([^/]+)(/.*)?", path)
+                if not match:
+                    return self._send(404, {"status": {"error": f"Unknown path {path}"}})
+                name, rest = match.group(1), match.group(2) or ""
+
+                if method == "PUT" and rest == "":
+                    vectors = body.get("vectors", {})
+                    vector_name = None if "size" in vectors else next(iter(vectors), None)
+                    size = (vectors[vector_name] if vector_name else vectors).get("size", 1024)
+                    fake.create_collection(name, size, vector_name, list(body.get("sparse_vectors") or {}))
+                    return self._ok(True)
+                if method == "DELETE" and rest == "":
+                    fake.collections.pop(name, None)
+                    return self._ok(True)
+
+                collection = fake.collections.get(name)
+                if collection is None:
+                    return self._send(404, {"status": {"error": f"Collection `{name}` doesn't exist!"}})
+
+                if method == "GET" and rest == "":
+                    return self._ok({"status": "green", "points_count": len(collection.ids), "config": collection.config()})
+                if method == "PUT" and rest == "/index":
+                    collection.payload_indexes[body["field_name"]] = body.get("field_schema")
+                    return self._ok({"operation_id": fake.request_count, "status": "completed"})
+                if method == "PUT" and rest == "/points":
+                    collection.upsert(body.get("points", []))
+                    return self._ok({"operation_id": fake.request_count, "status": "completed"})
+                if method == "POST" and rest == "/points/search":
+                    return self._ok(collection.search(body))
+                if method == "POST" and rest == "/points/search/batch":
+                    return self._ok([collection.search(search) for search in body.get("searches", [])])
+                if method == "POST" and rest == "/points/scroll":
+                    limit = body.get("limit", 10)
+                    offset = body.get("offset") or 0
+                    points = [
+                        {"id": collection.ids[i], "payload": collection.payloads[i],
+                         "vector": collection.vector_of(i) if body.get("with_vector") else None}
+                        for i in range(offset, min(offset + limit, len(collection.ids)))
+                    ]
+                    next_offset = offset + limit if offset + limit < len(collection.ids) else None
+                    return self._ok({"points": points, "next_page_offset": next_offset})
+                return self._send(404, {"status": {"error": f"Unsupported {method} {path}"}})
+
+            def do_GET(self):
+                self._route("GET")
+
+            def do_POST(self):
+                self._route("POST")
+
+            def do_PUT(self):
+                self._route("PUT")
+
+            def do_DELETE(self):
+                self._route("DELETE")
+
+        return Handler
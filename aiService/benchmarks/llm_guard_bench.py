@@ -0,0 +1,112 @@
+"""Drive the LLM guard (AIMD limiter + circuit breaker) against the fake OpenAI server.
+
+Runs the same burst twice, without and with the guard, against a backend that answers 429
+above `--capacity` concurrent requests and goes fully down for `--outage-s` seconds midway.
+Each request is retried with backoff (honouring Retry-After when shed) up to `--attempts`
+times. Reports outcomes and how many requests actually reached the backend.
+
+Usage (from aiService/):
+    uv run python -m benchmarks.llm_guard_bench --requests 600 --concurrency 128 --capacity 16
+"""
+import time
+import asyncio
+import argparse
+from typing import Dict, Optional
+
+import httpx
+from openai import AsyncOpenAI
+
+from benchmarks.fake_openai import FakeOpenAI
+from utils.llm_guard import AdaptiveConcurrencyLimiter, CircuitBreaker, LLMGuard, LLMUnavailableError
+
+
+async def run(fake: FakeOpenAI, args, guard: Optional[LLMGuard]) -> Dict:
+    client = AsyncOpenAI(
+        api_key="fake",
+        base_url=fake.url,
+        max_retries=0,
+        http_client=httpx.AsyncClient(limits=httpx.Limits(max_connections=args.concurrency)),
+    )
+    semaphore = asyncio.Semaphore(args.concurrency)
+    outcomes = {"ok": 0, "failed": 0, "backend_errors": 0, "shed": 0}
+    before = dict(fake.stats)
+
+    async def one():
+        async with semaphore:
+            call = lambda timeout: client.chat.completions.create(
+                model="fake-model", messages=[{"role": "user", "content": "Hello"}]
+            )
+            for attempt in range(args.attempts):
+                try:
+                    await (guard.call(call) if guard else call(None))
+                    outcomes["ok"] += 1
+                    return
+                except LLMUnavailableError as e:
+                    outcomes["shed"] += 1
+                    # Honour the Retry-After the service would send, capped to keep the run short
+                    await asyncio.sleep(min(e.retry_after, 0.5) or 0.05)
+                except Exception:
+                    outcomes["backend_errors"] += 1
+                    await asyncio.sleep(min(0.05 * 2 ** attempt, 0.5))
+            outcomes["failed"] += 1
+
+    async def outage():
+        await asyncio.sleep(args.outage_at_s)
+        fake.outage = True
+        await asyncio.sleep(args.outage_s)
+        fake.outage = False
+
+    async def monitor():
+        while True:
+            await asyncio.sleep(0.5)
+            if guard:
+                stats = guard.stats()
+                print(f"  limit={stats['limit']:>6} in_flight={stats['in_flight']:>3} circuit={stats['circuit']}")
+
+    start = time.perf_counter()
+    outage_task = asyncio.create_task(outage())
+    monitor_task = asyncio.create_task(monitor())
+    await asyncio.gather(*(one() for _ in range(args.requests)))
+    elapsed = time.perf_counter() - start
+    monitor_task.cancel()
+    outage_task.cancel()
+    fake.outage = False
+    await client.close()
+
+    result = {
+        "mode": "guarded" if guard else "unguarded",
+        **outcomes,
+        "backend_requests": fake.stats["requests"] - before["requests"],
+        "backend_429": fake.stats["rejected"] - before["rejected"],
+        "elapsed_s": round(elapsed, 2),
+    }
+    print(result)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=600)
+    parser.add_argument("--concurrency", type=int, default=128)
+    parser.add_argument("--capacity", type=int, default=16, help="Concurrent requests the fake accepts before 429")
+    parser.add_argument("--latency-ms", type=float, default=100.0)
+    parser.add_argument("--outage-at-s", type=float, default=1.0)
+    parser.add_argument("--outage-s", type=float, default=1.5)
+    parser.add_argument("--attempts", type=int, default=8, help="Tries per request before giving up")
+    args = parser.parse_args()
+
+    fake = FakeOpenAI(latency_ms=args.latency_ms, capacity=args.capacity).start()
+    try:
+        asyncio.run(run(fake, args, guard=None))
+        guard = LLMGuard(
+            AdaptiveConcurrencyLimiter(initial_limit=args.concurrency, max_limit=args.concurrency,
+                                       latency_target_ms=args.latency_ms * 10, cooldown_s=args.latency_ms / 1000),
+            CircuitBreaker(failure_threshold=5, reset_timeout=0.5),
+        )
+        asyncio.run(run(fake, args, guard=guard))
+    finally:
+        fake.stop()
+
+
+if __name__ == "__main__":
+    main()
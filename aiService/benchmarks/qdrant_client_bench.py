@@ -0,0 +1,125 @@
+"""Compare RestQdrantClient (sync requests.Session) with AsyncRestQdrantClient against a local fake Qdrant.
+
+Usage (from aiService/):
+    uv run python -m benchmarks.qdrant_client_bench --queries 2000 --concurrency 64 --latency-ms 5
+"""
+import time
+import asyncio
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import numpy as np
+
+from benchmarks.fake_qdrant import FakeQdrant
+from class_mod.rest_qdrant import RestQdrantClient, AsyncRestQdrantClient
+
+COLLECTION = "BenchCollection"
+
+
+def summarize(name: str, latencies: List[float], elapsed: float) -> Dict:
+    latencies = sorted(latencies)
+
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+
+    result = {
+        "client": name,
+        "requests": len(latencies),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(pct(0.50), 2),
+        "p95_ms": round(pct(0.95), 2),
+        "p99_ms": round(pct(0.99), 2),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 2),
+    }
+    print(result)
+    return result
+
+
+def bench_sync(url: str, queries: np.ndarray, concurrency: int, top_k: int) -> Dict:
+    client = RestQdrantClient(url=url, timeout=30)
+
+    def one(vector):
+        start = time.perf_counter()
+        client.search(COLLECTION, vector.tolist(), limit=top_k, timeout=30)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(one, queries))
+    return summarize("RestQdrantClient (sync, threads)", latencies, time.perf_counter() - start)
+
+
+async def bench_async(url: str, queries: np.ndarray, concurrency: int, top_k: int, http2: bool) -> Dict:
+    client = AsyncRestQdrantClient(url=url, timeout=30, max_connections=concurrency,
+                                   max_keepalive_connections=concurrency, http2=http2)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(vector):
+        async with semaphore:
+            start = time.perf_counter()
+            await client.search(COLLECTION, vector.tolist(), limit=top_k, timeout=30)
+            return time.perf_counter() - start
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(one(vector) for vector in queries))
+    elapsed = time.perf_counter() - start
+    await client.aclose()
+    return summarize("AsyncRestQdrantClient", list(latencies), elapsed)
+
+
+async def bench_async_batch(url: str, queries: np.ndarray, concurrency: int, top_k: int, batch_size: int) -> Dict:
+    client = AsyncRestQdrantClient(url=url, timeout=30, max_connections=concurrency,
+                                   max_keepalive_connections=concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+    batches = [queries[i:i + batch_size] for i in range(0, len(queries), batch_size)]
+
+    async def one(batch):
+        async with semaphore:
+            start = time.perf_counter()
+            await client.search_batch(COLLECTION, [
+                {"vector": vector.tolist(), "limit": top_k, "with_payload": True} for vector in batch
+            ], timeout=30)
+            # Attribute the batch latency to every query it carried
+            return [time.perf_counter() - start] * len(batch)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(one(batch) for batch in batches))
+    elapsed = time.perf_counter() - start
+    await client.aclose()
+    return summarize(f"AsyncRestQdrantClient.search_batch (x{batch_size})", [l for r in results for l in r], elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--points", type=int, default=5000)
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=2.0, help="Simulated server-side latency per request")
+    parser.add_argument("--http2", action="store_true", help="Enable HTTP/2 on the async client (fake server speaks HTTP/1.1)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    fake = FakeQdrant(latency_ms=args.latency_ms).start()
+    collection = fake.create_collection(COLLECTION, args.dim)
+    collection.upsert([
+        {"id": i, "vector": vector, "payload": {"name": f"plan {i}"}}
+        for i, vector in enumerate(rng.standard_normal((args.points, args.dim)).astype(np.float32))
+    ])
+    queries = rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+    print(f"Fake Qdrant at {fake.url} with {args.points} points, {args.queries} queries, concurrency {args.concurrency}")
+
+    try:
+        bench_sync(fake.url, queries, args.concurrency, args.top_k)
+        asyncio.run(bench_async(fake.url, queries, args.concurrency, args.top_k, args.http2))
+        asyncio.run(bench_async_batch(fake.url, queries, args.concurrency, args.top_k, args.batch_size))
+    finally:
+        fake.stop()
+
+
+if __name__ == "__main__":
+    main()
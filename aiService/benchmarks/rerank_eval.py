@@ -0,0 +1,109 @@
+"""Offline recall/MRR of the vector order against the cross-encoder reranked order.
+
+Documents of the fixture are embedded into a temporary `LocalVectorIndex`, each query retrieves
+`--candidates` points and the cross-encoder re-scores them from the same context lines the
+prompt is built from. Reports recall@k and MRR for both orders and the latency the rerank stage
+adds, on a cold and on a warm score cache.
+
+Usage (from aiService/):
+    uv run python -m benchmarks.rerank_eval --candidates 20 --k 1 3 5
+    uv run python -m benchmarks.rerank_eval --model BAAI/bge-reranker-v2-m3 --fixture my_eval.json
+"""
+import os
+import json
+import time
+import argparse
+import tempfile
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from utils.context_builder import select_fields
+from utils.embedding_service import get_embedding_service
+from utils.local_index import LocalVectorIndex
+from utils.reranker import DEFAULT_RERANK_MODEL, CrossEncoderReranker
+
+DEFAULT_FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "retrieval_eval.json")
+
+
+def metrics(rankings: List[List[str]], relevant: List[Sequence[str]], ks: Sequence[int]) -> Dict:
+    result = {}
+    for k in ks:
+        result[f"recall@{k}"] = round(float(np.mean([
+            len(set(ranking[:k]) & set(wanted)) / len(wanted) for ranking, wanted in zip(rankings, relevant)
+        ])), 4)
+    reciprocal = []
+    for ranking, wanted in zip(rankings, relevant):
+        ranks = [i for i, point_id in enumerate(ranking) if point_id in wanted]
+        reciprocal.append(1 / (ranks[0] + 1) if ranks else 0.0)
+    result["mrr"] = round(float(np.mean(reciprocal)), 4)
+    return result
+
+
+def latency_summary(name: str, latencies: List[float]) -> Dict:
+    latencies = np.asarray(latencies) * 1000
+    return {
+        "pass": name,
+        "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 2),
+        "mean_ms": round(float(latencies.mean()), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixture", default=DEFAULT_FIXTURE,
+                        help="JSON with `documents` ({id, payload}) and `queries` ({query, relevant: [id, ...]})")
+    parser.add_argument("--candidates", type=int, default=20, help="Vector candidates handed to the reranker")
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 5])
+    parser.add_argument("--model", default=DEFAULT_RERANK_MODEL)
+    parser.add_argument("--device", default=None)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--max-length", type=int, default=512)
+    args = parser.parse_args()
+
+    with open(args.fixture, encoding="utf-8") as f:
+        fixture = json.load(f)
+    documents, queries = fixture["documents"], fixture["queries"]
+    texts = {str(doc["id"]): "\n".join(select_fields(doc["payload"])) for doc in documents}
+
+    embedder = get_embedding_service()
+    reranker = CrossEncoderReranker(args.model, device=args.device, max_length=args.max_length,
+                                    batch_size=args.batch_size, cache_entries=len(queries) * args.candidates)
+    print(f"{len(documents)} documents, {len(queries)} queries, {args.candidates} candidates, "
+          f"reranker {args.model} loaded in {reranker.load_time_s:.1f}s")
+    reranker.warmup()
+
+    with tempfile.TemporaryDirectory() as directory:
+        index = LocalVectorIndex(directory, dim=embedder.dimension, use_hnsw=False)
+        embeddings = embedder.encode(list(texts.values()))
+        index.upsert([
+            {"id": point_id, "vector": embedding, "payload": {}} for point_id, embedding in zip(texts, embeddings)
+        ])
+        query_embeddings = embedder.encode([query["query"] for query in queries])
+        candidates = [
+            [hit["id"] for hit in index.search(embedding, limit=args.candidates)]
+            for embedding in query_embeddings
+        ]
+
+    relevant = [[str(point_id) for point_id in query["relevant"]] for query in queries]
+    reranked, cold, warm = [], [], []
+    for query, ids in zip(queries, candidates):
+        docs = [texts[point_id] for point_id in ids]
+        start = time.perf_counter()
+        scores = reranker.score(query["query"], docs)
+        cold.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        reranker.score(query["query"], docs)
+        warm.append(time.perf_counter() - start)
+        order = sorted(range(len(ids)), key=lambda i: -scores[i])
+        reranked.append([ids[i] for i in order])
+
+    print({"order": "vector", **metrics(candidates, relevant, args.k)})
+    print({"order": "reranked", **metrics(reranked, relevant, args.k)})
+    print(latency_summary("rerank (cold cache)", cold))
+    print(latency_summary("rerank (warm cache)", warm))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+"""Load test the service end to end against local stand-ins, plus microbenchmarks of its hot paths.
+
+Starts `FakeOpenAI` (fixed latency plus an optional per-token decode speed) and `FakeQdrant`,
+seeds the RAG and search collections with the trips of `fixtures/retrieval_eval.json` through
+`DataImporter`, and serves `app` with uvicorn on a free local port. YouTube transcripts are
+generated locally, so no request leaves the machine.
+
+Each endpoint is then driven with `--requests` requests at `--concurrency`; the report has RPS,
+p50/p95/p99 and the per-stage breakdown from the Server-Timing header of every response (mean
+and p95 per stage). Microbenchmarks time `DataImporter.encode_text` (cold and cached), context
+building, and LLM JSON parsing (clean, and with the defects `loads_tolerant` repairs) plus the
+`PlanResponse` build.
+
+The embedding model is the real one (EMBEDDING_MODEL), so absolute numbers depend on the host;
+compare runs on the same machine. The plan cache is off unless `--plan-cache` is given, so every
+plan request goes through retrieval and the LLM.
+
+Usage (from aiService/):
+    uv run python -m benchmarks.service_bench --requests 200 --concurrency 16 --llm-latency-ms 300
+    uv run python -m benchmarks.service_bench --endpoints generateTripPlan --llm-tokens-per-s 40
+    uv run python -m benchmarks.service_bench --skip-load --micro-iterations 500
+"""
+import os
+import json
+import time
+import uuid
+import socket
+import asyncio
+import argparse
+import tempfile
+import threading
+from typing import Any, Callable, Dict, List
+
+import httpx
+import numpy as np
+
+from benchmarks.fake_openai import FakeOpenAI, default_responder
+from benchmarks.fake_qdrant import FakeQdrant
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "retrieval_eval.json")
+ENDPOINTS = ("generateTripPlan", "searchSimilar", "addYoutubeLink", "basicChat")
+CHAT_MESSAGES = [
+    "Hi!",
+    "Thank you so much",
+    "What is the best time of year to visit Chiang Mai?",
+    "How do I get from Bangkok to Pai and how long does it take?",
+    "Compare Krabi and Phuket for a family beach holiday, pros and cons",
+    "Do I need a permit to visit Doi Inthanon?",
+]
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    values = np.asarray(values) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(values, 50)), 2),
+        "p95_ms": round(float(np.percentile(values, 95)), 2),
+        "p99_ms": round(float(np.percentile(values, 99)), 2),
+        "mean_ms": round(float(values.mean()), 2),
+    }
+
+
+def parse_server_timing(header: str) -> Dict[str, float]:
+    """Stage -> milliseconds from a `stage;dur=12.3, other;dur=4.5` header"""
+    stages = {}
+    for item in filter(None, (part.strip() for part in header.split(","))):
+        name, _, params = item.partition(";")
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip() == "dur":
+                stages[name.strip()] = float(value)
+    return stages
+
+
+def plan_requests(documents: List[Dict]) -> List[Dict]:
+    """One PlanRequest body per fixture trip, so requests differ and are not coalesced"""
+    requests = []
+    for doc in documents:
+        payload = doc["payload"]
+        requests.append({
+            "start_place": payload["start_place"]["name"],
+            "destination": f"{payload['destination_place']['name']}, {payload['country']}",
+            "duration": payload["duration"],
+            "groupSize": 2,
+            "interests": [place["name"] for place in payload["visited_place"][:2]],
+            "trip_price": payload["budget"],
+            "transportPref": payload["transportation"],
+            "theme": payload["theme"],
+        })
+    return requests
+
+
+def fake_transcript(video_id: str, segments: int) -> List[Dict]:
+    sentences = [
+        "We start the morning at the night market before it closes",
+        "The songthaew to the temple costs about forty baht per person",
+        "From the viewpoint you can see the whole valley and the rice fields",
+        "Remember to bring a jacket because the summit is cold at sunrise",
+        "This noodle shop has been run by the same family for three generations",
+    ]
+    return [
+        {"text": f"{sentences[i % len(sentences)]} ({video_id} part {i})", "start": i * 4.0, "duration": 4.0}
+        for i in range(segments)
+    ]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def seed(importer, collection: str, documents: List[Dict]):
+    """Create a collection the way the service does and ingest the fixture trips into it"""
+    importer.create_collection(collection)
+    embeddings, sparse = importer.encode_for(collection, [doc["payload"]["plan_details"] for doc in documents])
+    importer.upsert_points(collection, [
+        importer.build_point(
+            collection, str(uuid.uuid5(uuid.NAMESPACE_URL, f"bench:{doc['id']}")),
+            {**doc["payload"], "ingested_at": time.time()}, embedding, sparse[i] if sparse else None,
+        )
+        for i, (doc, embedding) in enumerate(zip(documents, embeddings))
+    ])
+
+
+def request_factory(endpoint: str, documents: List[Dict]) -> Callable[[int], Dict[str, Any]]:
+    """i -> keyword arguments of httpx.AsyncClient.post for the i-th request to `endpoint`"""
+    if endpoint == "generateTripPlan":
+        bodies = plan_requests(documents)
+        return lambda i: {"url": "/v1/generateTripPlan", "json": bodies[i % len(bodies)]}
+    if endpoint == "searchSimilar":
+        names = [doc["payload"]["name"] for doc in documents]
+        return lambda i: {"url": "/v1/searchSimilar", "json": {"query_text": names[i % len(names)]}}
+    if endpoint == "addYoutubeLink":
+        # Unique ids: every request chunks, embeds and upserts a new transcript
+        run = uuid.uuid4().hex[:4]
+        return lambda i: {"url": "/v1/addYoutubeLink", "json": {"video_id": f"b{run}{i:06d}"}}
+    return lambda i: {"url": "/v1/basicChat", "json": {"message": CHAT_MESSAGES[i % len(CHAT_MESSAGES)]}}
+
+
+async def drive(base_url: str, endpoint: str, make_request: Callable[[int], Dict[str, Any]],
+                requests: int, concurrency: int, timeout: float) -> Dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, statuses, stages = [], {}, {}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        async def one(i: int):
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    response = await client.post(**make_request(i))
+                    status = str(response.status_code)
+                except httpx.HTTPError as e:
+                    response, status = None, type(e).__name__
+                latencies.append(time.perf_counter() - start)
+                statuses[status] = statuses.get(status, 0) + 1
+                if response is not None:
+                    for stage, ms in parse_server_timing(response.headers.get("Server-Timing", "")).items():
+                        stages.setdefault(stage, []).append(ms)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        elapsed = time.perf_counter() - start
+
+    result = {
+        "endpoint": endpoint,
+        "requests": requests,
+        "concurrency": concurrency,
+        "statuses": statuses,
+        "rps": round(requests / elapsed, 1),
+        **percentiles(latencies),
+    }
+    print(result)
+    for stage, values in sorted(stages.items(), key=lambda item: -sum(item[1])):
+        print(f"    {stage:<16} n={len(values):<5} mean={np.mean(values):9.2f} ms  p95={np.percentile(values, 95):9.2f} ms")
+    result["stages_ms"] = {
+        stage: {"mean": round(float(np.mean(values)), 2), "p95": round(float(np.percentile(values, 95)), 2)}
+        for stage, values in stages.items()
+    }
+    return result
+
+
+def micro(name: str, fn: Callable[[int], Any], iterations: int) -> Dict:
+    fn(0)
+    timings = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        fn(i)
+        timings.append(time.perf_counter() - start)
+    timings = np.asarray(timings) * 1e6
+    result = {
+        "benchmark": name,
+        "iterations": iterations,
+        "p50_us": round(float(np.percentile(timings, 50)), 1),
+        "p95_us": round(float(np.percentile(timings, 95)), 1),
+        "mean_us": round(float(timings.mean()), 1),
+    }
+    print(result)
+    return result
+
+
+def run_micro(app_module, documents: List[Dict], iterations: int) -> List[Dict]:
+    from interface import PlanRequest
+    from utils.json_repair import loads_tolerant
+
+    agent, importer = app_module.agent, app_module.data_importer
+    requests = [PlanRequest(**body) for body in plan_requests(documents)]
+    results = [{"payload": doc["payload"]} for doc in documents]
+    run = uuid.uuid4().hex[:8]
+
+    context_text, _ = agent.context_builder.build(results[:agent.top_k], requests[0])
+    prompt = agent.build_plan_prompt(requests[0], context_text)
+    clean = default_responder([{"role": "user", "content": prompt}], "fake-model")
+    # Prose and a code fence before an object with a trailing comma, cut off before its closing brace
+    messy = f"Here is your plan:\n```json\n{clean[:-1].rstrip()},\n"
+    data, _ = loads_tolerant(clean)
+
+    return [
+        micro("encode_text (cold)", lambda i: importer.encode_text(f"{documents[i % len(documents)]['payload']['name']} {run} {i}"), iterations),
+        micro("encode_text (cached)", lambda i: importer.encode_text(documents[0]["payload"]["name"]), iterations),
+        micro(f"context_build (top {agent.top_k})",
+              lambda i: agent.context_builder.build(results[:agent.top_k], requests[i % len(requests)]), iterations),
+        micro(f"context_build ({len(results)} results, budget cut)",
+              lambda i: agent.context_builder.build(results, requests[i % len(requests)]), iterations),
+        micro("json_parse (clean)", lambda i: loads_tolerant(clean), iterations),
+        micro("json_parse (repaired)", lambda i: loads_tolerant(messy), iterations),
+        micro("pydantic_build", lambda i: agent.build_plan_response(data, requests[0], [], prompt), iterations),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoints", nargs="+", choices=ENDPOINTS, default=list(ENDPOINTS))
+    parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--timeout", type=float, default=120.0, help="Client timeout per request (s)")
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0, help="Fake LLM time to first token")
+    parser.add_argument("--llm-tokens-per-s", type=float, default=None, help="Fake LLM decode speed (default: instant)")
+    parser.add_argument("--qdrant-latency-ms", type=float, default=2.0)
+    parser.add_argument("--transcript-segments", type=int, default=120, help="Segments per generated YouTube transcript")
+    parser.add_argument("--plan-cache", action="store_true", help="Keep the plan cache on (repeated plans hit it)")
+    parser.add_argument("--micro-iterations", type=int, default=200)
+    parser.add_argument("--skip-load", action="store_true")
+    parser.add_argument("--skip-micro", action="store_true")
+    parser.add_argument("--output", help="Also write the results as JSON to this file")
+    args = parser.parse_args()
+
+    with open(FIXTURE, encoding="utf-8") as f:
+        documents = json.load(f)["documents"]
+
+    fake_llm = FakeOpenAI(latency_ms=args.llm_latency_ms, tokens_per_s=args.llm_tokens_per_s).start()
+    fake_qdrant = FakeQdrant(latency_ms=args.qdrant_latency_ms).start()
+    workdir = tempfile.TemporaryDirectory()
+    # Set before the app is imported: its modules read the environment at import time
+    os.environ.update({
+        "SEALION_API": "fake",
+        "SEALION_BASE_URL": fake_llm.url,
+        "QDRANT_HOST": fake_qdrant.url,
+        "PLAN_CACHE_BACKEND": "memory" if args.plan_cache else "off",
+        "LOCAL_INDEX_DIR": "",
+        "YOUTUBE_INDEX_PATH": os.path.join(workdir.name, "youtube_index.sqlite3"),
+        "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+    })
+    import app as app_module
+    import uvicorn
+
+    app_module.data_importer.youtube_extractor.get_segments = lambda video_id: fake_transcript(video_id, args.transcript_segments)
+    for collection in {app_module.agent.collection_name, app_module.data_importer.collection_name}:
+        seed(app_module.data_importer, collection, documents)
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app_module.app, host="127.0.0.1", port=port, log_level="warning"))
+    server_thread = threading.Thread(target=server.run, daemon=True, name="uvicorn")
+    server_thread.start()
+    base_url = f"http://127.0.0.1:{port}"
+    report: Dict[str, Any] = {"load": [], "micro": []}
+    try:
+        deadline = time.time() + 300
+        while time.time() < deadline:
+            try:
+                if httpx.get(f"{base_url}/health", timeout=5).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.5)
+        else:
+            raise RuntimeError("Service did not become ready within 300 s")
+        print(f"Service at {base_url}, fake LLM at {fake_llm.url}, fake Qdrant at {fake_qdrant.url}, "
+              f"{len(documents)} trips seeded")
+
+        if not args.skip_load:
+            for endpoint in args.endpoints:
+                report["load"].append(asyncio.run(drive(
+                    base_url, endpoint, request_factory(endpoint, documents),
+                    args.requests, args.concurrency, args.timeout,
+                )))
+            print({"fake_llm": fake_llm.stats, "fake_qdrant_requests": fake_qdrant.request_count})
+        if not args.skip_micro:
+            report["micro"] = run_micro(app_module, documents, args.micro_iterations)
+    finally:
+        server.should_exit = True
+        server_thread.join(timeout=30)
+        fake_llm.stop()
+        fake_qdrant.stop()
+        workdir.cleanup()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,18 @@
 import os
+import random
+import logging
+import asyncio
 import requests
+import httpx
 from dotenv import load_dotenv
 
+from utils.llm_guard import remaining_time
+
 load_dotenv()
+logger = logging.getLogger(__name__)
 
 class RestQdrantClient:
     def __init__(self, url, api_key=None, verify=True, timeout=5):
-        print(f"this is url: {url}")
         if url is None:
             raise ValueError("Qdrant URL must not be None. Please set the QDRANT_HOST environment variable or provide a URL.")
         self.url = url.rstrip("/")
@@ -26,12 +32,14 @@ class RestQdrantClient:
         r = self.session.get(f"{self.url}/collections/{collection_name}", timeout=self.timeout)
         r.raise_for_status()
         return r.json()
-    def search(self, collection_name, query_vector, limit=10, with_payload=True,timeout=1):
+    def search(self, collection_name, query_vector, limit=10, with_payload=True,timeout=1, query_filter=None):
         payload = {
             "vector": query_vector,
             "limit": limit,
             "with_payload": with_payload
         }
+        if query_filter:
+            payload["filter"] = query_filter
         r = self.session.post(
             f"{self.url}/collections/{collection_name}/points/search",
             json=payload,
@@ -40,41 +48,203 @@ class RestQdrantClient:
         r.raise_for_status()
         return r.json()
 
+    def search_batch(self, collection_name, searches, timeout=1):
+        r = self.session.post(
+            f"{self.url}/collections/{collection_name}/points/search/batch",
+            json={"searches": searches},
+            timeout=timeout
+        )
+        r.raise_for_status()
+        return r.json().get("result", [])
+
+    def scroll(self, collection_name, limit=256, offset=None, with_payload=True, with_vector=False, scroll_filter=None):
+        payload = {
+            "limit": limit,
+            "with_payload": with_payload,
+            "with_vector": with_vector
+        }
+        if offset is not None:
+            payload["offset"] = offset
+        if scroll_filter:
+            payload["filter"] = scroll_filter
+        r = self.session.post(
+            f"{self.url}/collections/{collection_name}/points/scroll",
+            json=payload,
+            timeout=self.timeout
+        )
+        r.raise_for_status()
+        return r.json()
+
     def delete_collection(self, collection_name):
         r = self.session.delete(f"{self.url}/collections/{collection_name}", timeout=self.timeout)
         if r.status_code not in [200, 404]:  # 404 means collection didn't exist
             r.raise_for_status()
         return r.json() if r.text else {}
 
-    def create_collection(self, collection_name, vector_size, distance="Cosine"):
-        payload = {
-            "vectors": {
-                "size": vector_size,
-                "distance": distance.upper()  # "COSINE", "EUCLIDEAN", "DOT"
-            }
+    def create_collection(self, collection_name, vector_size, distance="Cosine", vector_name=None, sparse_vector_name=None):
+        vectors = {
+            "size": vector_size,
+            "distance": distance.upper()  # "COSINE", "EUCLIDEAN", "DOT"
         }
+        # A named dense vector (plus an optional named sparse one) instead of the single unnamed vector
+        payload = {"vectors": {vector_name: vectors} if vector_name else vectors}
+        if sparse_vector_name:
+            payload["sparse_vectors"] = {sparse_vector_name: {}}
         r = self.session.put(f"{self.url}/collections/{collection_name}", json=payload, timeout=self.timeout)
         r.raise_for_status()
         return r.json()
-    def recreate_collection(self, collection_name, vector_size, distance="Cosine"):
+    def recreate_collection(self, collection_name, vector_size, distance="Cosine", vector_name=None, sparse_vector_name=None):
         # Delete if exists
         self.delete_collection(collection_name)
         # Create new collection
-        return self.create_collection(collection_name, vector_size, distance)
-    def upsert(self, collection_name, points):
+        return self.create_collection(collection_name, vector_size, distance, vector_name, sparse_vector_name)
+    def create_payload_index(self, collection_name, field_name, field_schema):
+        """Index a payload field ("keyword", "integer", "float" or a full-text params dict); idempotent"""
+        r = self.session.put(
+            f"{self.url}/collections/{collection_name}/index",
+            params={"wait": "true"},
+            json={"field_name": field_name, "field_schema": field_schema},
+            timeout=self.timeout
+        )
+        r.raise_for_status()
+        return r.json()
+    def upsert(self, collection_name, points, wait=False):
         r = self.session.put(
             f"{self.url}/collections/{collection_name}/points",
+            params={"wait": str(wait).lower()},
             json={"points": points},
             timeout=self.timeout
         )
         r.raise_for_status()
         return r.json()
 
-# Example usage:
-client = RestQdrantClient(
-    url= os.getenv("QDRANT_HOST"),
-    api_key="YOUR_API_KEY",   # or None
-    verify=False              # only if needed
-)
 
-print(client.get_collections())
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+# Shortest timeout an attempt gets once the request deadline is (nearly) used up
+MIN_ATTEMPT_TIMEOUT = 0.05
+
+
+class AsyncRestQdrantClient:
+    """Non-blocking, connection-pooled Qdrant REST client for the async request path.
+
+    One instance keeps a pool of keep-alive (optionally HTTP/2) connections, retries
+    429/5xx responses and transport errors with jittered exponential backoff, and has
+    no side effects until the first request. Inside a request deadline (utils.llm_guard)
+    each attempt is limited to the time left, and no retry starts that cannot finish.
+    """
+    def __init__(self, url, api_key=None, verify=True, timeout=5, max_connections=100,
+                 max_keepalive_connections=20, keepalive_expiry=30.0, http2=False,
+                 max_retries=3, backoff_base=0.1):
+        if url is None:
+            raise ValueError("Qdrant URL must not be None. Please set the QDRANT_HOST environment variable or provide a URL.")
+        self.url = url.rstrip("/")
+        headers = {"Content-Type": "application/json"}
+        if api_key:
+            headers["api-key"] = api_key
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning("HTTP/2 requested for Qdrant but the 'h2' package is missing, using HTTP/1.1")
+                http2 = False
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.client = httpx.AsyncClient(
+            headers=headers,
+            verify=verify,
+            timeout=timeout,
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry,
+            ),
+        )
+
+    async def _request(self, method, path, retry_read_timeout=True, **kwargs):
+        timeout = kwargs.pop("timeout", self.timeout)
+        for attempt in range(self.max_retries + 1):
+            # Full jitter keeps a burst of failed callers from retrying in lockstep
+            delay = random.uniform(0, self.backoff_base * (2 ** attempt))
+            try:
+                r = await self.client.request(method, f"{self.url}{path}", timeout=self._attempt_timeout(timeout), **kwargs)
+            except httpx.TransportError as e:
+                # A read timeout means Qdrant has the request but is slow; asking again only adds load
+                if self._last_attempt(attempt, delay) or (isinstance(e, httpx.ReadTimeout) and not retry_read_timeout):
+                    raise
+            else:
+                if r.status_code not in RETRYABLE_STATUS or self._last_attempt(attempt, delay):
+                    r.raise_for_status()
+                    return r.json()
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _attempt_timeout(timeout):
+        remaining = remaining_time()
+        if remaining is None:
+            return timeout
+        remaining = max(remaining, MIN_ATTEMPT_TIMEOUT)
+        return remaining if timeout is None else min(timeout, remaining)
+
+    def _last_attempt(self, attempt, delay):
+        remaining = remaining_time()
+        return attempt == self.max_retries or (remaining is not None and remaining <= delay)
+
+    async def get_collections(self):
+        return await self._request("GET", "/collections")
+
+    async def get_collection(self, collection_name):
+        return await self._request("GET", f"/collections/{collection_name}")
+
+    async def search(self, collection_name, query_vector, limit=10, with_payload=True, timeout=1, query_filter=None):
+        payload = {
+            "vector": query_vector,
+            "limit": limit,
+            "with_payload": with_payload
+        }
+        if query_filter:
+            payload["filter"] = query_filter
+        return await self._request(
+            "POST",
+            f"/collections/{collection_name}/points/search",
+            retry_read_timeout=False,
+            json=payload,
+            timeout=timeout
+        )
+
+    async def search_batch(self, collection_name, searches, timeout=1):
+        """Run several searches in one round-trip; each item is a Qdrant search request body.
+        Returns one result list per search, in order. A read timeout is not retried."""
+        response = await self._request(
+            "POST",
+            f"/collections/{collection_name}/points/search/batch",
+            retry_read_timeout=False,
+            json={"searches": searches},
+            timeout=timeout
+        )
+        return response.get("result", [])
+
+    async def upsert(self, collection_name, points, wait=True):
+        return await self._request(
+            "PUT",
+            f"/collections/{collection_name}/points",
+            params={"wait": str(wait).lower()},
+            json={"points": points}
+        )
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+def build_async_qdrant_client_from_env(timeout=30) -> AsyncRestQdrantClient:
+    return AsyncRestQdrantClient(
+        url=os.getenv("QDRANT_HOST"),
+        api_key=os.getenv("QDRANT_API_KEY") or None,
+        timeout=timeout,
+        max_connections=int(os.getenv("QDRANT_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.getenv("QDRANT_MAX_KEEPALIVE", "20")),
+        keepalive_expiry=float(os.getenv("QDRANT_KEEPALIVE_EXPIRY", "30")),
+        http2=os.getenv("QDRANT_HTTP2", "false").lower() == "true",
+        max_retries=int(os.getenv("QDRANT_MAX_RETRIES", "3")),
+    )
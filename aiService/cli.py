@@ -0,0 +1,96 @@
+import os
+import logging
+import argparse
+
+from data_importer import DataImporter
+from class_mod.rest_qdrant import RestQdrantClient
+from utils.local_index import build_local_index_from_env
+from utils.youtube_ingest import build_youtube_ingestor_from_env, parse_video_ids, YoutubeIngestJob
+
+
+def ingest(args):
+    importer = DataImporter()
+    importer.bulk_insert(
+        path=args.path,
+        collection=args.collection,
+        max_batch_size=args.batch_size,
+        max_batch_tokens=args.batch_tokens,
+        upsert_batch_size=args.upsert_batch_size,
+        concurrency=args.concurrency,
+        checkpoint_path=args.checkpoint or f"{args.path}.checkpoint.json",
+    )
+
+
+def youtube(args):
+    video_ids = parse_video_ids("\n".join(args.video_ids))
+    for path in args.file or []:
+        with open(path, "r", encoding="utf-8") as f:
+            video_ids += [v for v in parse_video_ids(f.read()) if v not in video_ids]
+    if not video_ids:
+        raise SystemExit("No valid video ids given")
+
+    importer = DataImporter()
+    ingestor = build_youtube_ingestor_from_env(importer)
+    ingestor.fetch_workers = args.workers
+    ingestor.rate_limiter.rate = args.rate
+    job = YoutubeIngestJob(job_id="cli", total=len(video_ids))
+    ingestor.run(job, video_ids)
+    for video_id, error in job.errors.items():
+        print(f"  {video_id}: {error}")
+
+
+def create_collection(args):
+    DataImporter(collection_name=args.collection).create_collection()
+
+
+def sync_index(args):
+    local_index = build_local_index_from_env()
+    if local_index is None:
+        raise SystemExit("Set LOCAL_INDEX_DIR to enable the local index")
+    qdrant = RestQdrantClient(url=os.getenv("QDRANT_HOST"), api_key=os.getenv("QDRANT_API_KEY") or None, timeout=60)
+    local_index.sync_from_qdrant(qdrant, args.collection, full=args.full)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PAN-SEA AI service data tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = subparsers.add_parser("ingest", help="Bulk load DataInput records from JSONL or Parquet")
+    ingest_parser.add_argument("path", help="Input file (.jsonl or .parquet)")
+    ingest_parser.add_argument("--collection", default="TripPlanData")
+    ingest_parser.add_argument("--batch-size", type=int, default=64, help="Max texts per encode call")
+    ingest_parser.add_argument("--batch-tokens", type=int, default=16384, help="Max padded tokens per encode call")
+    ingest_parser.add_argument("--upsert-batch-size", type=int, default=256, help="Points per Qdrant upsert")
+    ingest_parser.add_argument("--concurrency", type=int, default=4, help="Parallel upsert requests")
+    ingest_parser.add_argument("--checkpoint", help="Checkpoint file (default: <path>.checkpoint.json)")
+    ingest_parser.set_defaults(func=ingest)
+
+    youtube_parser = subparsers.add_parser("youtube", help="Bulk ingest YouTube transcripts")
+    youtube_parser.add_argument("video_ids", nargs="*", help="Video ids or watch URLs")
+    youtube_parser.add_argument("--file", action="append", help="Playlist export (CSV, JSON list or one URL per line)")
+    youtube_parser.add_argument("--workers", type=int, default=8, help="Concurrent transcript fetches")
+    youtube_parser.add_argument("--rate", type=float, default=5.0, help="Max transcript requests per second")
+    youtube_parser.set_defaults(func=youtube)
+
+    collection_parser = subparsers.add_parser(
+        "create-collection", help="Create a hybrid collection (or index an existing one) with the payload indexes used by filtered retrieval"
+    )
+    collection_parser.add_argument("--collection", default="TripPlanData")
+    collection_parser.set_defaults(func=create_collection)
+
+    sync_parser = subparsers.add_parser("sync-index", help="Mirror a Qdrant collection into the local index (LOCAL_INDEX_DIR)")
+    sync_parser.add_argument("--collection", default="TripPlanData")
+    sync_parser.add_argument("--full", action="store_true", help="Full snapshot instead of an incremental sync")
+    sync_parser.set_defaults(func=sync_index)
+
+    args = parser.parse_args()
+    # Progress and job summaries are reported through logging
+    logging.basicConfig(
+        level=os.getenv("LOG_LEVEL", "INFO").upper(),
+        format="%(asctime)s %(levelname)s %(name)s %(message)s",
+    )
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
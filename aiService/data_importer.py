@@ -1,76 +1,160 @@
 import os
 from interface import DataInput
 from utils.youtube_extractor import YoutubeExtractor
-from sentence_transformers import SentenceTransformer
+from utils.embedding_service import get_embedding_service
+from utils.bulk_ingest import BulkIngestor
+from utils.chunker import chunk_transcript, TranscriptChunk
+from utils.single_flight import SyncSingleFlight
+from utils.retrieval import (
+    DENSE_VECTOR, PAYLOAD_INDEXES, SPARSE_VECTOR, collection_vectors, hybrid_searches, reciprocal_rank_fusion,
+    sparse_vector, split_hybrid_results,
+)
+from class_mod.rest_qdrant import RestQdrantClient
 from qdrant_client import QdrantClient
 from qdrant_client.models import Distance, VectorParams, PointStruct
-from typing import List, Dict, Optional, Union
+from typing import Any, List, Dict, Optional, Tuple, Union
 from qdrant_client import QdrantClient
 import uuid
+import time
+import logging
 from dotenv import load_dotenv
 
 load_dotenv()
+logger = logging.getLogger(__name__)
+
 class DataImporter:
     def __init__(self, qdrant_url: str = os.getenv("QDRANT_HOST"), collection_name: str = "demo_bge_m3"):
-        self.model = SentenceTransformer("BAAI/bge-m3")
+        self.embedder = get_embedding_service()
         # self.client = QdrantClient(url=qdrant_url)
         self.qdrant_url = qdrant_url
         self.client = None
         self.collection_name = collection_name
+        # Optional LocalVectorIndex used when Qdrant is unreachable; set by the app
+        self.local_index = None
         self.youtube_extractor = YoutubeExtractor()
+        self.youtube_chunk_tokens = int(os.getenv("YOUTUBE_CHUNK_TOKENS", "384"))
+        self.youtube_chunk_overlap = int(os.getenv("YOUTUBE_CHUNK_OVERLAP", "64"))
+        self.single_flight = SyncSingleFlight() if os.getenv("SINGLE_FLIGHT", "true").lower() == "true" else None
+        # Weight of the lexical rankings relative to the dense ones when fusing hybrid results
+        self.sparse_weight = float(os.getenv("HYBRID_SPARSE_WEIGHT", "1.0"))
+        # collection -> (dense vector name, sparse vector name); (None, None) for single unnamed vector collections
+        self._vector_names: Dict[str, Tuple[Optional[str], Optional[str]]] = {}
+        # collection -> monotonic time of the last failed lookup, so an unreachable Qdrant is not asked per point
+        self._vector_names_failed_at: Dict[str, float] = {}
         self._init_qdrant()
         
     def _init_qdrant(self):
         """Initialize Qdrant client with error handling"""
+        api_key = os.getenv("QDRANT_API_KEY") or None
         try:
-            self.client = QdrantClient(url=self.qdrant_url, timeout=15)
+            self.client = QdrantClient(url=self.qdrant_url, api_key=api_key, timeout=15)
+            # qdrant-client 1.6 has no sparse vector models, hybrid points go through the REST API
+            self.rest_client = RestQdrantClient(url=self.qdrant_url, api_key=api_key, timeout=30)
             self.qdrant_available = True
-            print(f"Successfully connected to Qdrant at {self.qdrant_url}")
+            logger.info("Connected to Qdrant at %s", self.qdrant_url)
         except Exception as e:
-            print(f"Warning: Could not connect to Qdrant: {e}")
-            print("Running in offline mode - vector operations will be disabled")
+            logger.warning("Could not connect to Qdrant: %s", e)
+            logger.warning("Running in offline mode - vector operations will be disabled")
             self.client = None
+            self.rest_client = None
             self.qdrant_available = False
-    def _create_collection(self):
+    def create_collection(self, collection: Optional[str] = None):
+        """Create the collection with a named dense vector and, when the encoder has a sparse head, a named
+        sparse vector, then make sure the payload fields used by filtered retrieval are indexed"""
+        collection = collection or self.collection_name
         try:
-            collections = self.client.get_collections()
-            if any(c['name'] == self.collection_name for c in collections['result']['collections']):
-                print(f"Collection '{self.collection_name}' already exists.")
-                return
-
-            self.client.recreate_collection(
-                collection_name=self.collection_name,
-                vectors_config=VectorParams(size=1024, distance=Distance.COSINE)
-            )
-            print(f"Collection '{self.collection_name}' created successfully")
+            collections = self.rest_client.get_collections()
+            if any(c['name'] == collection for c in collections['result']['collections']):
+                logger.info("Collection '%s' already exists", collection)
+            else:
+                self.rest_client.recreate_collection(
+                    collection,
+                    self.embedder.dimension,
+                    "Cosine",
+                    vector_name=DENSE_VECTOR,
+                    sparse_vector_name=SPARSE_VECTOR if self.embedder.sparse_enabled else None,
+                )
+                self._vector_names.pop(collection, None)
+                self._vector_names_failed_at.pop(collection, None)
+                logger.info("Collection '%s' created", collection)
+            self.create_payload_indexes(collection)
         except Exception as e:
-            print(f"Error creating collection: {e}")
+            logger.error("Error creating collection: %s", e)
+
+    def create_payload_indexes(self, collection: str):
+        # Creating an index that already exists is a no-op in Qdrant, so this is safe on existing collections
+        for field_name, field_schema in PAYLOAD_INDEXES.items():
+            self.rest_client.create_payload_index(collection, field_name, field_schema)
+        logger.info("Payload indexes ensured on '%s': %s", collection, ", ".join(PAYLOAD_INDEXES))
     
     def encode_text(self, texts: Union[str, List[str]]) -> List[List[float]]:
-        if isinstance(texts, str):
-            texts = [texts]
-        
-        embeddings = self.model.encode(texts, normalize_embeddings=True)
-        return embeddings.tolist()
+        return self.embedder.encode(texts)
+
+    def vector_names(self, collection: str) -> Tuple[Optional[str], Optional[str]]:
+        """Named dense/sparse vectors of a collection, looked up once. While Qdrant cannot be asked,
+        the collection is treated as a single unnamed vector and asked again after 30s."""
+        names = self._vector_names.get(collection)
+        if names is not None:
+            return names
+        if time.monotonic() - self._vector_names_failed_at.get(collection, -30.0) < 30.0:
+            return None, None
+        try:
+            names = self._vector_names[collection] = collection_vectors(self.rest_client.get_collection(collection))
+        except Exception as e:
+            logger.warning("Could not read the vector config of '%s', assuming a dense-only collection: %s", collection, e)
+            self._vector_names_failed_at[collection] = time.monotonic()
+            return None, None
+        return names
+
+    def uses_sparse(self, collection: str) -> bool:
+        return self.embedder.sparse_enabled and self.vector_names(collection)[1] is not None
+
+    def encode_for(self, collection: str, texts: List[str], batch_size: int = 32) -> Tuple[List[List[float]], Optional[List[Dict[int, float]]]]:
+        """Dense vectors, plus lexical weights from the same forward pass when the collection has a sparse vector"""
+        if self.uses_sparse(collection):
+            return self.embedder.encode_hybrid(texts, batch_size)
+        return self.embedder.encode(texts, batch_size), None
+
+    def build_point(self, collection: str, point_id: str, payload: Dict, embedding: List[float],
+                    sparse: Optional[Dict[int, float]] = None) -> Union[PointStruct, Dict[str, Any]]:
+        dense_name, sparse_name = self.vector_names(collection)
+        if dense_name is None:
+            return PointStruct(id=point_id, vector=embedding, payload=payload)
+        vector = {dense_name: embedding}
+        if sparse_name and sparse is not None:
+            vector[sparse_name] = sparse_vector(sparse)
+        return {"id": point_id, "vector": vector, "payload": payload}
+
+    def upsert_points(self, collection: str, points: List, wait: bool = True):
+        if self.vector_names(collection)[0] is None:
+            self.client.upsert(collection_name=collection, points=points, wait=wait)
+        else:
+            self.rest_client.upsert(collection, points, wait=wait)
     
-    def insert_directly(self, collection: str, data: DataInput) -> str:
-        point_id = str(uuid.uuid4())
-        embedding = self.encode_text(data.plan_details)[0]
-        payload = {
+    def build_payload(self, data: DataInput) -> Dict:
+        """Qdrant payload for a DataInput, with nested places as plain dicts"""
+        return {
             "source": data.source,
             "name": data.name,
-            "start_place": data.start_place,
-            "destination_place": data.destination_place,
+            "start_place": data.start_place.model_dump(),
+            "destination_place": data.destination_place.model_dump(),
             "country": data.country,
-            "visited_place": data.visited_place,
+            "visited_place": [place.model_dump() for place in data.visited_place],
             "duration": data.duration,
             "budget": data.budget,
             "transportation": data.transportation,
             "accommodation": data.accommodation,
             "safety": data.safety,
             "theme": data.theme,
-            "plan_details": data.plan_details
+            "plan_details": data.plan_details,
+            # Lets the local index pick up new points with an incremental sync
+            "ingested_at": time.time()
         }
+
+    def insert_directly(self, collection: str, data: DataInput) -> str:
+        point_id = str(uuid.uuid4())
+        embeddings, sparse = self.encode_for(collection, [data.plan_details])
+        payload = self.build_payload(data)
         # collections = self.client.get_collection(collection)
         # if not collections:
         #     print(f"Collection '{collection}' does not exist. Creating it now.")
@@ -79,32 +163,53 @@ class DataImporter:
         #         vectors_config=VectorParams(size=1024, distance=Distance.COSINE)
         #     )
         
-        self.client.upsert(
-            collection_name=collection,
-            points=[PointStruct(id=point_id, vector=embedding, payload=payload)]
+        self.upsert_points(
+            collection, [self.build_point(collection, point_id, payload, embeddings[0], sparse[0] if sparse else None)]
         )
-        print(f"Inserted text with ID: {point_id}")
+        logger.debug("Inserted text with ID: %s", point_id)
         return point_id
 
     
+    def bulk_insert(
+        self,
+        path: str,
+        collection: str,
+        max_batch_size: int = 64,
+        max_batch_tokens: int = 16384,
+        upsert_batch_size: int = 256,
+        concurrency: int = 4,
+        checkpoint_path: Optional[str] = None,
+    ) -> Dict:
+        """Ingest a JSONL/Parquet file of DataInput records; see utils.bulk_ingest.BulkIngestor"""
+        ingestor = BulkIngestor(
+            self,
+            collection=collection,
+            max_batch_size=max_batch_size,
+            max_batch_tokens=max_batch_tokens,
+            upsert_batch_size=upsert_batch_size,
+            concurrency=concurrency,
+            checkpoint_path=checkpoint_path,
+        )
+        return ingestor.run(path)
+
     def insert_text(self, text: str, metadata: Optional[Dict] = None, custom_id: Optional[str] = None) -> str:
         point_id = custom_id or str(uuid.uuid4())
-        embedding = self.encode_text(text)[0]
+        embeddings, sparse = self.encode_for(self.collection_name, [text])
         payload = {"text": text}
         
         if metadata:
             payload.update(metadata)
         
-        self.client.upsert(
-            collection_name=self.collection_name,
-            points=[{"id": point_id, "vector": embedding, "payload": payload}]
+        self.upsert_points(
+            self.collection_name,
+            [self.build_point(self.collection_name, point_id, payload, embeddings[0], sparse[0] if sparse else None)]
         )
         
-        print(f"Inserted text with ID: {point_id}")
+        logger.debug("Inserted text with ID: %s", point_id)
         return point_id
     
     def insert_texts(self, texts: List[str], metadata_list: Optional[List[Dict]] = None) -> List[str]:
-        embeddings = self.encode_text(texts)
+        embeddings, sparse = self.encode_for(self.collection_name, texts)
         point_ids = [str(uuid.uuid4()) for _ in texts]
         
         points = []
@@ -113,68 +218,135 @@ class DataImporter:
             if metadata_list and i < len(metadata_list):
                 payload.update(metadata_list[i])
             
-            points.append({"id": point_id, "vector": embedding, "payload": payload})
+            points.append(self.build_point(self.collection_name, point_id, payload, embedding, sparse[i] if sparse else None))
 
-        self.client.upsert(collection_name=self.collection_name, points=points)
-        print(f"Inserted {len(texts)} texts")
+        self.upsert_points(self.collection_name, points)
+        logger.info("Inserted %d texts", len(texts))
         return point_ids
     
-    def insert_from_youtube(self, video_id: str, metadata: Optional[Dict] = None) -> Optional[str]:
+    def insert_from_youtube(self, video_id: str, metadata: Optional[Dict] = None) -> Optional[List[str]]:
+        """Chunk the transcript into overlapping windows and store one point per chunk, grouped by video_id"""
         try:
-            # Extract text from YouTube (assuming your YoutubeExtractor has this method)
-            text = self.youtube_extractor.get_full_text(video_id)
-            if text:
-                video_metadata = {"source": "youtube", "video_id": video_id}
-                if metadata:
-                    video_metadata.update(metadata)
-                
-                return self.insert_text(text, video_metadata)
-            return None
+            segments = self.youtube_extractor.get_segments(video_id)
+            if not segments:
+                return None
+            chunks = chunk_transcript(
+                segments,
+                self.embedder.tokenizer,
+                max_tokens=self.youtube_chunk_tokens,
+                overlap_tokens=self.youtube_chunk_overlap,
+            )
+            return self.insert_transcript_chunks(video_id, chunks, metadata)
         except Exception as e:
-            print(f"Error extracting from YouTube: {e}")
+            logger.error("Error extracting from YouTube: %s", e)
             return None
-    
-    def search_similar(self, query: str, limit: int = 1) -> List[Dict]:
-        """Search with Qdrant availability check - always returns a list"""
+
+    def insert_transcript_chunks(self, video_id: str, chunks: List[TranscriptChunk], metadata: Optional[Dict] = None) -> List[str]:
+        embeddings, sparse = self.encode_for(self.collection_name, [chunk.text for chunk in chunks])
+        points = self.build_transcript_points(video_id, chunks, embeddings, metadata, sparse)
+        self.upsert_points(self.collection_name, points)
+        logger.info("Inserted %d transcript chunks for video %s", len(points), video_id)
+        return [self.transcript_point_id(video_id, chunk) for chunk in chunks]
+
+    @staticmethod
+    def transcript_point_id(video_id: str, chunk: TranscriptChunk) -> str:
+        # Deterministic ids so re-ingesting a video overwrites its chunks instead of duplicating them
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"youtube:{video_id}:{chunk.chunk_index}"))
+
+    def build_transcript_points(self, video_id: str, chunks: List[TranscriptChunk], embeddings: List[List[float]],
+                                metadata: Optional[Dict] = None,
+                                sparse: Optional[List[Dict[int, float]]] = None) -> List[Union[PointStruct, Dict[str, Any]]]:
+        points = []
+        for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
+            point_id = self.transcript_point_id(video_id, chunk)
+            payload = {
+                "text": chunk.text,
+                "source": "youtube",
+                "video_id": video_id,
+                "chunk_index": chunk.chunk_index,
+                "chunk_count": len(chunks),
+                "start": chunk.start,
+                "end": chunk.end,
+                "segment_url": f"https://www.youtube.com/watch?v={video_id}&t={int(chunk.start)}s",
+                "ingested_at": time.time(),
+            }
+            if metadata:
+                payload.update(metadata)
+            points.append(self.build_point(self.collection_name, point_id, payload, embedding, sparse[i] if sparse else None))
+        return points
+
+    def search_similar(self, query: str, limit: int = 1, collection: Optional[str] = None) -> List[Dict]:
+        """Search with Qdrant availability check - always returns a list.
+        Identical concurrent searches share one embedding and Qdrant call."""
+        collection = collection or self.collection_name
+        if self.single_flight is None:
+            return self._search_similar(query, limit, collection)
+        return self.single_flight.do(
+            ("search", collection, query, limit), lambda: self._search_similar(query, limit, collection)
+        )
+
+    def _search_similar(self, query: str, limit: int, collection: str) -> List[Dict]:
+        can_fall_back = self.local_index is not None and self.local_index.meta.get("collection") == collection
         if not self.qdrant_available or not self.client:
-            print("Warning: Qdrant not available, returning empty results")
+            if can_fall_back:
+                return self._format_results(self.local_index.search(self.encode_text(query)[0], limit))
+            logger.warning("Qdrant not available, returning empty results")
             return []
         
+        embeddings, sparse = self.encode_for(collection, [query])
+        query_embedding = embeddings[0]
         try:
-            query_embedding = self.encode_text(query)[0]
-            
+            results = self._search_qdrant(collection, query_embedding, sparse, limit, timeout=15)
+            logger.debug("Search results: %s", results)
+            return self._format_results(results)
+        except Exception as e:
+            if can_fall_back:
+                logger.warning("Qdrant search failed, using local index: %s", e)
+                return self._format_results(self.local_index.search(query_embedding, limit))
+            logger.error("Error searching: %s", e)
+            raise ValueError(f"Search failed: {str(e)}")
+
+    def _search_qdrant(self, collection: str, query_embedding: List[float], sparse: Optional[List[Dict[int, float]]],
+                       limit: int, timeout: int) -> List[Dict[str, Any]]:
+        """Points as REST dicts. Named-vector collections run the dense and the lexical search in one
+        batch request and fuse them with RRF; `score` is then the fused score."""
+        if self.vector_names(collection)[0] is None:
             results = self.client.search(
-                collection_name=self.collection_name,
+                collection_name=collection,
                 query_vector=query_embedding,
                 limit=limit,
-                timeout=15
+                timeout=timeout
             )
-            print(f"Search results: {results}")
-            return [
-                {
-                    "id": result['id'],
-                    "score": float(result['score']) if result['score'] else 0.0,
-                    "text": result['payload'].get("text", ""),
-                    "metadata": {k: v for k, v in result['payload'].items() if k != "text"}
-                }
-                for result in results['result']
-            ]
-        except Exception as e:
-            print(f"Error searching: {e}")
-            raise ValueError(f"Search failed: {str(e)}")
+            return [{"id": result.id, "score": result.score, "payload": result.payload} for result in results]
+        searches = hybrid_searches([query_embedding], sparse or [], limit)
+        result_lists = split_hybrid_results(self.rest_client.search_batch(collection, searches, timeout=timeout), 1)
+        weights = [1.0] + [self.sparse_weight] * (len(result_lists) - 1)
+        return reciprocal_rank_fusion(result_lists, limit=limit, weights=weights)
+
+    def _format_results(self, points) -> List[Dict]:
+        # Transcript chunks carry video_id/start/end/segment_url in metadata, pointing at the exact segment
+        return [
+            {
+                "id": str(point["id"]),
+                "score": float(point["score"]) if point["score"] else 0.0,
+                "text": (point["payload"] or {}).get("text", ""),
+                "metadata": {k: v for k, v in (point["payload"] or {}).items() if k != "text"}
+            }
+            for point in points
+        ]
 
-    def coldStartDatabase(self):
+    def coldStartDatabase(self) -> bool:
+        """Warm the Qdrant search path once at startup; returns whether it succeeded."""
+        if not self.qdrant_available or not self.client:
+            return False
         coldstart_texts = "I want to go to Chiang Mai"
         try:
-            query_embedding = self.encode_text(coldstart_texts)[0]
-            results = self.client.search(
-                collection_name=self.collection_name,
-                query_vector=query_embedding,
-                limit=1,
-                timeout=10
-            )
-            print(f"Cold start results: {results}")
+            embeddings, sparse = self.encode_for(self.collection_name, [coldstart_texts])
+            results = self._search_qdrant(self.collection_name, embeddings[0], sparse, limit=1, timeout=10)
+            logger.info("Cold start finished with %d result(s)", len(results))
+            return True
         except Exception as e:
-            print(f"finish cold start, with error: {e}")
+            logger.warning("Cold start finished with error: %s", e)
+            return False
 
         
\ No newline at end of file
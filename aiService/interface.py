@@ -17,6 +17,15 @@ class YoutubeLinkRequest(BaseModel):
 class YoutubeLinkResponse(BaseModel):
     message: str
     video_url: str
+
+class YoutubeBulkRequest(BaseModel):
+    video_ids: List[str] = Field(default_factory=list, description="Video ids or watch URLs")
+    playlist_export: Optional[str] = Field(None, description="Raw playlist export (CSV, JSON list or one URL per line)")
+
+class YoutubeBulkResponse(BaseModel):
+    job_id: str
+    status: str
+    total: int
     
 class Place(BaseModel):
     name: str
@@ -149,6 +158,16 @@ class PlanResponse(BaseModel):
     preparation: Optional[Preparation] = Field(None, description="Trip preparation details")
     meta: Dict[str, Any] = Field(default_factory=dict, description="Metadata")
 
+
+class PlanJobRequest(BaseModel):
+    plan: PlanRequest
+    webhook_url: Optional[str] = Field(None, description="URL that receives the finished job as a JSON POST")
+
+class PlanJobResponse(BaseModel):
+    job_id: str
+    status: str
+    coalesced: bool = Field(False, description="True when an identical in-flight job was reused")
+
     
 class ChatRequest(BaseModel):
     message: str
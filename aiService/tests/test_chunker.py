@@ -0,0 +1,81 @@
+import pytest
+
+from utils.chunker import chunk_transcript
+
+
+class WhitespaceTokenizer:
+    def __call__(self, texts, add_special_tokens=False):
+        return {"input_ids": [text.split() for text in texts]}
+
+
+def segments(*word_counts, duration: float = 2.0):
+    """Consecutive transcript segments, segment i holding `word_counts[i]` words tagged with i"""
+    return [
+        {"text": " ".join(f"s{i}w{j}" for j in range(count)), "start": i * duration, "duration": duration}
+        for i, count in enumerate(word_counts)
+    ]
+
+
+def segment_ids(chunk):
+    """Indices of the segments that make up a chunk"""
+    return sorted({int(word.split("w")[0][1:]) for word in chunk.text.split()})
+
+
+def test_windows_break_on_segment_boundaries_within_max_tokens():
+    chunks = chunk_transcript(segments(3, 3, 3, 3, 3), WhitespaceTokenizer(), max_tokens=7, overlap_tokens=0)
+    assert [segment_ids(chunk) for chunk in chunks] == [[0, 1], [2, 3], [4]]
+    assert [chunk.token_count for chunk in chunks] == [6, 6, 3]
+    assert [chunk.chunk_index for chunk in chunks] == [0, 1, 2]
+    # A window is filled exactly up to max_tokens
+    exact = chunk_transcript(segments(3, 4, 2), WhitespaceTokenizer(), max_tokens=7, overlap_tokens=0)
+    assert [segment_ids(chunk) for chunk in exact] == [[0, 1], [2]]
+
+
+def test_consecutive_windows_overlap_by_whole_segments():
+    chunks = chunk_transcript(segments(*[2] * 10), WhitespaceTokenizer(), max_tokens=8, overlap_tokens=4)
+    assert [segment_ids(chunk) for chunk in chunks] == [[0, 1, 2, 3], [2, 3, 4, 5], [4, 5, 6, 7], [6, 7, 8, 9]]
+    for previous, current in zip(chunks, chunks[1:]):
+        # Two shared segments of two words each: exactly the overlap budget
+        assert 2 * len(set(segment_ids(previous)) & set(segment_ids(current))) == 4
+
+
+def test_overlap_never_exceeds_its_budget():
+    # The last segment of the first window alone is larger than the overlap budget
+    chunks = chunk_transcript(segments(2, 5, 2), WhitespaceTokenizer(), max_tokens=7, overlap_tokens=4)
+    assert [segment_ids(chunk) for chunk in chunks] == [[0, 1], [2]]
+
+
+def test_windows_always_advance():
+    # Overlapping the whole previous window would repeat it forever
+    chunks = chunk_transcript(segments(3, 3, 3, 3), WhitespaceTokenizer(), max_tokens=6, overlap_tokens=5)
+    assert [segment_ids(chunk) for chunk in chunks] == [[0, 1], [1, 2], [2, 3]]
+
+
+def test_timestamps_span_the_first_to_the_last_segment():
+    transcript = [
+        {"text": "welcome to chiang mai", "start": 0.0, "duration": 3.5},
+        {"text": "first the old city", "start": 3.5, "duration": 4.0},
+        {"text": "then doi suthep", "start": 9.0},
+    ]
+    chunks = chunk_transcript(transcript, WhitespaceTokenizer(), max_tokens=8, overlap_tokens=0)
+    assert [(chunk.start, chunk.end) for chunk in chunks] == [(0.0, 7.5), (9.0, 9.0)]
+    assert chunks[0].text == "welcome to chiang mai first the old city"
+
+
+def test_segment_longer_than_max_tokens_becomes_its_own_chunk():
+    chunks = chunk_transcript(segments(2, 20, 2), WhitespaceTokenizer(), max_tokens=6, overlap_tokens=2)
+    assert [segment_ids(chunk) for chunk in chunks] == [[0], [1], [2]]
+    assert chunks[1].token_count == 20 and chunks[1].start == 2.0 and chunks[1].end == 4.0
+
+
+def test_blank_segments_are_skipped():
+    transcript = segments(2, 2) + [{"text": "  ", "start": 4.0, "duration": 1.0}, {"start": 5.0}]
+    chunks = chunk_transcript(transcript, WhitespaceTokenizer(), max_tokens=10, overlap_tokens=2)
+    assert len(chunks) == 1 and chunks[0].end == 4.0
+    assert chunk_transcript([], WhitespaceTokenizer()) == []
+    assert chunk_transcript([{"text": " ", "start": 0.0}], WhitespaceTokenizer()) == []
+
+
+def test_overlap_must_be_smaller_than_the_window():
+    with pytest.raises(ValueError):
+        chunk_transcript(segments(2), WhitespaceTokenizer(), max_tokens=4, overlap_tokens=4)
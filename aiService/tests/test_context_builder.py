@@ -0,0 +1,115 @@
+import re
+
+import pytest
+
+from interface import PlanRequest
+from utils.context_builder import (
+    DEFAULT_CONTEXT_TOKENS, MIN_PARTIAL_TOKENS, ContextBuilder, context_budget_for, payload_fields, select_fields,
+)
+
+
+class WhitespaceTokenizer:
+    """One token per whitespace-separated word, with the subset of the Hugging Face call signature the builder uses"""
+
+    def __call__(self, texts, add_special_tokens=False, return_offsets_mapping=False):
+        if isinstance(texts, str):
+            offsets = [match.span() for match in re.finditer(r"\S+", texts)]
+            return {"input_ids": list(range(len(offsets))), "offset_mapping": offsets}
+        return {"input_ids": [text.split() for text in texts]}
+
+
+def words(count: int, prefix: str = "w") -> str:
+    return " ".join(f"{prefix}{i}" for i in range(count))
+
+
+def result(name: str, text_words: int = 0) -> dict:
+    payload = {"name": name}
+    if text_words:
+        payload["text"] = words(text_words, prefix=name)
+    return {"id": name, "payload": payload}
+
+
+def tokens(text: str) -> int:
+    return len(text.split())
+
+
+def test_empty_input_builds_an_empty_context():
+    builder = ContextBuilder(WhitespaceTokenizer(), token_budget=100)
+    assert builder.build([]) == ("", 0)
+    # Results without any usable field add nothing either
+    assert builder.build([{"id": 1, "payload": {}}, {"id": 2}, {"id": 3, "payload": {"text": "  ", "budget": None}}]) == ("", 0)
+    assert builder.count_tokens([]) == []
+
+
+@pytest.mark.parametrize("budget", [20, 64, 150, 400])
+def test_context_stays_within_the_token_budget(budget):
+    builder = ContextBuilder(WhitespaceTokenizer(), token_budget=budget)
+    text, used = builder.build([result(f"place{i}", text_words=30) for i in range(20)])
+    assert used <= budget
+    # `used` also counts one separator per block or field, so it bounds the words in the text
+    assert tokens(text) <= used
+
+
+def test_whole_results_are_kept_in_rank_order():
+    builder = ContextBuilder(WhitespaceTokenizer(), token_budget=1000)
+    text, used = builder.build([result("first", 10), result("second", 10), result("third", 10)])
+    assert text.index("first") < text.index("second") < text.index("third")
+    # Each block is a name line and a text line, plus its separator
+    assert used == 3 * (11 + 1)
+
+
+def test_lower_ranked_results_are_dropped_first():
+    # Two whole results use 2 * 42 tokens and leave one short of MIN_PARTIAL_TOKENS for the third
+    builder = ContextBuilder(WhitespaceTokenizer(), token_budget=2 * 42 + MIN_PARTIAL_TOKENS)
+    text, _ = builder.build([result("first", 40), result("second", 40), result("third", 100), result("tiny")])
+    assert "first" in text and "second" in text
+    # Once a result does not fit, nothing ranked below it is added, even if it would fit
+    assert "third" not in text and "tiny" not in text
+
+
+def test_the_first_result_that_does_not_fit_is_truncated():
+    builder = ContextBuilder(WhitespaceTokenizer(), token_budget=41 + 70)
+    text, used = builder.build([result("first", 40), result("second", 200), result("third", 5)])
+    second = text.split("\n")[3:]
+    assert second[0] == "second"
+    # Cut at a word boundary and marked as truncated
+    assert second[1].startswith("second0 second1") and second[1].endswith("...")
+    assert re.fullmatch(r"(second\d+ )*second\d+\.\.\.", second[1])
+    assert "third" not in text and used <= 41 + 70
+
+
+def test_truncation_keeps_whole_fields_before_cutting_one():
+    builder = ContextBuilder(WhitespaceTokenizer(), token_budget=200)
+    payload = {"name": "Doi Suthep", "country": "Thailand", "duration": 2, "text": words(500)}
+    text, used = builder.build([{"id": 1, "payload": payload}])
+    lines = text.strip().split("\n")
+    assert lines[:3] == ["Doi Suthep", "Country: Thailand", "Duration: 2 days"]
+    assert lines[3].endswith("...") and used <= 200
+
+
+def test_duplicate_content_is_counted_once():
+    builder = ContextBuilder(WhitespaceTokenizer(), token_budget=1000)
+    text, _ = builder.build([result("same", 5), {"id": "copy", "payload": {"name": "same", "text": words(5, "same")}}])
+    assert text.count("same0") == 1
+
+
+def test_truncate_returns_short_text_unchanged():
+    builder = ContextBuilder(WhitespaceTokenizer())
+    assert builder.truncate("a few words", 10) == "a few words"
+    assert builder.truncate(words(20), 5) == "w0 w1 w2 w3 w4..."
+
+
+def test_fields_follow_the_request():
+    payload = {"name": "Pai", "budget": 3000, "accommodation": "Guesthouse", "theme": "Nature", "safety": "n/a"}
+    day_trip = PlanRequest(start_place="Chiang Mai", destination="Pai", duration=1)
+    assert select_fields(payload, day_trip) == ["Pai"]
+    assert "budget" not in payload_fields(day_trip)
+    full = PlanRequest(start_place="Chiang Mai", destination="Pai", duration=3, trip_price=5000, interests=["Hiking"])
+    assert select_fields(payload, full) == ["Pai", "Budget: 3000 THB", "Accommodation: Guesthouse", "Theme: Nature"]
+
+
+def test_context_budget_override(monkeypatch):
+    monkeypatch.delenv("RAG_CONTEXT_TOKENS", raising=False)
+    assert context_budget_for("unknown-model") == DEFAULT_CONTEXT_TOKENS
+    monkeypatch.setenv("RAG_CONTEXT_TOKENS", "2048")
+    assert context_budget_for("aisingapore/Llama-SEA-LION-v3-70B-IT") == 2048
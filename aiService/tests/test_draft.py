@@ -0,0 +1,36 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+# llm_caller pulls in the embedding service
+pytest.importorskip("torch")
+
+from interface import PlanRequest
+from utils.llm_caller import DraftUnavailableError, LLMCaller
+from utils.model_router import ModelRouter
+
+
+def caller_with(router: ModelRouter) -> SimpleNamespace:
+    async def prepare_rag(plan_request, collection_name):
+        raise AssertionError("no retrieval or generation without a fast model")
+
+    caller = SimpleNamespace(router=router, _prepare_rag=prepare_rag)
+    caller.drafts_enabled = LLMCaller.drafts_enabled.fget(caller)
+    return caller
+
+
+@pytest.mark.parametrize("router", [
+    ModelRouter("strong-70b", fast_model=None),
+    ModelRouter("strong-70b", fast_model="strong-70b"),
+])
+def test_no_draft_without_a_separate_fast_model(router):
+    caller = caller_with(router)
+    assert not caller.drafts_enabled
+    plan = PlanRequest(start_place="Bangkok", destination="Chiang Mai", duration=3)
+    with pytest.raises(DraftUnavailableError):
+        asyncio.run(LLMCaller.draft_with_rag(caller, plan))
+
+
+def test_drafts_enabled_with_a_fast_model():
+    assert caller_with(ModelRouter("strong-70b", fast_model="fast-9b")).drafts_enabled
@@ -0,0 +1,115 @@
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+from utils.embedding_batcher import EmbeddingBatcher
+
+
+class RecordingEncoder:
+    """Encodes a text as [len(text)] and records the batches it was called with."""
+
+    def __init__(self, gate: threading.Event = None):
+        self.batches = []
+        self.gate = gate
+
+    def __call__(self, texts, batch_size):
+        if self.gate is not None:
+            self.gate.wait(5)
+        self.batches.append(list(texts))
+        return np.array([[float(len(text))] for text in texts], dtype=np.float32)
+
+
+def word_lengths(texts):
+    return [len(text.split()) for text in texts]
+
+
+def test_concurrent_submits_share_a_batch():
+    encoder = RecordingEncoder()
+    batcher = EmbeddingBatcher(encoder, word_lengths, max_batch_size=4, max_wait_ms=1000)
+    try:
+        futures = [future for text in ("a", "bb", "ccc", "dddd") for future in batcher.submit([text])]
+        assert [future.result(5)[0] for future in futures] == [1.0, 2.0, 3.0, 4.0]
+    finally:
+        batcher.close()
+    # A full bucket flushes at once instead of waiting out max_wait_ms
+    assert encoder.batches == [["a", "bb", "ccc", "dddd"]]
+
+
+def test_partial_batch_flushes_after_max_wait():
+    encoder = RecordingEncoder()
+    batcher = EmbeddingBatcher(encoder, word_lengths, max_batch_size=32, max_wait_ms=5)
+    try:
+        (future,) = batcher.submit(["temples"])
+        assert future.result(5)[0] == 7.0
+    finally:
+        batcher.close()
+
+
+def test_lengths_are_bucketed_apart():
+    encoder = RecordingEncoder()
+    batcher = EmbeddingBatcher(encoder, word_lengths, max_batch_size=2, max_wait_ms=1000, bucket_edges=(4,))
+    try:
+        futures = batcher.submit(["short", "word " * 20, "tiny", "word " * 30])
+        for future in futures:
+            future.result(5)
+    finally:
+        batcher.close()
+    assert sorted(map(len, encoder.batches)) == [2, 2]
+    assert ["short", "tiny"] in encoder.batches
+
+
+def test_encode_error_fails_only_that_batch():
+    calls = []
+
+    def encode(texts, batch_size):
+        calls.append(texts)
+        if len(calls) == 1:
+            raise RuntimeError("CUDA out of memory")
+        return np.ones((len(texts), 1), dtype=np.float32)
+
+    batcher = EmbeddingBatcher(encode, word_lengths, max_batch_size=2, max_wait_ms=1000)
+    try:
+        failed = batcher.submit(["a", "b"])
+        with pytest.raises(RuntimeError):
+            failed[0].result(5)
+        assert [future.result(5)[0] for future in batcher.submit(["c", "d"])] == [1.0, 1.0]
+    finally:
+        batcher.close()
+
+
+def test_cancelled_caller_does_not_stop_the_worker():
+    gate = threading.Event()
+    encoder = RecordingEncoder(gate)
+    batcher = EmbeddingBatcher(encoder, word_lengths, max_batch_size=1, max_wait_ms=1000)
+
+    async def scenario():
+        # The first text holds the worker inside encode while the second one is cancelled in the queue
+        busy = batcher.submit(["busy"])[0]
+        (queued,) = batcher.submit(["cancelled"])
+        waiter = asyncio.ensure_future(asyncio.wrap_future(queued))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert queued.cancelled()
+        gate.set()
+        await asyncio.wrap_future(busy)
+        (after,) = batcher.submit(["after"])
+        return await asyncio.wait_for(asyncio.wrap_future(after), 5)
+
+    try:
+        assert asyncio.run(scenario())[0] == 5.0
+    finally:
+        gate.set()
+        batcher.close()
+    assert ["cancelled"] not in encoder.batches
+
+
+def test_close_flushes_queued_texts_and_rejects_new_ones():
+    batcher = EmbeddingBatcher(RecordingEncoder(), word_lengths, max_batch_size=32, max_wait_ms=10000)
+    futures = batcher.submit(["a", "b"])
+    batcher.close()
+    assert [future.result(0)[0] for future in futures] == [1.0, 1.0]
+    with pytest.raises(RuntimeError):
+        batcher.submit(["c"])
@@ -0,0 +1,101 @@
+import threading
+
+import numpy as np
+
+from utils.embedding_cache import EmbeddingCache
+
+
+def vector(seed: int, dim: int = 8) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+
+
+def test_memory_lru_evicts_least_recently_used():
+    cache = EmbeddingCache("model-a", memory_entries=2)
+    cache.put_many(["a", "b"], [vector(1), vector(2)])
+    cache.get_many(["a"])
+    cache.put_many(["c"], [vector(3)])
+
+    a, b, c = cache.get_many(["a", "b", "c"])
+    assert b is None and np.array_equal(a, vector(1)) and np.array_equal(c, vector(3))
+
+
+def test_namespace_separates_models():
+    first, second = EmbeddingCache("model-a"), EmbeddingCache("model-b|max_len=256")
+    assert first.key("temples") != second.key("temples")
+    assert first.key("temples") == EmbeddingCache("model-a").key("temples")
+
+
+def test_disk_layer_survives_a_restart(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    EmbeddingCache("model-a", path=path).put_many(["night market"], [vector(1)])
+
+    restarted = EmbeddingCache("model-a", path=path)
+    assert restarted.get_many(["night market"], memory_only=True) == [None]
+    (found,) = restarted.get_many(["night market"])
+    # Stored as float16 on disk
+    np.testing.assert_allclose(found, vector(1), atol=1e-2)
+    assert found.dtype == np.float32
+    assert restarted.stats()["disk_hits"] == 1
+
+
+def test_memory_only_probe_counts_no_misses():
+    cache = EmbeddingCache("model-a")
+    cache.put_many(["a"], [vector(1)])
+    cache.get_many(["a", "b"], memory_only=True)
+    assert cache.stats()["misses"] == 0 and cache.stats()["memory_hits"] == 0
+    cache.get_many(["a"], memory_only=True)
+    assert cache.stats()["memory_hits"] == 1
+
+
+def test_disk_eviction_trims_below_the_cap(tmp_path):
+    cache = EmbeddingCache("model-a", memory_entries=1, path=str(tmp_path / "embeddings.sqlite3"), max_disk_entries=10)
+    cache.put_many([f"text {i}" for i in range(11)], [vector(i) for i in range(11)])
+    assert cache.stats()["disk_size"] == 9
+
+
+def test_concurrent_readers_and_writers_see_whole_vectors(tmp_path):
+    cache = EmbeddingCache("model-a", memory_entries=16, path=str(tmp_path / "embeddings.sqlite3"))
+    texts = [f"text {i}" for i in range(64)]
+    errors = []
+
+    def writer(offset):
+        for i in range(offset, len(texts), 4):
+            cache.put_many([texts[i]], [vector(i)])
+
+    def reader():
+        for _ in range(50):
+            for i, found in enumerate(cache.get_many(texts)):
+                if found is not None and not np.allclose(found, vector(i), atol=1e-2):
+                    errors.append(i)
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(4)] + [threading.Thread(target=reader) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert all(found is not None for found in cache.get_many(texts))
+    assert cache.stats()["memory_size"] == 16
+
+
+def test_disk_row_count_ignores_rewrites(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    cache = EmbeddingCache("model-a", path=path, max_disk_entries=10)
+    cache.put_many(["a", "b", "a"], [vector(1), vector(2), vector(1)])
+    cache.put_many(["b", "c"], [vector(2), vector(3)])
+    assert cache.stats()["disk_size"] == 3
+    assert EmbeddingCache("model-a", path=path).stats()["disk_size"] == 3
+
+
+def test_batched_access_times_still_drive_disk_eviction(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    EmbeddingCache("model-a", path=path).put_many([f"text {i}" for i in range(10)], [vector(i) for i in range(10)])
+    cache = EmbeddingCache("model-a", memory_entries=1, path=path, max_disk_entries=10, touch_batch=1000)
+    # A disk hit on the oldest rows is buffered, not yet written
+    cache.get_many(["text 0", "text 1"])
+    cache.put_many(["new"], [vector(99)])
+    found = cache.get_many([f"text {i}" for i in range(10)] + ["new"])
+    # The two evicted rows are among the untouched ones
+    assert found[0] is not None and found[1] is not None and found[10] is not None
+    assert sum(vector is None for vector in found[2:10]) == 2
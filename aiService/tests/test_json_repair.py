@@ -0,0 +1,108 @@
+import asyncio
+import json
+
+import pytest
+
+from utils.json_repair import extract_json_object, loads_tolerant, repair_json
+
+
+def test_valid_json_is_not_marked_repaired():
+    assert loads_tolerant('{"title": "Chiang Mai", "days": [1, 2]}') == ({"title": "Chiang Mai", "days": [1, 2]}, False)
+
+
+def test_prose_and_markdown_fences_are_skipped():
+    text = 'Here is your plan:\n```json\n{"title": "Trip {1}", "days": [1]}\n```\nEnjoy!'
+    assert extract_json_object(text) == '{"title": "Trip {1}", "days": [1]}'
+    assert loads_tolerant(text)[0] == {"title": "Trip {1}", "days": [1]}
+
+
+def test_no_object_raises():
+    with pytest.raises(json.JSONDecodeError):
+        loads_tolerant("Sorry, I cannot plan this trip.")
+
+
+@pytest.mark.parametrize("text, expected", [
+    # Trailing commas
+    ('{"days": [1, 2,], "title": "Trip",}', {"days": [1, 2], "title": "Trip"}),
+    # Missing commas between values and members
+    ('{"days": [1 2 3] "title": "Trip" "ok": true}', {"days": [1, 2, 3], "title": "Trip", "ok": True}),
+    ('{"timeline": [{"day": 1} {"day": 2}]}', {"timeline": [{"day": 1}, {"day": 2}]}),
+    # Comments
+    ('{"a": 1, // the first day\n"b": /* inline */ 2}', {"a": 1, "b": 2}),
+    # Python literals
+    ('{"needed": False, "notes": None, "ok": True}', {"needed": False, "notes": None, "ok": True}),
+    # Raw control characters inside strings
+    ('{"overview": "Line one\nLine two\tend"}', {"overview": "Line one\nLine two\tend"}),
+    # Numbers with a trailing dot
+    ('{"total": 3300., "meals": 800.}', {"total": 3300.0, "meals": 800.0}),
+])
+def test_common_llm_defects_are_repaired(text, expected):
+    assert loads_tolerant(text) == (expected, True)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("{'title': 'Doi Suthep', 'days': ['one', 'two']}", {"title": "Doi Suthep", "days": ["one", "two"]}),
+    # An apostrophe only closes the string before a delimiter
+    ("{'notes': 'Thailand's oldest temple', 'cost': 30}", {"notes": "Thailand's oldest temple", "cost": 30}),
+    ("{'notes': 'it\\'s open', 'quote': 'say \"hi\"'}", {"notes": "it's open", "quote": 'say "hi"'}),
+    ('{"notes": "Thailand\'s oldest", \'cost\': 30}', {"notes": "Thailand's oldest", "cost": 30}),
+])
+def test_single_quoted_keys_and_strings(text, expected):
+    assert loads_tolerant(text) == (expected, True)
+
+
+def test_single_quoted_braces_do_not_end_the_object():
+    assert extract_json_object("{'title': 'Trip }'} trailing prose") == "{'title': 'Trip }'}"
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"title": "Chiang M', {"title": "Chiang M"}),
+    ('{"days": [{"day": 1, "activities": [{"t": "08:30"', {"days": [{"day": 1, "activities": [{"t": "08:30"}]}]}),
+    ('{"days": [1, 2,', {"days": [1, 2]}),
+    ('{"title": "Trip", "date":', {"title": "Trip", "date": None}),
+    ('{"title": "ends with \\', {"title": "ends with "}),
+    ("{'title': 'Chiang M", {"title": "Chiang M"}),
+])
+def test_truncated_responses_are_closed(text, expected):
+    assert loads_tolerant(text) == (expected, True)
+
+
+def test_repair_leaves_valid_json_unchanged():
+    text = '{"a": [1, 2.5, -3e2], "b": {"c": "x, y"}, "d": null}'
+    assert json.loads(repair_json(text)) == json.loads(text)
+
+
+def test_unrecoverable_text_raises_the_strict_error():
+    with pytest.raises(json.JSONDecodeError):
+        loads_tolerant('{"a": 1 : 2}')
+
+
+def test_invalid_section_is_re_requested_after_syntax_repair():
+    # llm_caller pulls in the embedding service
+    pytest.importorskip("torch")
+    from interface import PlanRequest
+    from utils.llm_caller import LLMCaller
+
+    prompts = []
+
+    async def complete(prompt, model=None):
+        prompts.append(prompt)
+        return "```json\n{'timeline': [{'day': 1, 'activities': [{'t': '08:30', 'detail': 'Doi Suthep'}]},]}\n```", 40
+
+    caller = LLMCaller.__new__(LLMCaller)
+    caller.section_retries = 1
+    caller.repair_stats = dict.fromkeys(
+        ("plans", "repaired", "section_retries", "sections_fixed", "sections_dropped", "failures", "tokens_saved"), 0
+    )
+    caller._complete = complete
+    # Trailing comma and a timeline entry without activities; budget is optional and unfixable
+    response = '{"tripOverview": "Temples and food", "trip_plan": {"timeline": [{"day": 1}], "budget": "cheap",}}'
+    plan = PlanRequest(start_place="Bangkok", destination="Chiang Mai", duration=1)
+
+    data = asyncio.run(caller.finalize_llm_json(response, 500, plan))
+
+    assert data["trip_plan"]["timeline"] == [{"day": 1, "activities": [{"t": "08:30", "detail": "Doi Suthep"}]}]
+    assert "budget" not in data["trip_plan"]
+    assert len(prompts) == 2 and any('"timeline" section' in prompt for prompt in prompts)
+    stats = caller.repair_stats
+    assert stats["repaired"] == 1 and stats["sections_fixed"] == 1 and stats["sections_dropped"] == 1
@@ -0,0 +1,117 @@
+import json
+import random
+
+import pytest
+
+from utils.json_stream import IncrementalJSONParser
+
+# Same paths the plan stream watches (utils.llm_caller.STREAMED_SECTIONS)
+SECTIONS = [
+    ("tripOverview",),
+    ("preparation",),
+    ("trip_plan", "timeline", "*"),
+    ("trip_plan", "spots", "*"),
+    ("trip_plan", "budget"),
+]
+
+PLAN = {
+    "tripOverview": "Temples, \"khao soi\" and {night} markets\nin Chiang Mai",
+    "preparation": {"overview": "Pack light", "items": [{"category": "Documents", "items": ["Passport"]}]},
+    "trip_plan": {
+        "title": "Chiang Mai [3 days]",
+        "timeline": [
+            {"day": 1, "activities": [{"t": "08:30", "detail": "Doi Suthep, then lunch"}]},
+            {"day": 2, "activities": [{"t": "09:00", "detail": "Cooking class \\ market"}]},
+        ],
+        "spots": [
+            {"name": "Wat Phra That Doi Suthep", "latitude": 18.8048, "longitude": 98.9216, "time": "08:30-11:00", "notes": "Dress modestly"},
+            {"name": "Warorot Market", "latitude": -1.5e1, "longitude": 0, "time": "16:00-18:00", "notes": "Street food"},
+        ],
+        "budget": {"transport": 500, "meals": 800.5, "total": None},
+        "permits": {"needed": False},
+    },
+}
+EXPECTED = [
+    (("tripOverview",), PLAN["tripOverview"]),
+    (("preparation",), PLAN["preparation"]),
+    (("trip_plan", "timeline", 0), PLAN["trip_plan"]["timeline"][0]),
+    (("trip_plan", "timeline", 1), PLAN["trip_plan"]["timeline"][1]),
+    (("trip_plan", "spots", 0), PLAN["trip_plan"]["spots"][0]),
+    (("trip_plan", "spots", 1), PLAN["trip_plan"]["spots"][1]),
+    (("trip_plan", "budget"), PLAN["trip_plan"]["budget"]),
+]
+DOCUMENT = "Here is your plan:\n```json\n" + json.dumps(PLAN, indent=2, ensure_ascii=False) + "\n```\nEnjoy {the} trip!"
+
+
+def feed_all(chunks, watched=SECTIONS):
+    parser = IncrementalJSONParser(watched)
+    completed = []
+    for chunk in chunks:
+        completed.extend(parser.feed(chunk))
+    return parser, completed
+
+
+def random_split(text: str, seed: int):
+    rng = random.Random(seed)
+    cuts = sorted(rng.sample(range(1, len(text)), rng.randint(1, 60)))
+    return [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_sections_arrive_in_order_for_any_chunking(seed):
+    parser, completed = feed_all(random_split(DOCUMENT, seed))
+    assert completed == EXPECTED
+    assert parser.done
+
+
+def test_one_character_at_a_time_and_all_at_once_agree():
+    assert feed_all(DOCUMENT)[1] == feed_all([DOCUMENT])[1] == EXPECTED
+
+
+def test_each_section_is_reported_as_soon_as_it_closes():
+    parser = IncrementalJSONParser(SECTIONS)
+    document = json.dumps(PLAN)
+    budget_end = document.index("}", document.index('"budget"')) + 1
+    before = parser.feed(document[:budget_end - 1])
+    assert [path for path, _ in before] == [path for path, _ in EXPECTED[:-1]]
+    assert parser.feed(document[budget_end - 1:budget_end]) == EXPECTED[-1:]
+    assert parser.feed(document[budget_end:]) == [] and parser.done
+
+
+def test_a_scalar_completes_only_at_its_delimiter():
+    parser = IncrementalJSONParser([("total",)])
+    assert parser.feed('{"total": 33') == []
+    assert parser.feed("00") == []
+    assert parser.feed("}") == [(("total",), 3300)]
+
+
+def test_text_after_the_root_object_is_ignored():
+    _, completed = feed_all(['{"tripOverview": "a"}', ' {"tripOverview": "b"}'])
+    assert completed == [(("tripOverview",), "a")]
+
+
+def test_malformed_section_is_skipped_and_later_ones_still_arrive():
+    document = '{"tripOverview": "ok", "trip_plan": {"timeline": [{"day": 1, "activities": [1 2]}, {"day": 2}], "budget": {"total": 1}}}'
+    _, completed = feed_all(random_split(document, 0))
+    assert completed == [
+        (("tripOverview",), "ok"),
+        (("trip_plan", "timeline", 1), {"day": 2}),
+        (("trip_plan", "budget"), {"total": 1}),
+    ]
+
+
+def test_plan_stream_emits_events_in_document_order():
+    # llm_caller pulls in the embedding service
+    pytest.importorskip("torch")
+    from utils.llm_caller import STREAMED_SECTIONS, LLMCaller
+
+    assert [tuple(path) for path in STREAMED_SECTIONS] == SECTIONS
+    caller = LLMCaller.__new__(LLMCaller)
+    events = []
+    parser = IncrementalJSONParser(STREAMED_SECTIONS)
+    for chunk in random_split(DOCUMENT, 7):
+        for path, value in parser.feed(chunk):
+            event = caller._section_event(path, value)
+            if event is not None:
+                events.append(event[0])
+    assert events == ["tripOverview", "preparation", "day", "day", "spot", "spot", "budget"]
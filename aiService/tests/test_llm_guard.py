@@ -0,0 +1,291 @@
+import time
+import asyncio
+
+import pytest
+
+from utils.llm_guard import (
+    AdaptiveConcurrencyLimiter,
+    CircuitBreaker,
+    CircuitOpenError,
+    DeadlineExceededError,
+    LLMGuard,
+    LLMUnavailableError,
+    deadline_scope,
+)
+
+
+class Overloaded(Exception):
+    status_code = 503
+
+
+def make_guard(limit: int = 4, failure_threshold: int = 1, reset_timeout: float = 0.05) -> LLMGuard:
+    return LLMGuard(
+        AdaptiveConcurrencyLimiter(initial_limit=limit, max_limit=limit, cooldown_s=0.0),
+        CircuitBreaker(failure_threshold=failure_threshold, reset_timeout=reset_timeout),
+    )
+
+
+async def fail(timeout):
+    raise Overloaded("upstream busy")
+
+
+async def ok(timeout):
+    return "ok"
+
+
+async def open_then_half_open(guard: LLMGuard):
+    with pytest.raises(LLMUnavailableError):
+        await guard.call(fail)
+    assert guard.breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        await guard.call(ok)
+    await asyncio.sleep(guard.breaker.reset_timeout)
+
+
+def test_half_open_probe_success_closes_the_circuit():
+    async def scenario():
+        guard = make_guard()
+        await open_then_half_open(guard)
+        assert await guard.call(ok) == "ok"
+        assert guard.breaker.state == "closed"
+        assert await guard.call(ok) == "ok"
+
+    asyncio.run(scenario())
+
+
+def test_half_open_probe_failure_reopens_the_circuit():
+    async def scenario():
+        guard = make_guard()
+        await open_then_half_open(guard)
+        with pytest.raises(LLMUnavailableError):
+            await guard.call(fail)
+        assert guard.breaker.state == "open"
+        with pytest.raises(CircuitOpenError, match="open"):
+            await guard.call(ok)
+
+    asyncio.run(scenario())
+
+
+def test_only_one_probe_while_half_open():
+    async def scenario():
+        guard = make_guard()
+        await open_then_half_open(guard)
+        release = asyncio.Event()
+
+        async def slow(timeout):
+            await release.wait()
+            return "probe"
+
+        probe = asyncio.create_task(guard.call(slow))
+        await asyncio.sleep(0)
+        with pytest.raises(CircuitOpenError, match="probing"):
+            await guard.call(ok)
+        release.set()
+        assert await probe == "probe"
+        assert guard.breaker.state == "closed"
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_half_open_probe_releases_the_probe():
+    async def scenario():
+        guard = make_guard()
+        await open_then_half_open(guard)
+
+        async def hang(timeout):
+            await asyncio.sleep(60)
+
+        probe = asyncio.create_task(guard.call(hang))
+        await asyncio.sleep(0.01)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        assert guard.limiter.in_flight == 0
+        # The next call becomes the probe instead of being rejected as "half-open and probing"
+        assert await guard.call(ok) == "ok"
+        assert guard.breaker.state == "closed"
+
+    asyncio.run(scenario())
+
+
+def test_non_overload_error_frees_the_probe_without_tripping():
+    async def scenario():
+        guard = make_guard()
+        await open_then_half_open(guard)
+
+        async def bad_request(timeout):
+            raise ValueError("bad prompt")
+
+        with pytest.raises(ValueError):
+            await guard.call(bad_request)
+        assert guard.breaker.state == "half_open"
+        assert await guard.call(ok) == "ok"
+        assert guard.breaker.state == "closed"
+
+    asyncio.run(scenario())
+
+
+def test_session_holds_the_slot_for_the_whole_block():
+    async def scenario():
+        guard = make_guard(limit=1)
+        entered = asyncio.Event()
+        release = asyncio.Event()
+
+        async def stream():
+            async with guard.session():
+                entered.set()
+                await release.wait()
+
+        first = asyncio.create_task(stream())
+        await entered.wait()
+        second = asyncio.create_task(guard.call(ok))
+        await asyncio.sleep(0.01)
+        assert not second.done() and guard.limiter.waiters == 1
+        release.set()
+        await first
+        assert await second == "ok"
+        assert guard.stats()["successes"] == 2
+
+    asyncio.run(scenario())
+
+
+def test_overload_inside_session_reaches_limiter_and_breaker():
+    async def scenario():
+        guard = make_guard(limit=8, failure_threshold=1)
+        with pytest.raises(LLMUnavailableError):
+            async with guard.session():
+                raise Overloaded("stream dropped")
+        assert guard.limiter.limit == 4
+        assert guard.breaker.state == "open"
+        assert guard.limiter.in_flight == 0
+
+    asyncio.run(scenario())
+
+
+def test_deadline_passed_before_the_call():
+    async def scenario():
+        guard = make_guard()
+        with deadline_scope(0.001):
+            time.sleep(0.01)
+            with pytest.raises(LLMUnavailableError, match="deadline"):
+                await guard.call(ok)
+        assert guard.stats()["deadline_exceeded"] == 1
+        assert guard.breaker.state == "closed"
+
+    asyncio.run(scenario())
+
+
+def test_limiter_backs_off_once_per_congestion_event():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=16, min_limit=2, cooldown_s=60)
+    limiter.on_overload()
+    limiter.on_overload()
+    assert limiter.limit == 8
+    limiter._last_decrease -= 60
+    limiter.on_overload()
+    limiter.cooldown_s = 0
+    for _ in range(5):
+        limiter.on_overload()
+    assert limiter.limit == 2
+
+
+def test_slow_success_counts_as_overload():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=10, latency_target_ms=100, cooldown_s=0)
+    limiter.on_success(0.5)
+    assert limiter.limit == 5
+
+
+def test_limiter_recovers_only_under_contention():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=4, max_limit=5)
+    limiter.on_success(0.01)
+    assert limiter.limit == 4
+    limiter.in_flight, limiter.waiters = 3, 1
+    # Additive increase: about one step per limit's worth of successes
+    for _ in range(4):
+        limiter.on_success(0.01)
+    assert 4.5 < limiter.limit < 5
+    limiter.on_success(0.01)
+    assert limiter.limit == 5
+    for _ in range(20):
+        limiter.on_success(0.01)
+    assert limiter.limit == 5
+
+
+def test_limiter_admits_waiters_after_backoff_and_recovery():
+    async def scenario():
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=4, max_limit=4, cooldown_s=0)
+        running = peak = 0
+
+        async def call(seconds, report=True):
+            nonlocal running, peak
+            async with limiter.slot():
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(seconds)
+                running -= 1
+            if report:
+                limiter.on_success(0.001)
+
+        limiter.on_overload()
+        await asyncio.gather(*(call(0.005, report=False) for _ in range(8)))
+        assert peak == 2
+        # Sustained fast successes under contention grow the limit back to the cap
+        peak = 0
+        await asyncio.gather(*(call(0.001) for _ in range(60)))
+        assert limiter.limit == 4 and peak <= 4 and limiter.in_flight == limiter.waiters == 0
+
+    asyncio.run(scenario())
+
+
+def test_limiter_rejects_beyond_max_waiters_and_on_deadline():
+    async def scenario():
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=1, max_waiters=1)
+        release = asyncio.Event()
+
+        async def hold():
+            async with limiter.slot():
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        with pytest.raises(DeadlineExceededError):
+            async with limiter.slot(deadline=time.monotonic() + 0.01):
+                pass
+        waiter = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        with pytest.raises(LLMUnavailableError, match="Too many"):
+            async with limiter.slot():
+                pass
+        release.set()
+        await asyncio.gather(holder, waiter)
+        assert limiter.in_flight == limiter.waiters == 0
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_passes_its_wakeup_on():
+    async def scenario(spins):
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=1, max_limit=1)
+        release = asyncio.Event()
+
+        async def hold():
+            async with limiter.slot():
+                await release.wait()
+
+        async def acquire():
+            async with limiter.slot():
+                return "slot"
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        cancelled, other = asyncio.create_task(acquire()), asyncio.create_task(acquire())
+        await asyncio.sleep(0.01)
+        release.set()
+        # Cancel at each point between the release's wake-up and the woken waiter running
+        for _ in range(spins):
+            await asyncio.sleep(0)
+        cancelled.cancel()
+        assert await asyncio.wait_for(other, 1) == "slot"
+        await holder
+
+    for spins in range(4):
+        asyncio.run(scenario(spins))
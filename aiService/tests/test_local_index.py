@@ -0,0 +1,142 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from interface import PlanRequest
+from utils import local_index as local_index_module
+from utils.local_index import LocalVectorIndex, matches_filter
+from utils.retrieval import build_search_filter
+
+BACKENDS = [
+    pytest.param(False, id="exact"),
+    pytest.param(True, id="hnsw", marks=pytest.mark.skipif(local_index_module.hnswlib is None, reason="hnswlib not installed")),
+]
+
+CHIANG_MAI = {"destination_place": {"name": "Chiang Mai Old City"}, "duration": 3, "budget": 9000}
+PHUKET = {"destination_place": {"name": "Phuket"}, "visited_place": [{"name": "Patong Beach"}], "duration": 4}
+TRANSCRIPT = {"text": "A vlog about night markets"}
+
+
+def vector(seed: int, dim: int = 8) -> list:
+    return np.random.default_rng(seed).standard_normal(dim).tolist()
+
+
+def plan(**overrides) -> PlanRequest:
+    return PlanRequest(**{"start_place": "Bangkok", "destination": "Chiang Mai", "duration": 3, **overrides})
+
+
+def test_filter_matches_like_the_qdrant_payload_indexes():
+    query_filter = build_search_filter(plan(trip_price=8000))
+    assert matches_filter(CHIANG_MAI, query_filter)
+    # Points without the structured fields are let through
+    assert matches_filter(TRANSCRIPT, query_filter)
+    assert not matches_filter(PHUKET, query_filter)
+    assert not matches_filter({**CHIANG_MAI, "duration": 9}, query_filter)
+    assert not matches_filter({**CHIANG_MAI, "budget": 10001}, query_filter)
+    # Nested array paths and every word of the text must match
+    assert matches_filter(PHUKET, build_search_filter(plan(destination="patong", duration=0)))
+    assert not matches_filter(PHUKET, build_search_filter(plan(destination="Patong Bay", duration=0)))
+    assert matches_filter(PHUKET, None)
+
+
+def test_filter_clauses():
+    payload = {"theme": "Adventure", "budget": 500, "tags": ["hiking", "food"]}
+    assert matches_filter(payload, {"must": {"key": "theme", "match": {"value": "Adventure"}}})
+    assert matches_filter(payload, {"should": [{"key": "tags", "match": {"any": ["food"]}}, {"is_empty": {"key": "x"}}]})
+    assert not matches_filter(payload, {"must_not": [{"key": "budget", "range": {"gt": 100, "lte": 500}}]})
+    assert not matches_filter({"budget": "cheap"}, {"must": [{"key": "budget", "range": {"lte": 500}}]})
+    with pytest.raises(ValueError):
+        matches_filter(payload, {"must": [{"key": "geo", "geo_radius": {}}]})
+
+
+def populated(tmp_path, use_hnsw: bool) -> LocalVectorIndex:
+    index = LocalVectorIndex(str(tmp_path), dim=8, use_hnsw=use_hnsw)
+    payloads = [CHIANG_MAI, PHUKET, TRANSCRIPT] * 20
+    index.upsert([{"id": i, "vector": vector(i), "payload": payload} for i, payload in enumerate(payloads)])
+    return index
+
+
+@pytest.mark.parametrize("use_hnsw", BACKENDS)
+def test_search_applies_the_request_filter(tmp_path, use_hnsw):
+    index = populated(tmp_path, use_hnsw)
+    query_filter = build_search_filter(plan())
+    results = index.search(vector(1), limit=10, query_filter=query_filter)
+    assert len(results) == 10
+    assert all(result["payload"] in (CHIANG_MAI, TRANSCRIPT) for result in results)
+    assert [result["score"] for result in results] == sorted((result["score"] for result in results), reverse=True)
+    # Phuket point 1 is the nearest one but filtered out
+    assert index.search(vector(1), limit=1)[0]["id"] == "1"
+    assert "1" not in [result["id"] for result in results]
+
+
+@pytest.mark.parametrize("use_hnsw", BACKENDS)
+def test_deleted_points_are_never_returned(tmp_path, use_hnsw):
+    index = populated(tmp_path, use_hnsw)
+    assert index.delete([1, 4, "missing"]) == 2
+    assert len(index) == 58 and index.count == 60
+    found = [result["id"] for result in index.search(vector(1), limit=60)]
+    assert len(found) == 58 and "1" not in found and "4" not in found
+    assert index.search(vector(1), limit=5, query_filter=build_search_filter(plan(destination="Phuket")))
+
+    # A deleted id can come back, and deletes survive a restart
+    index.upsert([{"id": 4, "vector": vector(4), "payload": PHUKET}])
+    index.save()
+    reopened = LocalVectorIndex(str(tmp_path), dim=8, use_hnsw=use_hnsw)
+    found = [result["id"] for result in reopened.search(vector(1), limit=60)]
+    assert len(reopened) == 59 and "1" not in found and "4" in found
+
+
+class StubQdrant:
+    """Scroll API over an in-memory collection; pages are `limit` points long"""
+
+    def __init__(self, points):
+        self.points = points
+
+    def scroll(self, collection_name, limit=256, offset=None, with_payload=True, with_vector=False, scroll_filter=None):
+        start = offset or 0
+        page = [
+            {"id": point["id"], **({"vector": point["vector"]} if with_vector else {}),
+             **({"payload": point["payload"]} if with_payload else {})}
+            for point in self.points[start:start + limit]
+        ]
+        next_offset = start + limit if start + limit < len(self.points) else None
+        return {"result": {"points": page, "next_page_offset": next_offset}}
+
+
+def test_sync_removes_points_deleted_in_qdrant(tmp_path):
+    qdrant = StubQdrant([{"id": i, "vector": vector(i), "payload": {"ingested_at": 1.0}} for i in range(5)])
+    index = LocalVectorIndex(str(tmp_path), dim=8, use_hnsw=False)
+    index.ID_SCROLL_PAGE = 2
+    assert index.sync_from_qdrant(qdrant, "TripPlanData", full=True) == 5
+
+    del qdrant.points[1:3]
+    index.sync_from_qdrant(qdrant, "TripPlanData")
+    assert len(index) == 3
+    assert sorted(result["id"] for result in index.search(vector(0), limit=10)) == ["0", "3", "4"]
+
+
+def test_local_backend_filters_and_falls_back(tmp_path):
+    # llm_caller pulls in the embedding service
+    pytest.importorskip("torch")
+    from utils.llm_caller import LLMCaller
+
+    caller = LLMCaller.__new__(LLMCaller)
+    caller.local_index = populated(tmp_path, use_hnsw=False)
+    caller.local_index.meta["collection"] = "TripPlanData"
+    caller.qdrant, caller.retrieval_backend = None, "local"
+    caller.top_k, caller.candidates_per_query = 3, 5
+    caller.search_filter, caller.duration_tolerance, caller.budget_slack = True, 2, 0.25
+
+    filtered = caller._local_search([vector(1)], plan())
+    assert all(result["payload"] in (CHIANG_MAI, TRANSCRIPT) for result in filtered[0])
+    # Without the transcripts nothing matches an unknown destination: below top_k, so the filter is dropped
+    caller.local_index.delete(range(2, 60, 3))
+    unmatched = caller._local_search([vector(1)], plan(destination="Atlantis", duration=0))
+    assert unmatched[0][0]["id"] == "1"
+    # Without Qdrant the local index serves retrieval even when RETRIEVAL_BACKEND=qdrant
+    caller.retrieval_backend = "qdrant"
+    caller.reranker, caller.sparse_weight = None, 1.0
+    caller.build_context = lambda results, plan_request: results
+    results = asyncio.run(caller.retrieve([vector(1)], "TripPlanData", plan()))
+    assert results and all(result["payload"] in (CHIANG_MAI, TRANSCRIPT) for result in results)
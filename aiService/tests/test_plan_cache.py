@@ -0,0 +1,44 @@
+import pytest
+
+from interface import PlanRequest
+from utils.plan_cache import CacheBackend, InMemoryCacheBackend, PlanCache, request_partition
+
+
+def plan(**overrides) -> PlanRequest:
+    fields = {"start_place": "Bangkok", "destination": "Chiang Mai", "duration": 3, "interests": ["Temples", "Food"]}
+    return PlanRequest(**{**fields, **overrides})
+
+
+def test_partition_ignores_case_spacing_and_interest_order():
+    assert request_partition(plan()) == request_partition(
+        plan(start_place=" bangkok", destination="CHIANG MAI", interests=["food", " temples "])
+    )
+
+
+@pytest.mark.parametrize("overrides", [
+    {"start_place": "Phuket"},
+    {"trip_price": 15000},
+    {"interests": ["Temples", "Hiking"]},
+    {"destination": "Chiang Rai"},
+    {"travelDates": "2025-12-24 to 2025-12-26"},
+    {"theme": "Adventure"},
+])
+def test_partition_separates_fields_embeddings_confuse(overrides):
+    assert request_partition(plan()) != request_partition(plan(**overrides))
+
+
+def test_cache_backend_is_abstract():
+    with pytest.raises(TypeError):
+        CacheBackend()
+
+
+def test_semantic_tier_never_serves_another_dates_or_theme_plan():
+    cache = PlanCache(InMemoryCacheBackend(), similarity_threshold=0.9)
+    embedding = [1.0, 0.0, 0.0]
+    cached = plan(travelDates="2025-12-24 to 2025-12-26", theme="Cultural")
+    cache.put(cached, embedding, {"trip_plan": {"date": "2025-12-24 to 2025-12-26"}})
+
+    assert cache.get_semantic(plan(travelDates="2026-03-01 to 2026-03-03", theme="Cultural"), embedding) is None
+    assert cache.get_semantic(plan(travelDates="2025-12-24 to 2025-12-26", theme="Adventure"), embedding) is None
+    # Only stay or transport preferences may differ on a semantic hit
+    assert cache.get_semantic(cached.model_copy(update={"stayPref": "Hostels"}), embedding) is not None
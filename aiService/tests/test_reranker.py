@@ -0,0 +1,67 @@
+import asyncio
+import threading
+import time
+
+from utils.reranker import CrossEncoderReranker
+
+
+class SlowModel:
+    """Cross-encoder stand-in: scores a pair by document length after `delay_s`."""
+
+    def __init__(self, delay_s: float):
+        self.delay_s = delay_s
+        self.passes = 0
+        self.running = self.max_running = 0
+        self._lock = threading.Lock()
+
+    def predict(self, pairs, batch_size=32, convert_to_numpy=True):
+        with self._lock:
+            self.passes += 1
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(self.delay_s)
+        with self._lock:
+            self.running -= 1
+        return [float(len(document)) for _, document in pairs]
+
+
+def make_reranker(delay_s: float, budget_ms: float) -> CrossEncoderReranker:
+    return CrossEncoderReranker("stand-in", budget_ms=budget_ms, model=SlowModel(delay_s))
+
+
+def test_rerank_orders_by_score():
+    reranker = make_reranker(0.0, budget_ms=1000)
+    order = asyncio.run(reranker.rerank("temples", ["a", "ccc", "bb"]))
+    assert [index for index, _ in order] == [1, 2, 0]
+
+
+def test_slow_scorer_builds_no_backlog():
+    async def scenario():
+        reranker = make_reranker(0.1, budget_ms=10)
+        results = []
+        for i in range(10):
+            results.append(await reranker.rerank(f"query {i}", ["doc a", "doc bb"]))
+        # Only the first call reached the model; the others skipped it while it was busy
+        assert results == [None] * 10
+        assert reranker.stats()["timeouts"] == 1 and reranker.stats()["skipped"] == 9
+        await asyncio.sleep(0.15)
+        assert reranker.model.passes == 1 and reranker.model.max_running == 1
+        # Once the pass is done the stage scores again, and the late pass filled the cache
+        reranker.budget_s = 1.0
+        assert await reranker.rerank("query 0", ["doc a", "doc bb"]) is not None
+        assert reranker.model.passes == 1
+
+    asyncio.run(scenario())
+
+
+def test_cached_pairs_are_served_while_busy():
+    async def scenario():
+        reranker = make_reranker(0.05, budget_ms=1000)
+        await reranker.rerank("temples", ["a", "bb"])
+        busy = asyncio.create_task(reranker.rerank("markets", ["ccc"]))
+        await asyncio.sleep(0.01)
+        assert [index for index, _ in await reranker.rerank("temples", ["a", "bb"])] == [1, 0]
+        assert await busy is not None
+        assert reranker.stats()["skipped"] == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,92 @@
+import asyncio
+
+import httpx
+import pytest
+
+from class_mod.rest_qdrant import AsyncRestQdrantClient
+from utils.llm_guard import deadline_scope
+
+
+class ScriptedQdrant:
+    """httpx transport that answers each request with the next scripted outcome and records the read timeouts"""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.read_timeouts = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.read_timeouts.append(request.extensions["timeout"]["read"])
+        outcome = self.outcomes.pop(0) if len(self.outcomes) > 1 else self.outcomes[0]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return httpx.Response(outcome, json={"result": [[{"id": 1, "score": 0.9}]]})
+
+
+def client_for(qdrant: ScriptedQdrant, **kwargs) -> AsyncRestQdrantClient:
+    client = AsyncRestQdrantClient("http://qdrant:6333", backoff_base=0.001, **kwargs)
+    client.client = httpx.AsyncClient(transport=httpx.MockTransport(qdrant))
+    return client
+
+
+def search_batch(client: AsyncRestQdrantClient, timeout: float = 30):
+    return client.search_batch("TripPlanData", [{"vector": [0.1], "limit": 5}], timeout=timeout)
+
+
+def test_search_read_timeout_is_not_retried():
+    qdrant = ScriptedQdrant(httpx.ReadTimeout("slow search"), 200)
+    with pytest.raises(httpx.ReadTimeout):
+        asyncio.run(search_batch(client_for(qdrant)))
+    assert len(qdrant.read_timeouts) == 1
+
+    qdrant = ScriptedQdrant(httpx.ReadTimeout("slow search"), 200)
+    with pytest.raises(httpx.ReadTimeout):
+        asyncio.run(client_for(qdrant).search("TripPlanData", [0.1], timeout=30))
+    assert len(qdrant.read_timeouts) == 1
+
+
+def test_connect_errors_and_overload_are_retried():
+    qdrant = ScriptedQdrant(httpx.ConnectError("refused"), 503, 200)
+    assert asyncio.run(search_batch(client_for(qdrant))) == [[{"id": 1, "score": 0.9}]]
+    assert len(qdrant.read_timeouts) == 3
+
+
+def test_other_calls_still_retry_read_timeouts():
+    qdrant = ScriptedQdrant(httpx.ReadTimeout("slow"), 200)
+    assert asyncio.run(client_for(qdrant).get_collection("TripPlanData"))["result"]
+    assert len(qdrant.read_timeouts) == 2
+
+
+def test_retries_stop_after_max_retries():
+    qdrant = ScriptedQdrant(503)
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(search_batch(client_for(qdrant, max_retries=2)))
+    assert len(qdrant.read_timeouts) == 3
+
+
+def test_attempts_are_limited_to_the_request_deadline():
+    qdrant = ScriptedQdrant(httpx.ConnectError("refused"), 200)
+
+    async def scenario():
+        with deadline_scope(2.0):
+            return await search_batch(client_for(qdrant))
+
+    asyncio.run(scenario())
+    assert len(qdrant.read_timeouts) == 2
+    assert all(timeout <= 2.0 for timeout in qdrant.read_timeouts)
+    # Without a deadline the caller's timeout applies
+    qdrant = ScriptedQdrant(200)
+    asyncio.run(search_batch(client_for(qdrant)))
+    assert qdrant.read_timeouts == [30]
+
+
+def test_no_retry_once_the_deadline_has_passed():
+    qdrant = ScriptedQdrant(httpx.ConnectError("refused"), 200)
+
+    async def scenario():
+        with deadline_scope(1e-6):
+            await asyncio.sleep(0.01)
+            return await search_batch(client_for(qdrant))
+
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(scenario())
+    assert len(qdrant.read_timeouts) == 1 and qdrant.read_timeouts[0] <= 0.05
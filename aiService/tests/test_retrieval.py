@@ -0,0 +1,168 @@
+import asyncio
+
+import pytest
+
+from interface import PlanRequest
+from utils.retrieval import (
+    DENSE_VECTOR, RRF_K, SPARSE_VECTOR, build_search_filter, collection_vectors, hybrid_searches,
+    reciprocal_rank_fusion, split_hybrid_results,
+)
+
+
+def point(point_id, score=0.5, **payload):
+    return {"id": point_id, "score": score, "payload": payload}
+
+
+def ids(results):
+    return [result["id"] for result in results]
+
+
+def test_rrf_sums_reciprocal_ranks_across_lists():
+    fused = reciprocal_rank_fusion([[point("a"), point("b")], [point("b"), point("c")]], limit=10)
+    assert ids(fused) == ["b", "a", "c"]
+    assert fused[0]["score"] == pytest.approx(1 / (RRF_K + 2) + 1 / (RRF_K + 1))
+    assert fused[1]["score"] == pytest.approx(1 / (RRF_K + 1))
+
+
+def test_rrf_ties_are_broken_by_the_best_raw_similarity():
+    # "a" and "b" both sit at rank 1 and rank 2 once, so only vector_score separates them
+    fused = reciprocal_rank_fusion([[point("a", 0.71), point("b", 0.70)], [point("b", 0.90), point("a", 0.60)]], limit=2)
+    assert ids(fused) == ["b", "a"]
+    assert fused[0]["score"] == pytest.approx(fused[1]["score"])
+    assert [result["vector_score"] for result in fused] == [0.90, 0.71]
+
+
+def test_rrf_full_ties_keep_first_seen_order():
+    fused = reciprocal_rank_fusion([[point("x")], [point("y")], [point("z")]], limit=3)
+    assert ids(fused) == ["x", "y", "z"]
+
+
+def test_rrf_limit_and_payload():
+    fused = reciprocal_rank_fusion([[point(i, name=f"place {i}") for i in range(5)]], limit=2)
+    assert ids(fused) == [0, 1] and fused[0]["payload"] == {"name": "place 0"}
+    assert reciprocal_rank_fusion([], limit=5) == []
+
+
+def test_rrf_k_controls_how_much_rank_matters():
+    # "top" leads one list; "steady" is second in both
+    lists = [[point("top"), point("steady")], [point("other"), point("steady")], [point("third"), point("top")]]
+    # A small k rewards a first place more than two second places
+    assert ids(reciprocal_rank_fusion(lists, limit=1, k=0)) == ["top"]
+    assert reciprocal_rank_fusion(lists, limit=4, k=0)[0]["score"] == pytest.approx(1 + 1 / 2)
+    # With the standard k the ranks are nearly flat and appearances count most
+    fused = reciprocal_rank_fusion(lists, limit=4)
+    assert ids(fused)[:2] == ["top", "steady"]
+    assert fused[1]["score"] == pytest.approx(2 / (RRF_K + 2))
+
+
+def test_rrf_weights_discount_lexical_rankings():
+    dense, sparse = [point("dense-1"), point("dense-2")], [point("sparse-1")]
+    assert ids(reciprocal_rank_fusion([dense, sparse], limit=3)) == ["dense-1", "sparse-1", "dense-2"]
+    fused = reciprocal_rank_fusion([dense, sparse], limit=3, weights=[1.0, 0.5])
+    assert ids(fused) == ["dense-1", "dense-2", "sparse-1"]
+    assert fused[2]["score"] == pytest.approx(0.5 / (RRF_K + 1))
+
+
+def test_hybrid_searches_put_dense_queries_before_sparse_ones():
+    query_filter = {"must": [{"key": "duration", "range": {"lte": 5}}]}
+    searches = hybrid_searches([[0.1, 0.2], [0.3, 0.4]], [{7: 0.5, 42: 0.25}], limit=20, query_filter=query_filter,
+                               with_payload={"include": ["name"]})
+    assert [search["vector"]["name"] for search in searches] == [DENSE_VECTOR, DENSE_VECTOR, SPARSE_VECTOR]
+    assert searches[2]["vector"]["vector"] == {"indices": [7, 42], "values": [0.5, 0.25]}
+    assert all(search["filter"] == query_filter and search["limit"] == 20 for search in searches)
+    assert "filter" not in hybrid_searches([[0.1]], [], limit=5)[0]
+
+
+def test_hybrid_merge_keeps_vector_score_a_cosine_similarity():
+    dense, sparse = [point("a", 0.82), point("b", 0.80)], [point("b", 14.2), point("c", 9.7)]
+    result_lists = split_hybrid_results([dense, sparse], dense_count=1)
+    assert result_lists[0] == dense
+    assert result_lists[1][0]["sparse_score"] == 14.2 and "score" not in result_lists[1][0]
+
+    fused = reciprocal_rank_fusion(result_lists, limit=3)
+    assert ids(fused) == ["b", "a", "c"]
+    # The lexical match score never leaks into vector_score
+    assert {result["id"]: result["vector_score"] for result in fused} == {"a": 0.82, "b": 0.80, "c": 0.0}
+
+
+@pytest.mark.parametrize("info, expected", [
+    ({"result": {"config": {"params": {"vectors": {"size": 1024, "distance": "Cosine"}}}}}, (None, None)),
+    ({"config": {"params": {"vectors": {DENSE_VECTOR: {"size": 1024}}}}}, (DENSE_VECTOR, None)),
+    ({"config": {"params": {"vectors": {DENSE_VECTOR: {"size": 1024}}, "sparse_vectors": {SPARSE_VECTOR: {}}}}},
+     (DENSE_VECTOR, SPARSE_VECTOR)),
+])
+def test_collection_vectors(info, expected):
+    assert collection_vectors(info) == expected
+
+
+def test_search_filter_conditions_let_points_without_the_field_through():
+    query_filter = build_search_filter(PlanRequest(start_place="Bangkok", destination="Chiang Mai, Thailand",
+                                                   duration=3, trip_price=10000))
+    location, duration, budget = query_filter["must"]
+    assert {"is_empty": {"key": "destination_place"}} in location["should"]
+    assert {"key": "country", "match": {"text": "Thailand"}} in location["should"]
+    assert duration["should"][0]["range"] == {"gte": 1, "lte": 5}
+    assert budget["should"][0]["range"] == {"lte": 12500}
+    assert build_search_filter(PlanRequest(start_place="Bangkok", destination=" ", duration=0)) is None
+
+
+class StubQdrant:
+    """Answers every search in a batch with the same points, fewer when a filter is set"""
+
+    def __init__(self, filtered_hits: int, unfiltered_hits: int = 10):
+        self.filtered_hits = filtered_hits
+        self.unfiltered_hits = unfiltered_hits
+        self.filters = []
+
+    async def search_batch(self, collection_name, searches, timeout=None):
+        query_filter = searches[0].get("filter")
+        self.filters.append(query_filter)
+        hits = self.filtered_hits if query_filter else self.unfiltered_hits
+        return [[point(f"p{i}", 1 - i / 100) for i in range(hits)] for _ in searches]
+
+
+def retrieval_caller(qdrant: StubQdrant, top_k: int = 5, search_filter: bool = True):
+    # llm_caller pulls in the embedding service
+    pytest.importorskip("torch")
+    from utils.llm_caller import LLMCaller
+
+    caller = LLMCaller.__new__(LLMCaller)
+    caller.qdrant = qdrant
+    caller.top_k = top_k
+    caller.candidates_per_query = 20
+    caller.search_filter = search_filter
+    caller.duration_tolerance, caller.budget_slack = 2, 0.25
+
+    async def vector_names(collection):
+        return DENSE_VECTOR, SPARSE_VECTOR
+
+    caller.vector_names = vector_names
+    return caller
+
+
+def filtered_search(caller, plan_request):
+    return asyncio.run(caller._filtered_search([[0.1, 0.2]], "travel", [{1: 0.5}], plan_request))
+
+
+PLAN = PlanRequest(start_place="Bangkok", destination="Chiang Mai", duration=3)
+
+
+@pytest.mark.parametrize("filtered_hits, fallback", [(4, True), (5, False), (8, False)])
+def test_unfiltered_fallback_fires_only_below_top_k(filtered_hits, fallback):
+    qdrant = StubQdrant(filtered_hits)
+    result_lists = filtered_search(retrieval_caller(qdrant, top_k=5), PLAN)
+    assert qdrant.filters[0] is not None
+    assert len(qdrant.filters) == (2 if fallback else 1)
+    if fallback:
+        assert qdrant.filters[1] is None and len(result_lists[0]) == 10
+    else:
+        assert len(result_lists[0]) == filtered_hits
+    # The dense and sparse rankings both come back, the sparse score moved aside
+    assert len(result_lists) == 2 and "sparse_score" in result_lists[1][0]
+
+
+def test_no_filter_without_a_plan_request_or_when_disabled():
+    qdrant = StubQdrant(filtered_hits=0)
+    filtered_search(retrieval_caller(qdrant), None)
+    filtered_search(retrieval_caller(qdrant, search_filter=False), PLAN)
+    assert qdrant.filters == [None, None]
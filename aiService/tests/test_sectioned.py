@@ -0,0 +1,72 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+# llm_caller pulls in the embedding service
+pytest.importorskip("torch")
+
+from interface import PlanRequest
+from utils.llm_caller import LLMCaller, day_ranges
+
+
+@pytest.mark.parametrize("duration, max_ranges, expected", [
+    (3, 14, [(1, 1), (2, 2), (3, 3)]),
+    (0, 14, [(1, 1)]),
+    (7, 3, [(1, 3), (4, 5), (6, 7)]),
+])
+def test_day_ranges(duration, max_ranges, expected):
+    assert day_ranges(duration, max_ranges) == expected
+
+
+def test_day_ranges_cover_long_trips_within_the_cap():
+    ranges = day_ranges(365, 14)
+    assert len(ranges) == 14 and ranges[0][0] == 1 and ranges[-1][1] == 365
+    assert all(previous[1] + 1 == current[0] for previous, current in zip(ranges, ranges[1:]))
+
+
+def sectioned_caller(max_day_prompts: int):
+    prompts = []
+
+    async def generate_section(semaphore, name, prompt, fields):
+        prompts.append(name)
+        if name == "overview":
+            return name, {"tripOverview": "Overview", "title": "Trip", "date": "2025-12-24"}
+        if name.startswith("day:"):
+            return name, {"activities": [{"t": "09:00", "detail": name}]}
+        if name.startswith("days:"):
+            first, last = map(int, name.split(":")[1].split("-"))
+            # Out-of-range days in an answer are ignored
+            days = range(first - 1, last + 2)
+            return name, {"timeline": [{"day": day, "activities": [{"t": "09:00", "detail": name}]} for day in days]}
+        return name, None
+
+    caller = SimpleNamespace(
+        section_concurrency=4,
+        section_max_day_prompts=max_day_prompts,
+        repair_stats={"plans": 0, "failures": 0, "sections_dropped": 0},
+        _plan_brief=lambda plan_request, context_text: "brief",
+        _day_focus=LLMCaller._day_focus,
+        _generate_section=generate_section,
+    )
+    caller.build_section_jobs = lambda plan_request, context_text: LLMCaller.build_section_jobs(caller, plan_request, context_text)
+    return caller, prompts
+
+
+def test_long_trip_fans_out_to_a_bounded_number_of_prompts():
+    caller, prompts = sectioned_caller(max_day_prompts=4)
+    plan = PlanRequest(start_place="Bangkok", destination="Thailand", duration=60, interests=["Temples"])
+    result = asyncio.run(LLMCaller.generate_sectioned(caller, plan, "context"))
+
+    assert len(prompts) == 4 + 4
+    assert [entry["day"] for entry in result["trip_plan"]["timeline"]] == list(range(1, 61))
+    assert result["trip_plan"]["timeline"][15]["activities"][0]["detail"] == "days:16-30"
+
+
+def test_short_trip_keeps_one_prompt_per_day():
+    caller, prompts = sectioned_caller(max_day_prompts=14)
+    plan = PlanRequest(start_place="Bangkok", destination="Chiang Mai", duration=3)
+    result = asyncio.run(LLMCaller.generate_sectioned(caller, plan, "context"))
+
+    assert sorted(name for name in prompts if name.startswith("day")) == ["day:1", "day:2", "day:3"]
+    assert [entry["day"] for entry in result["trip_plan"]["timeline"]] == [1, 2, 3]
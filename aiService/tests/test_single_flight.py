@@ -0,0 +1,127 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from utils.single_flight import SingleFlight, SyncSingleFlight
+
+
+class SlowCall:
+    """Counts executions and blocks each one until `release` is set."""
+
+    def __init__(self):
+        self.executions = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.executions += 1
+        await self.release.wait()
+        return {"execution": self.executions}
+
+
+def test_concurrent_callers_share_one_execution():
+    async def scenario():
+        flight, call = SingleFlight(), SlowCall()
+        tasks = [asyncio.create_task(flight.do("plan", call)) for _ in range(5)]
+        await asyncio.sleep(0)
+        call.release.set()
+        results = await asyncio.gather(*tasks)
+        assert call.executions == 1 and all(result is results[0] for result in results)
+        assert flight.stats() == {"calls": 5, "executions": 1, "saved": 4, "in_flight": 0}
+        # Nothing is cached once the call completes
+        await flight.do("plan", call)
+        assert call.executions == 2
+
+    asyncio.run(scenario())
+
+
+def test_error_reaches_every_caller():
+    async def scenario():
+        flight, release = SingleFlight(), asyncio.Event()
+
+        async def failing():
+            await release.wait()
+            raise ValueError("upstream failed")
+
+        tasks = [asyncio.create_task(flight.do("plan", failing)) for _ in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+        assert flight.stats()["in_flight"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_follower_leaves_the_call_running():
+    async def scenario():
+        flight, call = SingleFlight(), SlowCall()
+        leader = asyncio.create_task(flight.do("plan", call))
+        follower = asyncio.create_task(flight.do("plan", call))
+        other = asyncio.create_task(flight.do("plan", call))
+        await asyncio.sleep(0)
+        follower.cancel()
+        await asyncio.sleep(0)
+        call.release.set()
+        assert (await leader) == {"execution": 1} and (await other) == {"execution": 1}
+        assert follower.cancelled() and call.executions == 1
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_leader_hands_the_call_to_a_follower():
+    async def scenario():
+        flight, call = SingleFlight(), SlowCall()
+        leader = asyncio.create_task(flight.do("plan", call))
+        followers = [asyncio.create_task(flight.do("plan", call)) for _ in range(3)]
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0.01)
+        assert not any(follower.done() for follower in followers)
+        call.release.set()
+        results = await asyncio.gather(*followers)
+        assert leader.cancelled()
+        # One follower re-ran the call and the others joined it
+        assert call.executions == 2 and all(result == {"execution": 2} for result in results)
+        assert flight.stats() == {"calls": 4, "executions": 2, "saved": 2, "in_flight": 0}
+
+    asyncio.run(scenario())
+
+
+def test_sync_threads_share_one_execution():
+    flight, executions, results = SyncSingleFlight(), [], []
+    started = threading.Event()
+
+    def slow():
+        executions.append(1)
+        started.set()
+        time.sleep(0.2)
+        return object()
+
+    def caller():
+        results.append(flight.do("search", slow))
+
+    threads = [threading.Thread(target=caller) for _ in range(5)]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(executions) == 1 and all(result is results[0] for result in results)
+    assert flight.stats()["saved"] == 4
+
+
+def test_sync_error_is_not_cached():
+    flight, calls = SyncSingleFlight(), []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) == 1:
+            raise ConnectionError("qdrant unavailable")
+        return "ok"
+
+    with pytest.raises(ConnectionError):
+        flight.do("search", flaky)
+    assert flight.do("search", flaky) == "ok"
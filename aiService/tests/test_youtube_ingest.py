@@ -0,0 +1,121 @@
+import threading
+import time
+
+from utils.youtube_ingest import IngestedVideoIndex, YoutubeBulkIngestor, YoutubeIngestJob, parse_video_ids
+
+
+class WhitespaceTokenizer:
+    def __call__(self, texts, add_special_tokens=False):
+        return {"input_ids": [text.split() for text in texts]}
+
+
+class StandInImporter:
+    """Just the DataImporter surface the ingestor uses, recording encode and upsert calls."""
+
+    collection_name = "TripPlanData"
+    youtube_chunk_tokens = 8
+    youtube_chunk_overlap = 2
+
+    def __init__(self):
+        self.embedder = type("Embedder", (), {"tokenizer": WhitespaceTokenizer()})()
+        self.encode_calls = []
+        self.upserted = []
+
+    def encode_for(self, collection, texts):
+        self.encode_calls.append(len(texts))
+        return [[float(len(text))] for text in texts], None
+
+    def build_transcript_points(self, video_id, chunks, embeddings, sparse=None):
+        return [{"video_id": video_id, "chunk": chunk.chunk_index} for chunk in chunks]
+
+    def upsert_points(self, collection, points):
+        self.upserted.extend(points)
+
+
+class StandInTranscripts:
+    """Local stand-in for the transcript API: fixed transcripts, one flaky video, one missing one."""
+
+    def __init__(self, flaky_failures: int = 1):
+        self.calls = {}
+        self.flaky_failures = flaky_failures
+        self.in_flight = self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, video_id):
+        with self._lock:
+            self.calls[video_id] = self.calls.get(video_id, 0) + 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(0.01)
+            if video_id == "missing0000":
+                raise LookupError("no transcript")
+            if video_id == "flaky000000" and self.calls[video_id] <= self.flaky_failures:
+                raise ConnectionError("temporarily unavailable")
+            return [
+                {"text": f"{video_id} segment {i} about temples and night markets", "start": i * 5.0, "duration": 5.0}
+                for i in range(4)
+            ]
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+def make_ingestor(tmp_path, transcripts, **kwargs):
+    return YoutubeBulkIngestor(
+        StandInImporter(),
+        IngestedVideoIndex(str(tmp_path / "index" / "youtube_index.sqlite3")),
+        fetch_segments=transcripts,
+        requests_per_second=1000,
+        **kwargs,
+    )
+
+
+def test_parse_video_ids_accepts_urls_csv_and_json():
+    assert parse_video_ids("dQw4w9WgXcQ, https://youtu.be/abcdefghijk\nhttps://www.youtube.com/watch?v=dQw4w9WgXcQ") == [
+        "dQw4w9WgXcQ", "abcdefghijk",
+    ]
+    assert parse_video_ids('["https://youtube.com/shorts/abcdefghijk", "not-an-id"]') == ["abcdefghijk"]
+
+
+def test_bulk_ingest_retries_batches_and_reports_failures(tmp_path):
+    transcripts = StandInTranscripts()
+    ingestor = make_ingestor(tmp_path, transcripts, fetch_workers=3, embed_batch_chunks=1000)
+    video_ids = ["video000001", "video000002", "flaky000000", "missing0000"]
+    job = ingestor.run(YoutubeIngestJob(job_id="test", total=len(video_ids)), video_ids)
+
+    assert (job.status, job.ingested, job.failed, job.skipped) == ("completed", 3, 1, 0)
+    assert "missing0000" in job.errors and job.to_dict()["progress"] == 1.0
+    assert transcripts.calls["flaky000000"] == 2
+    assert 1 < transcripts.max_in_flight <= 3
+    # Chunks of every fetched video went through a single encode call
+    assert ingestor.importer.encode_calls == [job.chunks]
+    assert {point["video_id"] for point in ingestor.importer.upserted} == {"video000001", "video000002", "flaky000000"}
+
+
+def test_already_ingested_videos_are_skipped(tmp_path):
+    transcripts = StandInTranscripts()
+    make_ingestor(tmp_path, transcripts).run(YoutubeIngestJob(job_id="first", total=1), ["video000001"])
+    # A new ingestor over the same index file, as after a restart
+    ingestor = make_ingestor(tmp_path, transcripts)
+    job = ingestor.run(YoutubeIngestJob(job_id="second", total=2), ["video000001", "video000002"])
+
+    assert (job.skipped, job.ingested) == (1, 1)
+    assert transcripts.calls["video000001"] == 1
+
+
+def test_finished_jobs_are_bounded(tmp_path):
+    ingestor = make_ingestor(tmp_path, StandInTranscripts(), max_jobs=2)
+    jobs = []
+    for video_id in ("video000001", "video000002", "video000003"):
+        jobs.append(ingestor.start([video_id]))
+        for _ in range(200):
+            if jobs[-1].finished_at is not None:
+                break
+            time.sleep(0.01)
+    ingestor.start([])
+
+    assert ingestor.get_job(jobs[0].job_id) is None
+    assert ingestor.get_job(jobs[2].job_id).status == "completed"
+    ingestor.job_ttl = -1
+    assert ingestor.get_job(jobs[2].job_id) is None
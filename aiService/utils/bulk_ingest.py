@@ -0,0 +1,211 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+from pydantic import ValidationError
+from qdrant_client.models import PointStruct
+
+from interface import DataInput
+
+logger = logging.getLogger(__name__)
+
+# Fixed namespace so the same record always maps to the same point id, making re-runs idempotent
+POINT_NAMESPACE = uuid.UUID("6f1c2b7e-3a51-4c1e-9a0e-6f7d2c9b8a41")
+
+
+def point_id_for(data: DataInput) -> str:
+    digest = hashlib.sha1(data.plan_details.encode("utf-8")).hexdigest()
+    return str(uuid.uuid5(POINT_NAMESPACE, f"{data.source}|{data.name}|{digest}"))
+
+
+def read_records(path: str, skip: int = 0) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """Yield (record_number, raw_record) from a JSONL or Parquet file, skipping the first `skip` records."""
+    if path.endswith(".parquet"):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Reading Parquet requires pyarrow, install it with `uv add pyarrow`") from e
+        record_number = 0
+        for batch in pq.ParquetFile(path).iter_batches():
+            for record in batch.to_pylist():
+                if record_number >= skip:
+                    yield record_number, record
+                record_number += 1
+        return
+
+    with open(path, "r", encoding="utf-8") as f:
+        record_number = 0
+        for line in f:
+            if not line.strip():
+                continue
+            if record_number >= skip:
+                yield record_number, json.loads(line)
+            record_number += 1
+
+
+class BulkIngestor:
+    """Streams DataInput records into Qdrant with batched encodes and pipelined parallel upserts.
+
+    Records are read in windows; each window is encoded in token-budgeted batches while the
+    previous window's upserts are still in flight. A checkpoint is written after every fully
+    upserted window, so a crashed run resumes from the last committed record. Point ids are
+    derived from the record content, which makes replaying a partially committed window safe.
+    """
+
+    def __init__(
+        self,
+        importer,
+        collection: str,
+        max_batch_size: int = 64,
+        max_batch_tokens: int = 16384,
+        upsert_batch_size: int = 256,
+        concurrency: int = 4,
+        window_size: int = 2048,
+        checkpoint_path: Optional[str] = None,
+    ):
+        self.importer = importer
+        self.collection = collection
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.upsert_batch_size = upsert_batch_size
+        self.concurrency = concurrency
+        self.window_size = window_size
+        self.checkpoint_path = checkpoint_path
+        self.stats = {"records": 0, "failed": 0, "tokens": 0, "batches": 0, "upserts": 0}
+
+    def _load_checkpoint(self, path: str) -> int:
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return 0
+        with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+            checkpoint = json.load(f)
+        if checkpoint.get("path") != os.path.abspath(path) or checkpoint.get("collection") != self.collection:
+            logger.warning("Ignoring checkpoint %s: it belongs to a different input or collection", self.checkpoint_path)
+            return 0
+        return checkpoint.get("records_done", 0)
+
+    def _save_checkpoint(self, path: str, records_done: int):
+        if not self.checkpoint_path:
+            return
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "path": os.path.abspath(path),
+                "collection": self.collection,
+                "records_done": records_done,
+                "stats": self.stats,
+                "updated_at": time.time(),
+            }, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _token_counts(self, texts: List[str]) -> List[int]:
+        tokenizer = self.importer.embedder.tokenizer
+        encoded = tokenizer(
+            texts,
+            add_special_tokens=True,
+            truncation=True,
+            max_length=self.importer.embedder.max_seq_length,
+        )
+        return [len(ids) for ids in encoded["input_ids"]]
+
+    def _dynamic_batches(self, texts: List[str]) -> Iterator[List[int]]:
+        """Group text indices, shortest first, so each batch stays under the token budget."""
+        token_counts = self._token_counts(texts)
+        self.stats["tokens"] += sum(token_counts)
+        batch, batch_max_tokens = [], 0
+        for i in sorted(range(len(texts)), key=lambda i: token_counts[i]):
+            # Padded cost of a batch is its length times its longest member
+            padded_tokens = max(batch_max_tokens, token_counts[i]) * (len(batch) + 1)
+            if batch and (len(batch) >= self.max_batch_size or padded_tokens > self.max_batch_tokens):
+                yield batch
+                batch, batch_max_tokens = [], 0
+            batch.append(i)
+            batch_max_tokens = max(batch_max_tokens, token_counts[i])
+        if batch:
+            yield batch
+
+    def _encode_window(self, records: List[DataInput]) -> List[Union[PointStruct, Dict[str, Any]]]:
+        texts = [record.plan_details for record in records]
+        vectors: List[Optional[List[float]]] = [None] * len(texts)
+        # Lexical weights for hybrid collections, from the same forward pass as the dense vectors
+        weights: List[Optional[Dict[int, float]]] = [None] * len(texts)
+        for batch in self._dynamic_batches(texts):
+            embeddings, sparse = self.importer.encode_for(self.collection, [texts[i] for i in batch], batch_size=len(batch))
+            for j, (i, embedding) in enumerate(zip(batch, embeddings)):
+                vectors[i] = embedding
+                weights[i] = sparse[j] if sparse else None
+            self.stats["batches"] += 1
+        return [
+            self.importer.build_point(self.collection, point_id_for(record), self.importer.build_payload(record), vector, sparse)
+            for record, vector, sparse in zip(records, vectors, weights)
+        ]
+
+    def _upsert(self, points: List[Union[PointStruct, Dict[str, Any]]]):
+        self.importer.upsert_points(self.collection, points, wait=True)
+
+    def _submit_window(self, executor: ThreadPoolExecutor, points: List[Union[PointStruct, Dict[str, Any]]]) -> List[Future]:
+        return [
+            executor.submit(self._upsert, points[i:i + self.upsert_batch_size])
+            for i in range(0, len(points), self.upsert_batch_size)
+        ]
+
+    def _windows(self, path: str, skip: int) -> Iterator[Tuple[int, List[DataInput]]]:
+        """Yield (next_record_number, valid_records) per window."""
+        window, next_record = [], skip
+        for record_number, raw in read_records(path, skip=skip):
+            next_record = record_number + 1
+            try:
+                window.append(DataInput.model_validate(raw))
+            except ValidationError as e:
+                self.stats["failed"] += 1
+                logger.warning("Skipping invalid record %s: %s", record_number, e.errors()[0]["msg"])
+            if len(window) >= self.window_size:
+                yield next_record, window
+                window = []
+        if window:
+            yield next_record, window
+        elif next_record > skip:
+            yield next_record, []
+
+    def run(self, path: str) -> Dict[str, Any]:
+        skip = self._load_checkpoint(path)
+        if skip:
+            logger.info("Resuming %s from record %s", path, skip)
+        start = time.perf_counter()
+        pending: List[Future] = []
+        pending_done = skip
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="qdrant-upsert") as executor:
+            for records_done, records in self._windows(path, skip):
+                points = self._encode_window(records) if records else []
+                # Commit the previous window before queueing this one, so at most two windows are in flight
+                for future in pending:
+                    future.result()
+                    self.stats["upserts"] += 1
+                self._save_checkpoint(path, pending_done)
+                pending = self._submit_window(executor, points)
+                pending_done = records_done
+                self.stats["records"] += len(records)
+                self._report(start)
+
+            for future in pending:
+                future.result()
+                self.stats["upserts"] += 1
+            self._save_checkpoint(path, pending_done)
+
+        return self._report(start, final=True)
+
+    def _report(self, start: float, final: bool = False) -> Dict[str, Any]:
+        elapsed = max(time.perf_counter() - start, 1e-9)
+        report = {
+            **self.stats,
+            "elapsed_s": round(elapsed, 2),
+            "docs_per_s": round(self.stats["records"] / elapsed, 1),
+            "tokens_per_s": round(self.stats["tokens"] / elapsed, 1),
+        }
+        logger.info("Bulk ingest %s: %s", "finished" if final else "progress", report)
+        return report
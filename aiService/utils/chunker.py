@@ -0,0 +1,57 @@
+from dataclasses import dataclass
+from typing import Dict, List
+
+
+@dataclass
+class TranscriptChunk:
+    chunk_index: int
+    text: str
+    start: float
+    end: float
+    token_count: int
+
+
+def chunk_transcript(segments: List[Dict], tokenizer, max_tokens: int = 384, overlap_tokens: int = 64) -> List[TranscriptChunk]:
+    """Group transcript segments into token-bounded windows that overlap by roughly `overlap_tokens`.
+
+    Windows always break on segment boundaries so every chunk keeps the start time of its first
+    segment and the end time of its last one. A single segment longer than `max_tokens` becomes
+    its own chunk (the encoder truncates it).
+    """
+    if overlap_tokens >= max_tokens:
+        raise ValueError("overlap_tokens must be smaller than max_tokens")
+    segments = [s for s in segments if s.get("text", "").strip()]
+    if not segments:
+        return []
+
+    token_counts = [
+        len(ids) for ids in tokenizer([s["text"] for s in segments], add_special_tokens=False)["input_ids"]
+    ]
+
+    chunks = []
+    first = 0
+    while first < len(segments):
+        last, total = first, token_counts[first]
+        while last + 1 < len(segments) and total + token_counts[last + 1] <= max_tokens:
+            last += 1
+            total += token_counts[last]
+
+        window = segments[first:last + 1]
+        chunks.append(TranscriptChunk(
+            chunk_index=len(chunks),
+            text=" ".join(s["text"].strip() for s in window),
+            start=float(window[0]["start"]),
+            end=float(window[-1]["start"]) + float(window[-1].get("duration", 0.0)),
+            token_count=total,
+        ))
+        if last + 1 >= len(segments):
+            break
+
+        # Step back from the end of this window until the overlap budget is used up,
+        # but always advance by at least one segment
+        next_first, overlap = last + 1, 0
+        while next_first - 1 > first and overlap + token_counts[next_first - 1] <= overlap_tokens:
+            next_first -= 1
+            overlap += token_counts[next_first]
+        first = next_first
+    return chunks
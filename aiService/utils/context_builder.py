@@ -0,0 +1,194 @@
+import os
+import re
+import hashlib
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from interface import PlanRequest
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Context tokens per generation model; RAG_CONTEXT_TOKENS overrides the default
+CONTEXT_TOKEN_BUDGETS = {
+    "aisingapore/Llama-SEA-LION-v3-70B-IT": 1024,
+}
+DEFAULT_CONTEXT_TOKENS = 1024
+# A partially fitting result is only included if at least this many tokens of it fit
+MIN_PARTIAL_TOKENS = 48
+
+
+def context_budget_for(model: str) -> int:
+    override = os.getenv("RAG_CONTEXT_TOKENS")
+    if override:
+        return int(override)
+    return CONTEXT_TOKEN_BUDGETS.get(model, DEFAULT_CONTEXT_TOKENS)
+
+
+def load_context_tokenizer(fallback):
+    """Tokenizer used for context budgeting.
+
+    CONTEXT_TOKENIZER names the generation model's tokenizer for exact counts; otherwise the
+    already loaded embedding tokenizer is used, which counts within a few percent for the
+    languages in the collection.
+    """
+    name = os.getenv("CONTEXT_TOKENIZER")
+    if name:
+        try:
+            from transformers import AutoTokenizer
+            return AutoTokenizer.from_pretrained(name)
+        except Exception as e:
+            logger.warning("Could not load context tokenizer '%s', using the embedding tokenizer: %s", name, e)
+    return fallback
+
+
+def _present(value: Any) -> bool:
+    return value not in (None, "", [], {}) and str(value).strip().lower() not in ("", "none", "null", "n/a")
+
+
+def _wanted(plan_request: Optional[PlanRequest]) -> Tuple[bool, bool, bool]:
+    """Whether the budget, accommodation and theme fields are relevant to the request"""
+    wants_budget = plan_request is None or bool(plan_request.trip_price or plan_request.budgetTier)
+    wants_stay = plan_request is None or bool(plan_request.stayPref or (plan_request.duration or 1) > 1)
+    wants_theme = plan_request is None or bool(plan_request.theme or plan_request.interests)
+    return wants_budget, wants_stay, wants_theme
+
+
+def payload_fields(plan_request: Optional[PlanRequest] = None) -> List[str]:
+    """Payload keys that select_fields() (and the retrieved item names) read for this request,
+    so searches only ask Qdrant for those"""
+    wants_budget, wants_stay, wants_theme = _wanted(plan_request)
+    fields = ["name", "place_name", "start_place", "destination_place", "country", "visited_place",
+              "duration", "transportation", "safety", "plan_details", "text"]
+    if wants_budget:
+        fields.append("budget")
+    if wants_stay:
+        fields.append("accommodation")
+    if wants_theme:
+        fields.append("theme")
+    return fields
+
+
+def select_fields(payload: Dict[str, Any], plan_request: Optional[PlanRequest] = None) -> List[str]:
+    """Context lines for one retrieved point, skipping empty values and fields the request does not need.
+
+    Budget figures are only included when the request has a budget, accommodation only when
+    the trip spans a night or a stay preference is given, and themes only when the request
+    has a theme or interests.
+    """
+    wants_budget, wants_stay, wants_theme = _wanted(plan_request)
+
+    fields = []
+    if _present(payload.get("name")):
+        fields.append(str(payload["name"]))
+    for key, label in (("start_place", "Start"), ("destination_place", "Destination")):
+        place = payload.get(key)
+        if isinstance(place, dict) and _present(place.get("name")):
+            fields.append(f"{label}: {place['name']}")
+    if _present(payload.get("country")):
+        fields.append(f"Country: {payload['country']}")
+    if isinstance(payload.get("visited_place"), list) and payload["visited_place"]:
+        fields.append("Visited: " + ", ".join(
+            f"{p.get('name', '')} (lat: {p.get('latitude', '')}, lon: {p.get('longitude', '')})"
+            for p in payload["visited_place"] if isinstance(p, dict)
+        ))
+    if _present(payload.get("duration")):
+        fields.append(f"Duration: {payload['duration']} days")
+    if wants_budget and _present(payload.get("budget")):
+        fields.append(f"Budget: {payload['budget']} THB")
+    if _present(payload.get("transportation")):
+        fields.append(f"Transportation: {payload['transportation']}")
+    if wants_stay and _present(payload.get("accommodation")):
+        fields.append(f"Accommodation: {payload['accommodation']}")
+    if _present(payload.get("safety")):
+        fields.append(f"Safety: {payload['safety']}")
+    if wants_theme and _present(payload.get("theme")):
+        fields.append(f"Theme: {payload['theme']}")
+    if _present(payload.get("plan_details")):
+        fields.append(f"Plan details: {payload['plan_details']}")
+    if _present(payload.get("text")):
+        fields.append(str(payload["text"]))
+    return fields
+
+
+class ContextBuilder:
+    """Assembles the RAG context for the LLM within a token budget.
+
+    Results are taken in rank order, exact duplicates (same content under a different id,
+    e.g. re-ingested documents) are skipped, and whole results are added while they fit.
+    The first result that does not fit is cut at a field boundary, and a long trailing
+    field at a word boundary, instead of mid-field.
+    """
+
+    def __init__(self, tokenizer, token_budget: int = DEFAULT_CONTEXT_TOKENS):
+        self.tokenizer = tokenizer
+        self.token_budget = token_budget
+
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        if not texts:
+            return []
+        return [len(ids) for ids in self.tokenizer(texts, add_special_tokens=False)["input_ids"]]
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Cut `text` to at most `max_tokens` tokens, backing off to the last word boundary"""
+        encoded = self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)
+        offsets = encoded["offset_mapping"]
+        if len(offsets) <= max_tokens:
+            return text
+        cut = text[:offsets[max_tokens][0]]
+        boundary = max(cut.rfind(" "), cut.rfind("\n"))
+        return (cut[:boundary] if boundary > len(cut) // 2 else cut).rstrip() + "..."
+
+    @staticmethod
+    def _fingerprint(fields: List[str]) -> str:
+        normalized = re.sub(r"\s+", " ", "\n".join(fields).lower()).strip()
+        return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+    def build(self, results: List[Dict[str, Any]], plan_request: Optional[PlanRequest] = None,
+              token_budget: Optional[int] = None) -> Tuple[str, int]:
+        """Context text for ranked search results; returns the text and its token count"""
+        budget = token_budget or self.token_budget
+        blocks, seen = [], set()
+        for result in results:
+            fields = select_fields(result.get("payload") or {}, plan_request)
+            if not fields:
+                continue
+            fingerprint = self._fingerprint(fields)
+            if fingerprint in seen:
+                continue
+            seen.add(fingerprint)
+            blocks.append(fields)
+
+        # One batched tokenizer call for every block; the separating newline is counted as a token
+        block_tokens = self.count_tokens(["\n".join(fields) for fields in blocks])
+        parts, used = [], 0
+        for fields, tokens in zip(blocks, block_tokens):
+            if used + tokens + 1 <= budget:
+                parts.append("\n".join(fields))
+                used += tokens + 1
+                continue
+            remaining = budget - used - 1
+            if remaining >= MIN_PARTIAL_TOKENS:
+                partial, partial_tokens = self._fit_fields(fields, remaining)
+                if partial:
+                    parts.append(partial)
+                    used += partial_tokens + 1
+            break
+        return ("\n" + "\n".join(parts)) if parts else "", used
+
+    def _fit_fields(self, fields: List[str], budget: int) -> Tuple[str, int]:
+        kept, used = [], 0
+        for field, tokens in zip(fields, self.count_tokens(fields)):
+            if used + tokens + 1 <= budget:
+                kept.append(field)
+                used += tokens + 1
+                continue
+            remaining = budget - used - 1
+            if remaining >= MIN_PARTIAL_TOKENS:
+                truncated = self.truncate(field, remaining - 1)
+                kept.append(truncated)
+                used += self.count_tokens([truncated])[0] + 1
+            break
+        return "\n".join(kept), used
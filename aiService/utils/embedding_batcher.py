@@ -0,0 +1,152 @@
+import time
+import bisect
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, Dict, List, Sequence
+
+import numpy as np
+
+DEFAULT_BUCKET_EDGES = (16, 32, 64, 128, 256, 512)
+
+
+class _Pending:
+    __slots__ = ("text", "future", "enqueued_at")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.future: Future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+def _histogram_label(value: int) -> str:
+    # Power-of-two buckets: "1", "2", "4", ... each counting values up to that bound
+    bound = 1
+    while bound < value:
+        bound *= 2
+    return str(bound)
+
+
+class EmbeddingBatcher:
+    """Coalesces concurrent small encode requests into batched forward passes.
+
+    Texts are queued per padded-length bucket, so a batch never pads short queries up to
+    a long transcript chunk. A single worker thread flushes a bucket as soon as it holds
+    `max_batch_size` texts, or when its oldest text has waited `max_wait_ms`. Each text
+    gets its own future that resolves to a float32 vector.
+    """
+
+    def __init__(
+        self,
+        encode_fn: Callable[[List[str], int], np.ndarray],
+        length_fn: Callable[[List[str]], List[int]],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        bucket_edges: Sequence[int] = DEFAULT_BUCKET_EDGES,
+    ):
+        self.encode_fn = encode_fn
+        self.length_fn = length_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_s = max_wait_ms / 1000
+        self.bucket_edges = tuple(bucket_edges)
+        self._buckets: Dict[int, Deque[_Pending]] = {i: deque() for i in range(len(self.bucket_edges) + 1)}
+        self._depth = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self._stats = {
+            "batches": 0,
+            "items": 0,
+            "total_wait_ms": 0.0,
+            "batch_size_histogram": {},
+            "queue_depth_histogram": {},
+        }
+        self._thread = threading.Thread(target=self._run, daemon=True, name="embedding-batcher")
+        self._thread.start()
+
+    def submit(self, texts: List[str]) -> List[Future]:
+        pending = [_Pending(text) for text in texts]
+        buckets = [bisect.bisect_left(self.bucket_edges, length) for length in self.length_fn(texts)]
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("EmbeddingBatcher is closed")
+            for item, bucket in zip(pending, buckets):
+                self._buckets[bucket].append(item)
+            self._depth += len(pending)
+            self._cond.notify()
+        return [item.future for item in pending]
+
+    def _next_batch(self) -> List[_Pending]:
+        """Block until some bucket is full or has timed out, then pop its batch. Called with the lock held."""
+        while True:
+            if self._closed and not self._depth:
+                return []
+            full = [q for q in self._buckets.values() if len(q) >= self.max_batch_size]
+            if full:
+                queue = full[0]
+            else:
+                waiting = [q for q in self._buckets.values() if q]
+                if not waiting:
+                    self._cond.wait()
+                    continue
+                queue = min(waiting, key=lambda q: q[0].enqueued_at)
+                remaining = queue[0].enqueued_at + self.max_wait_s - time.perf_counter()
+                if remaining > 0 and not self._closed:
+                    self._cond.wait(remaining)
+                    continue
+
+            self._record("queue_depth_histogram", self._depth)
+            batch = [queue.popleft() for _ in range(min(self.max_batch_size, len(queue)))]
+            self._depth -= len(batch)
+            return batch
+
+    def _record(self, histogram: str, value: int):
+        label = _histogram_label(value)
+        self._stats[histogram][label] = self._stats[histogram].get(label, 0) + 1
+
+    def _run(self):
+        while True:
+            with self._cond:
+                batch = self._next_batch()
+                if not batch:
+                    return
+                # Skip texts whose caller was cancelled while queued; the rest can no longer be cancelled
+                batch = [item for item in batch if item.future.set_running_or_notify_cancel()]
+                if not batch:
+                    continue
+                now = time.perf_counter()
+                self._stats["batches"] += 1
+                self._stats["items"] += len(batch)
+                self._stats["total_wait_ms"] += sum(now - item.enqueued_at for item in batch) * 1000
+                self._record("batch_size_histogram", len(batch))
+
+            try:
+                vectors = self.encode_fn([item.text for item in batch], len(batch))
+            except Exception as e:
+                for item in batch:
+                    item.future.set_exception(e)
+                continue
+            for item, vector in zip(batch, vectors):
+                item.future.set_result(vector)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            stats = {
+                "queue_depth": self._depth,
+                "batches": self._stats["batches"],
+                "items": self._stats["items"],
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait_s * 1000,
+                "batch_size_histogram": dict(self._stats["batch_size_histogram"]),
+                "queue_depth_histogram": dict(self._stats["queue_depth_histogram"]),
+            }
+            total_wait_ms = self._stats["total_wait_ms"]
+        stats["avg_batch_size"] = round(stats["items"] / stats["batches"], 2) if stats["batches"] else 0.0
+        stats["avg_wait_ms"] = round(total_wait_ms / stats["items"], 3) if stats["items"] else 0.0
+        return stats
+
+    def close(self):
+        """Flush what is queued and stop the worker thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
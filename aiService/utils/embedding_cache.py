@@ -0,0 +1,187 @@
+import os
+import time
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class EmbeddingCache:
+    """Content-hash keyed cache of embeddings with an in-memory LRU and an optional SQLite store.
+
+    Keys hash the model identity together with the text, so changing the model or max sequence
+    length never serves stale vectors. The disk layer keeps float16 vectors to halve its size
+    and evicts the least recently used rows once it grows past `max_disk_entries`.
+
+    Disk rows are counted in memory rather than with COUNT(*) per insert, and the access times
+    that drive disk eviction are written in batches of `touch_batch` keys.
+
+    Lexical (sparse) weights from the same forward pass are kept in a separate in-memory LRU
+    of the same size; they are small, cheap to recompute and never written to disk.
+    """
+
+    def __init__(self, namespace: str, memory_entries: int = 10000, path: Optional[str] = None,
+                 max_disk_entries: int = 500000, touch_batch: int = 256):
+        self.namespace = namespace
+        self.memory_entries = memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.touch_batch = touch_batch
+        self._memory: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._sparse: "OrderedDict[bytes, Dict[int, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+        self._disk = None
+        self._disk_rows = 0
+        # Disk hits whose last_access has not been written yet: key -> access time
+        self._touched: Dict[bytes, float] = {}
+        if path:
+            self._disk = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._disk.execute("PRAGMA journal_mode=WAL")
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._disk.execute("CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings(last_access)")
+            self._disk_rows = self._disk.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def key(self, text: str) -> bytes:
+        return hashlib.blake2b(f"{self.namespace}\x00{text}".encode("utf-8"), digest_size=16).digest()
+
+    def _remember(self, key: bytes, vector: np.ndarray):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get_many(self, texts: List[str], memory_only: bool = False) -> List[Optional[np.ndarray]]:
+        """Cached float32 vectors for `texts`, None where missing. With memory_only the disk is not touched
+        and misses are not counted, so callers can probe cheaply before falling back to get_many()."""
+        keys = [self.key(text) for text in texts]
+        found: List[Optional[np.ndarray]] = [None] * len(texts)
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[i] = vector
+            if memory_only:
+                if all(vector is not None for vector in found):
+                    self._stats["memory_hits"] += len(found)
+                return found
+
+            self._stats["memory_hits"] += sum(vector is not None for vector in found)
+            missing = [i for i, vector in enumerate(found) if vector is None]
+            if missing and self._disk is not None:
+                missing_keys = [keys[i] for i in missing]
+                placeholders = ",".join("?" * len(missing_keys))
+                rows = dict(self._disk.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", missing_keys
+                ).fetchall())
+                if rows:
+                    now = time.time()
+                    self._touched.update((key, now) for key in rows)
+                    if len(self._touched) >= self.touch_batch:
+                        self._flush_touched()
+                for i in missing:
+                    blob = rows.get(keys[i])
+                    if blob is not None:
+                        vector = np.frombuffer(blob, dtype=np.float16).astype(np.float32)
+                        self._remember(keys[i], vector)
+                        found[i] = vector
+                        self._stats["disk_hits"] += 1
+            self._stats["misses"] += sum(vector is None for vector in found)
+        return found
+
+    def put_many(self, texts: List[str], vectors: List[np.ndarray]):
+        now = time.time()
+        with self._lock:
+            rows: Dict[bytes, tuple] = {}
+            for text, vector in zip(texts, vectors):
+                key = self.key(text)
+                vector = np.asarray(vector, dtype=np.float32)
+                self._remember(key, vector)
+                rows[key] = (key, vector.astype(np.float16).tobytes(), now)
+            if self._disk is not None and rows:
+                # Primary-key lookups, so only rows that are really new grow the count
+                placeholders = ",".join("?" * len(rows))
+                existing = self._disk.execute(
+                    f"SELECT COUNT(*) FROM embeddings WHERE key IN ({placeholders})", list(rows)
+                ).fetchone()[0]
+                self._disk.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)", rows.values())
+                for key in rows:
+                    self._touched.pop(key, None)
+                self._disk_rows += len(rows) - existing
+                if self._disk_rows > self.max_disk_entries:
+                    self._evict_disk()
+
+    def get_sparse_many(self, texts: List[str]) -> List[Optional[Dict[int, float]]]:
+        """Cached sparse weights (token id -> weight) for `texts`, None where missing"""
+        found: List[Optional[Dict[int, float]]] = []
+        with self._lock:
+            for text in texts:
+                key = self.key(text)
+                weights = self._sparse.get(key)
+                if weights is not None:
+                    self._sparse.move_to_end(key)
+                found.append(weights)
+        return found
+
+    def put_sparse_many(self, texts: List[str], weights: List[Dict[int, float]]):
+        with self._lock:
+            for text, text_weights in zip(texts, weights):
+                key = self.key(text)
+                self._sparse[key] = text_weights
+                self._sparse.move_to_end(key)
+            while len(self._sparse) > self.memory_entries:
+                self._sparse.popitem(last=False)
+
+    def _flush_touched(self):
+        self._disk.executemany(
+            "UPDATE embeddings SET last_access = ? WHERE key = ?", [(at, key) for key, at in self._touched.items()]
+        )
+        self._touched.clear()
+
+    def _evict_disk(self):
+        self._flush_touched()
+        # Recount: other workers may share the file, and eviction is rare enough to afford the scan
+        count = self._disk_rows = self._disk.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if count <= self.max_disk_entries:
+            return
+        # Evict down to 90% of the cap so eviction does not run on every insert
+        overflow = count - int(self.max_disk_entries * 0.9)
+        self._disk.execute(
+            "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?)",
+            (overflow,)
+        )
+        self._disk_rows -= overflow
+        self._stats["evictions"] += overflow
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_size"] = len(self._memory)
+            stats["sparse_size"] = len(self._sparse)
+            if self._disk is not None:
+                stats["disk_size"] = self._disk_rows
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 4) if lookups else 0.0
+        return stats
+
+
+def build_embedding_cache_from_env(namespace: str) -> Optional[EmbeddingCache]:
+    """EMBEDDING_CACHE_SIZE=0 disables the cache; EMBEDDING_CACHE_PATH adds the on-disk layer."""
+    memory_entries = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+    if memory_entries <= 0:
+        return None
+    return EmbeddingCache(
+        namespace,
+        memory_entries=memory_entries,
+        path=os.getenv("EMBEDDING_CACHE_PATH") or None,
+        max_disk_entries=int(os.getenv("EMBEDDING_CACHE_MAX_DISK_ENTRIES", "500000")),
+    )
@@ -0,0 +1,328 @@
+import os
+import asyncio
+import logging
+import threading
+import time
+import resource
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Union, Dict, Any, Tuple
+
+import numpy as np
+import torch
+from sentence_transformers import SentenceTransformer
+from dotenv import load_dotenv
+
+from utils.embedding_cache import EmbeddingCache, build_embedding_cache_from_env
+from utils.embedding_batcher import EmbeddingBatcher
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_NAME = "BAAI/bge-m3"
+SUPPORTED_DTYPES = ("fp32", "fp16", "int8")
+# BGE-M3's lexical head: Linear(hidden, 1) over the last hidden states, shipped next to the weights
+SPARSE_HEAD_FILE = "sparse_linear.pt"
+
+
+class EmbeddingService:
+    """Process-wide wrapper around the BGE-M3 SentenceTransformer.
+
+    Use `get_embedding_service()` instead of instantiating this directly so
+    that every component in the worker shares the same weights.
+    """
+
+    def __init__(
+        self,
+        model_name: str = DEFAULT_MODEL_NAME,
+        device: Optional[str] = None,
+        dtype: str = "fp32",
+        max_seq_length: Optional[int] = None,
+        executor_workers: int = 2,
+        cache: Optional[EmbeddingCache] = None,
+        sparse: bool = True,
+    ):
+        dtype = (dtype or "fp32").lower()
+        if dtype not in SUPPORTED_DTYPES:
+            raise ValueError(f"Unsupported embedding dtype '{dtype}', expected one of {SUPPORTED_DTYPES}")
+
+        self.model_name = model_name
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.dtype = dtype
+        # Guards encode() calls; torch modules are not safe to run concurrently from many threads
+        self._lock = threading.Lock()
+        # Bounded pool so async callers never run a forward pass on the event loop
+        self._executor = ThreadPoolExecutor(max_workers=executor_workers, thread_name_prefix="embedding")
+
+        rss_before = _current_rss_mb()
+        start = time.perf_counter()
+        self.model = SentenceTransformer(model_name, device=self.device)
+        self._apply_dtype()
+        if max_seq_length:
+            self.model.max_seq_length = max_seq_length
+        self.max_seq_length = self.model.max_seq_length
+
+        self.load_time_s = time.perf_counter() - start
+        self.peak_rss_delta_mb = _current_rss_mb() - rss_before
+        self.dimension = self.model.get_sentence_embedding_dimension()
+        self.sparse_head = self._load_sparse_head() if sparse else None
+        self.cache = cache
+        self.batcher: Optional[EmbeddingBatcher] = None
+
+    def _apply_dtype(self):
+        if self.dtype == "fp16":
+            if self.device == "cpu":
+                logger.warning("fp16 embeddings on CPU are slow, consider int8 instead")
+            self.model.half()
+        elif self.dtype == "int8":
+            if self.device != "cpu":
+                raise ValueError("int8 dynamic quantization is only supported on CPU")
+            self.model = torch.quantization.quantize_dynamic(
+                self.model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+
+    def _load_sparse_head(self) -> Optional[torch.nn.Linear]:
+        """The lexical weight head, or None (dense-only) when the model does not ship one"""
+        try:
+            if os.path.isdir(self.model_name):
+                path = os.path.join(self.model_name, SPARSE_HEAD_FILE)
+            else:
+                from huggingface_hub import hf_hub_download
+                path = hf_hub_download(self.model_name, SPARSE_HEAD_FILE)
+            state = torch.load(path, map_location="cpu")
+        except Exception as e:
+            logger.warning("No sparse head for %s, lexical weights are disabled: %s", self.model_name, e)
+            return None
+        head = torch.nn.Linear(self.dimension, 1)
+        head.load_state_dict(state)
+        head.to(self.device)
+        if self.dtype == "fp16":
+            head.half()
+        return head.eval()
+
+    @property
+    def sparse_enabled(self) -> bool:
+        return self.sparse_head is not None
+
+    def encode(self, texts: Union[str, List[str]], batch_size: int = 32) -> List[List[float]]:
+        """Encode one or many texts into L2-normalized dense vectors.
+
+        With a cache attached, only texts that miss it (deduplicated) go through the model.
+        Small requests are coalesced with concurrent callers when the batcher is enabled.
+        """
+        if isinstance(texts, str):
+            texts = [texts]
+        vectors, missing = self._lookup(texts)
+        if missing:
+            if self._use_batcher(missing):
+                encoded = np.stack([future.result() for future in self.batcher.submit(missing)])
+            else:
+                encoded = self._encode(missing, batch_size)
+            vectors = self._merge(texts, vectors, missing, encoded)
+        return [vector.tolist() for vector in vectors]
+
+    async def aencode(self, texts: Union[str, List[str]], batch_size: int = 32) -> List[List[float]]:
+        """Same as encode(), but never runs a forward pass on the event loop.
+
+        Requests fully served by the in-memory cache layer return without the executor hop.
+        """
+        if isinstance(texts, str):
+            texts = [texts]
+        if self.cache is not None:
+            vectors = self.cache.get_many(texts, memory_only=True)
+            if all(vector is not None for vector in vectors):
+                return [vector.tolist() for vector in vectors]
+        loop = asyncio.get_running_loop()
+        if self.batcher is None:
+            return await loop.run_in_executor(self._executor, self.encode, texts, batch_size)
+
+        vectors, missing = self._lookup(texts)
+        if missing:
+            if self._use_batcher(missing):
+                futures = self.batcher.submit(missing)
+                encoded = np.stack(await asyncio.gather(*(asyncio.wrap_future(future) for future in futures)))
+            else:
+                encoded = await loop.run_in_executor(self._executor, self._encode, missing, batch_size)
+            vectors = self._merge(texts, vectors, missing, encoded)
+        return [vector.tolist() for vector in vectors]
+
+    def encode_hybrid(self, texts: Union[str, List[str]], batch_size: int = 32) -> Tuple[List[List[float]], List[Dict[int, float]]]:
+        """Dense vectors plus BGE-M3 lexical weights (token id -> weight) for each text.
+
+        Both come from one forward pass: misses go through encode(), whose forward pass also fills
+        the sparse cache. Only texts whose dense vector was cached but whose weights were evicted
+        (or came from the disk layer) are run again.
+        """
+        if not self.sparse_enabled:
+            raise RuntimeError(f"{self.model_name} has no sparse head, hybrid encoding is unavailable")
+        if isinstance(texts, str):
+            texts = [texts]
+        if self.cache is None:
+            dense, sparse = self._forward(texts, batch_size)
+            return [vector.tolist() for vector in dense], sparse
+        dense = self.encode(texts, batch_size)
+        sparse, missing = self._lookup_sparse(texts)
+        if missing:
+            sparse = self._merge_sparse(texts, sparse, missing, self._forward(missing, batch_size)[1])
+        return dense, sparse
+
+    async def aencode_hybrid(self, texts: Union[str, List[str]], batch_size: int = 32) -> Tuple[List[List[float]], List[Dict[int, float]]]:
+        """Same as encode_hybrid(), but never runs a forward pass on the event loop."""
+        if isinstance(texts, str):
+            texts = [texts]
+        loop = asyncio.get_running_loop()
+        if self.cache is None or not self.sparse_enabled:
+            return await loop.run_in_executor(self._executor, self.encode_hybrid, texts, batch_size)
+        dense = await self.aencode(texts, batch_size)
+        sparse, missing = self._lookup_sparse(texts)
+        if missing:
+            _, encoded = await loop.run_in_executor(self._executor, self._forward, missing, batch_size)
+            sparse = self._merge_sparse(texts, sparse, missing, encoded)
+        return dense, sparse
+
+    def _lookup_sparse(self, texts: List[str]):
+        sparse = self.cache.get_sparse_many(texts)
+        missing = list(dict.fromkeys(text for text, weights in zip(texts, sparse) if weights is None))
+        return sparse, missing
+
+    def _merge_sparse(self, texts: List[str], sparse: list, missing: List[str], encoded: List[Dict[int, float]]) -> list:
+        self.cache.put_sparse_many(missing, encoded)
+        by_text = dict(zip(missing, encoded))
+        return [by_text[text] if weights is None else weights for text, weights in zip(texts, sparse)]
+
+    def _lookup(self, texts: List[str]):
+        """Cached vectors (None where missing) and the deduplicated texts that still need encoding."""
+        vectors = self.cache.get_many(texts) if self.cache is not None else [None] * len(texts)
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        return vectors, missing
+
+    def _merge(self, texts: List[str], vectors: list, missing: List[str], encoded: np.ndarray) -> list:
+        if self.cache is not None:
+            self.cache.put_many(missing, list(encoded))
+        by_text = dict(zip(missing, encoded))
+        return [by_text[text] if vector is None else vector for text, vector in zip(texts, vectors)]
+
+    def _use_batcher(self, texts: List[str]) -> bool:
+        # Requests that fill a batch on their own (bulk ingestion) gain nothing from queueing
+        return self.batcher is not None and len(texts) < self.batcher.max_batch_size
+
+    def _encode(self, texts: List[str], batch_size: int) -> np.ndarray:
+        dense, sparse = self._forward(texts, batch_size)
+        if sparse is not None and self.cache is not None:
+            self.cache.put_sparse_many(texts, sparse)
+        return dense
+
+    def _forward(self, texts: List[str], batch_size: int) -> Tuple[np.ndarray, Optional[List[Dict[int, float]]]]:
+        """One forward pass; returns the dense vectors and, with a sparse head, the lexical weights."""
+        if self.sparse_head is None:
+            with self._lock:
+                embeddings = self.model.encode(
+                    texts,
+                    batch_size=batch_size,
+                    normalize_embeddings=True,
+                    convert_to_numpy=True,
+                )
+            return embeddings.astype("float32"), None
+
+        with self._lock, torch.inference_mode():
+            # output_value=None returns every module output per text, including the token states
+            outputs = self.model.encode(texts, batch_size=batch_size, output_value=None)
+            dense = torch.stack([output["sentence_embedding"] for output in outputs]).float()
+            dense = torch.nn.functional.normalize(dense, dim=-1).cpu().numpy()
+            sparse = [self._lexical_weights(output) for output in outputs]
+        return dense.astype("float32"), sparse
+
+    def _lexical_weights(self, output: Dict[str, Any]) -> Dict[int, float]:
+        """relu(head(hidden state)) per token, keeping the max weight per token id as BGE-M3 does"""
+        mask = output["attention_mask"].bool()
+        token_ids = output["input_ids"][mask].tolist()
+        hidden = output["token_embeddings"][mask].to(self.sparse_head.weight.device, self.sparse_head.weight.dtype)
+        weights = torch.relu(self.sparse_head(hidden)).squeeze(-1).float().tolist()
+        special = set(self.tokenizer.all_special_ids)
+        lexical: Dict[int, float] = {}
+        for token_id, weight in zip(token_ids, weights):
+            if weight > 0 and token_id not in special and weight > lexical.get(token_id, 0.0):
+                lexical[token_id] = weight
+        return lexical
+
+    def token_lengths(self, texts: List[str]) -> List[int]:
+        """Token counts after truncation, used to bucket texts by padded length."""
+        encoded = self.tokenizer(texts, add_special_tokens=True, truncation=True, max_length=self.max_seq_length)
+        return [len(ids) for ids in encoded["input_ids"]]
+
+    def warmup(self, batch_sizes: tuple = (1, 8, 32)) -> Dict[int, float]:
+        """Run dummy forward passes for each batch shape; returns latency in ms per shape."""
+        timings = {}
+        for batch_size in batch_sizes:
+            texts = [f"Warmup trip {i} from Bangkok to Chiang Mai" for i in range(batch_size)]
+            start = time.perf_counter()
+            # Bypass the cache, cached warmup texts would skip the forward pass being warmed
+            self._encode(texts, batch_size)
+            timings[batch_size] = round((time.perf_counter() - start) * 1000, 2)
+        return timings
+
+    @property
+    def tokenizer(self):
+        return self.model.tokenizer
+
+    def report(self) -> Dict[str, Any]:
+        """Memory/latency summary of the loaded model, logged once at startup."""
+        start = time.perf_counter()
+        self.encode("I want to go to Chiang Mai")
+        single_latency_ms = (time.perf_counter() - start) * 1000
+
+        param_bytes = sum(p.numel() * p.element_size() for p in self.model.parameters())
+        return {
+            "model": self.model_name,
+            "device": self.device,
+            "dtype": self.dtype,
+            "max_seq_length": self.max_seq_length,
+            "dimension": self.dimension,
+            "sparse": self.sparse_enabled,
+            "load_time_s": round(self.load_time_s, 2),
+            "param_memory_mb": round(param_bytes / (1024 * 1024), 1),
+            "peak_rss_delta_mb": round(self.peak_rss_delta_mb, 1),
+            "single_encode_ms": round(single_latency_ms, 2),
+            "cache": self.cache.stats() if self.cache is not None else None,
+        }
+
+
+def _current_rss_mb() -> float:
+    # ru_maxrss is reported in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+_service: Optional[EmbeddingService] = None
+_service_lock = threading.Lock()
+
+
+def get_embedding_service() -> EmbeddingService:
+    """Return the shared EmbeddingService, loading the model on first use."""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                max_seq_length = os.getenv("EMBEDDING_MAX_SEQ_LENGTH")
+                model_name = os.getenv("EMBEDDING_MODEL", DEFAULT_MODEL_NAME)
+                dtype = os.getenv("EMBEDDING_DTYPE", "fp32")
+                _service = EmbeddingService(
+                    model_name=model_name,
+                    device=os.getenv("EMBEDDING_DEVICE") or None,
+                    dtype=dtype,
+                    max_seq_length=int(max_seq_length) if max_seq_length else None,
+                    executor_workers=int(os.getenv("EMBEDDING_EXECUTOR_WORKERS", "2")),
+                    sparse=os.getenv("EMBEDDING_SPARSE", "true").lower() == "true",
+                )
+                # Namespace by everything that changes the vectors so a config change never serves stale entries
+                _service.cache = build_embedding_cache_from_env(
+                    f"{model_name}|{dtype}|{_service.max_seq_length}"
+                )
+                batch_wait_ms = float(os.getenv("EMBEDDING_BATCH_MAX_WAIT_MS", "5"))
+                if batch_wait_ms > 0:
+                    _service.batcher = EmbeddingBatcher(
+                        _service._encode,
+                        _service.token_lengths,
+                        max_batch_size=int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", "32")),
+                        max_wait_ms=batch_wait_ms,
+                    )
+                logger.info("Embedding service ready: %s", _service.report())
+    return _service
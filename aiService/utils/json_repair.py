@@ -0,0 +1,172 @@
+import json
+from typing import Any, Dict, List, Tuple
+
+_LITERALS = {"True": "true", "False": "false", "None": "null", "true": "true", "false": "false", "null": "null"}
+_STRING_CONTROL = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}
+
+
+def _closes_single_quote(text: str, i: int) -> bool:
+    """A ' at `i` ends a single-quoted string only when a delimiter follows it, so "Thailand's" stays inside"""
+    rest = text[i + 1:].lstrip()
+    return not rest or rest[0] in ",:}]"
+
+
+def extract_json_object(text: str) -> str:
+    """Return the outermost {...} in `text`, skipping prose or markdown fences around it.
+
+    If the object is never closed (a truncated response) everything from its opening brace
+    is returned so repair_json() can close it.
+    """
+    start = text.find("{")
+    if start < 0:
+        raise json.JSONDecodeError("No JSON object found", text, 0)
+    depth, quote, escape = 0, None, False
+    for i in range(start, len(text)):
+        char = text[i]
+        if quote:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == quote and (quote == '"' or _closes_single_quote(text, i)):
+                quote = None
+            continue
+        if char in "\"'":
+            quote = char
+        elif char in "{[":
+            depth += 1
+        elif char in "}]":
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return text[start:]
+
+
+def repair_json(text: str) -> str:
+    """Fix the defects LLMs commonly emit in otherwise valid JSON.
+
+    Handles trailing commas, missing commas between values, // and /* */ comments,
+    Python literals (True/False/None), single-quoted keys and strings, numbers with a
+    trailing dot (1.), raw newlines inside strings, and unterminated strings, arrays and
+    objects at the end of a truncated response.
+    """
+    out: List[str] = []
+    stack: List[str] = []
+    i, n = 0, len(text)
+    # The quote character of the string being copied, or None outside strings
+    quote, escape = None, False
+    # True when the last token emitted completes a value, so a following value needs a comma
+    after_value = False
+
+    while i < n:
+        char = text[i]
+        if quote:
+            if escape:
+                escape = False
+                if char == "'":
+                    # \' is not a JSON escape
+                    out[-1] = char
+                else:
+                    out.append(char)
+            elif char == "\\":
+                escape = True
+                out.append(char)
+            elif char == quote and (quote == '"' or _closes_single_quote(text, i)):
+                quote = None
+                after_value = True
+                out.append('"')
+            elif char == '"':
+                out.append('\\"')
+            else:
+                out.append(_STRING_CONTROL.get(char, char))
+            i += 1
+            continue
+
+        if char.isspace():
+            out.append(char)
+            i += 1
+            continue
+        if text.startswith("//", i):
+            end = text.find("\n", i)
+            i = n if end < 0 else end
+            continue
+        if text.startswith("/*", i):
+            end = text.find("*/", i + 2)
+            i = n if end < 0 else end + 2
+            continue
+
+        starts_value = char in "\"'{[-" or char.isdigit() or char.isalpha()
+        if starts_value and after_value:
+            out.append(",")
+        after_value = False
+
+        if char in "\"'":
+            quote = char
+            out.append('"')
+            i += 1
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+            out.append(char)
+            i += 1
+        elif char in "}]":
+            _strip_trailing_comma(out)
+            if stack:
+                stack.pop()
+            out.append(char)
+            after_value = True
+            i += 1
+        elif char == "-" or char.isdigit():
+            j = i + 1
+            while j < n and (text[j].isdigit() or text[j] in ".eE+-"):
+                j += 1
+            number = text[i:j]
+            # JSON needs a digit after the decimal point: 1. -> 1.0
+            out.append(number + "0" if number.endswith(".") else number)
+            after_value = True
+            i = j
+        elif char.isalpha():
+            j = i
+            while j < n and (text[j].isalnum() or text[j] == "_"):
+                j += 1
+            word = text[i:j]
+            out.append(_LITERALS.get(word, json.dumps(word)))
+            after_value = True
+            i = j
+        else:
+            out.append(char)
+            i += 1
+
+    if quote:
+        if escape:
+            out.pop()
+        out.append('"')
+    if stack:
+        _strip_trailing_comma(out)
+        if "".join(out).rstrip().endswith(":"):
+            out.append("null")
+    while stack:
+        out.append(stack.pop())
+    return "".join(out)
+
+
+def _strip_trailing_comma(out: List[str]):
+    j = len(out) - 1
+    while j >= 0 and out[j].isspace():
+        j -= 1
+    if j >= 0 and out[j] == ",":
+        del out[j]
+
+
+def loads_tolerant(text: str) -> Tuple[Dict[str, Any], bool]:
+    """Parse the outermost JSON object in an LLM response, repairing it if strict parsing fails.
+
+    Returns (data, repaired). Raises json.JSONDecodeError when the text cannot be recovered.
+    """
+    candidate = extract_json_object(text)
+    try:
+        return json.loads(candidate), False
+    except json.JSONDecodeError as strict_error:
+        try:
+            return json.loads(repair_json(candidate)), True
+        except json.JSONDecodeError:
+            raise strict_error
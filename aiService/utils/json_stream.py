@@ -0,0 +1,148 @@
+import json
+from typing import Any, List, Optional, Sequence, Tuple
+
+WILDCARD = "*"
+
+
+class _Frame:
+    __slots__ = ("kind", "path", "start", "key", "index", "expecting")
+
+    def __init__(self, kind: str, path: tuple, start: int):
+        self.kind = kind
+        self.path = path
+        self.start = start
+        self.key: Optional[str] = None
+        self.index = 0
+        self.expecting = "key" if kind == "object" else "value"
+
+
+class IncrementalJSONParser:
+    """Scans a JSON document as it arrives in chunks and reports values at watched paths.
+
+    Paths are tuples of object keys and array indices, e.g. ("trip_plan", "timeline", 0);
+    use "*" in a watched path to match any key or index. Each watched value is returned
+    from feed() once, as soon as its closing character has been seen. Anything before the
+    first "{" (prose, markdown fences) and after the root object closes is ignored.
+    """
+
+    def __init__(self, watched: Sequence[Tuple]):
+        self.watched = [tuple(path) for path in watched]
+        self.buffer = ""
+        self.done = False
+        self._pos = 0
+        self._stack: List[_Frame] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._string_is_key = False
+        self._scalar_start: Optional[int] = None
+        self._value_path: tuple = ()
+        self._completed: List[Tuple[tuple, Any]] = []
+
+    def feed(self, chunk: str) -> List[Tuple[tuple, Any]]:
+        """Consume the next chunk and return the (path, value) pairs completed by it."""
+        self.buffer += chunk
+        self._completed = []
+        buffer = self.buffer
+        while self._pos < len(buffer):
+            self._step(buffer[self._pos], self._pos)
+            self._pos += 1
+        return self._completed
+
+    def _matches(self, path: tuple) -> bool:
+        for pattern in self.watched:
+            if len(pattern) == len(path) and all(p == WILDCARD or p == v for p, v in zip(pattern, path)):
+                return True
+        return False
+
+    def _value_done(self, start: int, end: int, path: tuple):
+        if not self._matches(path):
+            return
+        try:
+            self._completed.append((path, json.loads(self.buffer[start:end])))
+        except json.JSONDecodeError:
+            # A malformed section is left for the final full-document parse to report
+            pass
+
+    def _start_value(self, c: str, i: int, path: tuple):
+        if c == "{":
+            self._stack.append(_Frame("object", path, i))
+        elif c == "[":
+            self._stack.append(_Frame("array", path, i))
+        elif c == '"':
+            self._in_string = True
+            self._string_start = i
+            self._string_is_key = False
+            self._value_path = path
+        else:
+            self._scalar_start = i
+            self._value_path = path
+
+    def _close(self, i: int):
+        frame = self._stack.pop()
+        self._value_done(frame.start, i + 1, frame.path)
+        if not self._stack:
+            self.done = True
+
+    def _step(self, c: str, i: int):
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif c == "\\":
+                self._escape = True
+            elif c == '"':
+                self._in_string = False
+                if self._string_is_key:
+                    frame = self._stack[-1]
+                    frame.key = json.loads(self.buffer[self._string_start:i + 1])
+                    frame.expecting = "colon"
+                else:
+                    self._value_done(self._string_start, i + 1, self._value_path)
+            return
+
+        if self._scalar_start is not None:
+            if c not in ",}]" and not c.isspace():
+                return
+            self._value_done(self._scalar_start, i, self._value_path)
+            self._scalar_start = None
+
+        if not self._stack:
+            if not self.done and c == "{":
+                self._stack.append(_Frame("object", (), i))
+            return
+
+        if c.isspace():
+            return
+        frame = self._stack[-1]
+        if frame.kind == "object":
+            if frame.expecting == "key":
+                if c == '"':
+                    self._in_string = True
+                    self._string_start = i
+                    self._string_is_key = True
+                elif c == "}":
+                    self._close(i)
+            elif frame.expecting == "colon":
+                if c == ":":
+                    frame.expecting = "value"
+            elif frame.expecting == "value":
+                frame.expecting = "comma"
+                self._start_value(c, i, frame.path + (frame.key,))
+            elif frame.expecting == "comma":
+                if c == ",":
+                    frame.expecting = "key"
+                elif c == "}":
+                    self._close(i)
+        else:
+            if frame.expecting == "value":
+                if c == "]":
+                    self._close(i)
+                else:
+                    frame.expecting = "comma"
+                    self._start_value(c, i, frame.path + (frame.index,))
+            elif frame.expecting == "comma":
+                if c == ",":
+                    frame.index += 1
+                    frame.expecting = "value"
+                elif c == "]":
+                    self._close(i)
@@ -1,163 +1,514 @@
 import os
+import time
 import asyncio
+import hashlib
+import logging
 import httpx
 from dotenv import load_dotenv
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple, AsyncIterator
 from dataclasses import dataclass
 from qdrant_client import QdrantClient
-from openai import OpenAI
-from sentence_transformers import SentenceTransformer
+from openai import AsyncOpenAI
+from utils.embedding_service import get_embedding_service
+from utils.plan_cache import build_plan_cache_from_env
+from utils.json_stream import IncrementalJSONParser
+from utils.retrieval import (
+    build_search_filter, build_sub_queries, collection_vectors, hybrid_searches, reciprocal_rank_fusion, split_hybrid_results,
+)
+from utils.local_index import build_local_index_from_env
+from utils.json_repair import loads_tolerant
+from utils.single_flight import SingleFlight
+from utils.llm_guard import LLMGuard, LLMUnavailableError, build_llm_guard_from_env
+from utils.model_router import build_model_router_from_env
+from utils.telemetry import record_stage, record_tokens, span
+from utils.plan_cache import request_key
+from utils.context_builder import ContextBuilder, context_budget_for, load_context_tokenizer, payload_fields, select_fields
+from utils.reranker import build_reranker_from_env
 from interface import PlanResponse, TripPlan, RetrievedItem, PlanRequest
 from interface import DayTimeline, TimelineEntry, Spot, Budget, Permits, Safety, Contact, SafetyContacts
 from interface import Preparation, PreparationItem
-from class_mod.rest_qdrant import RestQdrantClient
+from class_mod.rest_qdrant import build_async_qdrant_client_from_env
 import json 
 from fastapi import HTTPException
+from pydantic import TypeAdapter, ValidationError
 
 load_dotenv()
+logger = logging.getLogger(__name__)
+DEFAULT_MODEL = "aisingapore/Llama-SEA-LION-v3-70B-IT"
+# Sections of the trip-plan JSON that are emitted as soon as they are complete
+STREAMED_SECTIONS = [
+    ("tripOverview",),
+    ("preparation",),
+    ("trip_plan", "timeline", "*"),
+    ("trip_plan", "spots", "*"),
+    ("trip_plan", "budget"),
+]
+# Plan sections validated on their own so that only a broken one is re-requested: name -> (path, schema, required)
+PLAN_SECTIONS = {
+    "tripOverview": (("tripOverview",), TypeAdapter(str), True),
+    "preparation": (("preparation",), TypeAdapter(Preparation), False),
+    "timeline": (("trip_plan", "timeline"), TypeAdapter(List[DayTimeline]), True),
+    "spots": (("trip_plan", "spots"), TypeAdapter(List[Spot]), False),
+    "budget": (("trip_plan", "budget"), TypeAdapter(Budget), False),
+    "permits": (("trip_plan", "permits"), TypeAdapter(Optional[Permits]), False),
+    "safety": (("trip_plan", "safety"), TypeAdapter(Optional[Safety]), False),
+}
+SECTION_TEMPLATES = {
+    "tripOverview": '"2-3 paragraph trip overview"',
+    "preparation": '{"overview": "General preparation guidance", "items": [{"category": "Documents", "items": ["Passport", "Travel insurance"], "notes": "Notes"}], "timeline": "2-3 weeks before departure"}',
+    "timeline": '[{"day": 1, "activities": [{"t": "08:30", "detail": "Activity"}, {"t": "12:00", "detail": "Lunch"}]}]',
+    "spots": '[{"name": "Location", "latitude": 18.7883, "longitude": 98.9853, "time": "09:30-11:45", "notes": "Details"}]',
+    "budget": '{"transport": 500, "entrance": 200, "meals": 800, "accommodation": 1200, "activities": 600, "total": 3300}',
+    "permits": '{"needed": false, "notes": "Requirements", "seasonal": "Best time"}',
+    "safety": '{"registration": "Safety info", "checkins": "Check-in procedures", "sos": "Emergency: 1669", "contacts": {"police": {"name": "Police", "phone": "1155"}}}',
+}
+OVERVIEW_TEMPLATE = '{"tripOverview": "2-3 paragraph trip overview", "title": "Descriptive trip title", "date": "Suggested dates"}'
+DAY_TEMPLATE = '{{"day": {day}, "activities": [{{"t": "08:30", "detail": "Activity"}}, {{"t": "12:00", "detail": "Lunch"}}, {{"t": "14:00", "detail": "Activity"}}, {{"t": "18:00", "detail": "Evening"}}]}}'
 SYSTEM_PROMPT = """You are a helpful travel assistant. Use the provided context to answer the user's question about travel destinations and places.
 If the context doesn't contain relevant information, say so politely and provide general advice if possible. You have to answer in language you are asked."""
 '''
 '''
+def day_ranges(duration: int, max_ranges: int) -> List[Tuple[int, int]]:
+    """Split days 1..duration into at most `max_ranges` runs of consecutive days, as evenly as possible"""
+    duration = max(duration, 1)
+    count = min(duration, max_ranges)
+    ranges, first = [], 1
+    for i in range(count):
+        size = duration // count + (i < duration % count)
+        ranges.append((first, first + size - 1))
+        first += size
+    return ranges
+
+
+class PlanParseError(ValueError):
+    """The LLM output could not be turned into a valid plan even after repair and section re-requests"""
+
+
+class DraftUnavailableError(Exception):
+    """No fast model is configured, so a draft would be a second full generation"""
+
+
 class LLMCaller:
     def __init__(self):
         # Environment variables
-        self.client = OpenAI(
+        # Size the pool for hundreds of concurrent completions per worker
+        max_connections = int(os.getenv("LLM_MAX_CONNECTIONS", "500"))
+        self.client = AsyncOpenAI(
                                 api_key=os.getenv("SEALION_API"),
                                 base_url=os.getenv("SEALION_BASE_URL"),
+                                http_client=httpx.AsyncClient(
+                                    limits=httpx.Limits(
+                                        max_connections=max_connections,
+                                        max_keepalive_connections=max_connections,
+                                    ),
+                                    timeout=httpx.Timeout(float(os.getenv("LLM_TIMEOUT", "120")), connect=10.0),
+                                ),
+                                # Overload is handled by the guards below; SDK retries would only add load
+                                max_retries=int(os.getenv("LLM_MAX_RETRIES", "1")),
                             )
-        self.top_k = 1
+        # Adaptive concurrency limit, circuit breaker and request-deadline checks around every completion,
+        # one per model so an overloaded large model does not shed calls to the small one
+        self.guards: Dict[str, LLMGuard] = {}
+        # Sends simple chat and short section prompts to a faster model, escalating to DEFAULT_MODEL when needed
+        self.router = build_model_router_from_env(DEFAULT_MODEL)
+        # While the LLM is unavailable, a cached plan this similar is served instead of an error
+        self.degraded_similarity = float(os.getenv("PLAN_CACHE_DEGRADED_SIMILARITY", "0.85"))
+        # Final number of fused results that go into the prompt
+        self.top_k = int(os.getenv("RAG_TOP_K", "3"))
+        # Candidates fetched per sub-query before reciprocal-rank fusion
+        self.candidates_per_query = int(os.getenv("RAG_CANDIDATES_PER_QUERY", "5"))
+        self.max_sub_queries = int(os.getenv("RAG_MAX_SUB_QUERIES", "8"))
+        # Weight of the lexical (sparse) rankings relative to the dense ones in hybrid collections
+        self.sparse_weight = float(os.getenv("HYBRID_SPARSE_WEIGHT", "1.0"))
+        # Optional cross-encoder pass over the best RERANK_CANDIDATES fused results before the top_k are kept
+        self.reranker = build_reranker_from_env()
+        self.rerank_candidates = int(os.getenv("RERANK_CANDIDATES", "20"))
+        # Pre-filter retrieval by the request's destination, duration (+/- days) and budget (+ share over trip_price)
+        self.search_filter = os.getenv("RAG_FILTER", "true").lower() == "true"
+        self.duration_tolerance = int(os.getenv("RAG_DURATION_TOLERANCE_DAYS", "2"))
+        self.budget_slack = float(os.getenv("RAG_BUDGET_SLACK", "0.25"))
+        # collection -> (dense vector name, sparse vector name), see vector_names()
+        self._vector_names: Dict[str, Tuple[Optional[str], Optional[str]]] = {}
+        self._vector_names_failed_at: Dict[str, float] = {}
         self.qdrant_host = os.getenv("QDRANT_HOST")
-        self.qdrant = RestQdrantClient(
-            url=self.qdrant_host,
-            timeout=30
-        )
+        self.local_index = build_local_index_from_env()
+        # "qdrant" (local index only as failover) or "local" (serve from the local index by default)
+        self.retrieval_backend = os.getenv("RETRIEVAL_BACKEND", "qdrant").lower()
+        # The local backend runs without Qdrant when QDRANT_HOST is not set
+        self.qdrant = None
+        if self.qdrant_host or self.retrieval_backend != "local":
+            self.qdrant = build_async_qdrant_client_from_env(timeout=30)
+        elif self.local_index is None:
+            raise ValueError("RETRIEVAL_BACKEND=local needs LOCAL_INDEX_DIR (or QDRANT_HOST to search Qdrant)")
         self.system_prompt = SYSTEM_PROMPT
-        self.embedding_model = SentenceTransformer("BAAI/bge-m3")
+        self.embedder = get_embedding_service()
+        self.context_builder = ContextBuilder(
+            load_context_tokenizer(self.embedder.tokenizer), context_budget_for(DEFAULT_MODEL)
+        )
         self.collection_name = "TripPlanData"
+        self.plan_cache = build_plan_cache_from_env()
+        # Re-requests per invalid plan section before it is dropped (or the plan fails, for required sections)
+        self.section_retries = int(os.getenv("LLM_SECTION_RETRIES", "1"))
+        # "single" asks for the whole plan in one completion, "sectioned" fans out one completion per section and day
+        self.generation_mode = os.getenv("PLAN_GENERATION_MODE", "single").lower()
+        self.section_concurrency = int(os.getenv("PLAN_SECTION_CONCURRENCY", "4"))
+        # Longer trips plan runs of consecutive days per prompt, so the fan-out stays bounded
+        self.section_max_day_prompts = max(1, int(os.getenv("PLAN_SECTION_MAX_DAY_PROMPTS", "14")))
+        # Identical concurrent plan/chat requests share one in-flight pipeline run
+        self.single_flight = SingleFlight() if os.getenv("SINGLE_FLIGHT", "true").lower() == "true" else None
+        self.repair_stats = {
+            "plans": 0,
+            "repaired": 0,
+            "section_retries": 0,
+            "sections_fixed": 0,
+            "sections_dropped": 0,
+            "failures": 0,
+            "tokens_saved": 0,
+        }
     
-    async def basic_query(self, user_prompt: str, max_tokens: int = 2048, model: str = "aisingapore/Llama-SEA-LION-v3-70B-IT") -> str:
-        
+    async def warmup(self) -> Dict[str, bool]:
+        """Check the RAG collection and open the LLM connection pool before serving traffic."""
+        checks = {}
+        if self.qdrant is not None:
+            try:
+                info = await self.qdrant.get_collection(self.collection_name)
+                self._vector_names[self.collection_name] = collection_vectors(info)
+                checks["qdrant_collection"] = True
+            except Exception as e:
+                logger.warning("Warmup: Qdrant collection '%s' unavailable: %s", self.collection_name, e)
+                checks["qdrant_collection"] = False
+        if self.local_index is not None:
+            checks["local_index"] = self.local_index.meta.get("collection") == self.collection_name and len(self.local_index) > 0
         try:
-            completion = self.client.chat.completions.create(
-                model=model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": self.system_prompt
-                    },
-                    {
-                        "role": "user",
-                        "content": user_prompt
-                    }
-                ]
-            )
-            return completion.choices[0].message.content
-                
+            # Any cheap authenticated call establishes the TLS connection in the pool
+            await self.client.models.list()
+            checks["llm_pool"] = True
         except Exception as e:
-            print(f"Error calling LLM: {e}")
+            logger.warning("Warmup: LLM endpoint unavailable: %s", e)
+            checks["llm_pool"] = False
+        return checks
+
+    async def aclose(self):
+        if self.qdrant is not None:
+            await self.qdrant.aclose()
+        await self.client.close()
+
+    def _messages(self, user_prompt: str) -> List[Dict[str, str]]:
+        return [
+            {
+                "role": "system",
+                "content": self.system_prompt
+            },
+            {
+                "role": "user",
+                "content": user_prompt
+            }
+        ]
+
+    @property
+    def drafts_enabled(self) -> bool:
+        return self.router.fast_model is not None
+
+    def guard_for(self, model: str) -> LLMGuard:
+        guard = self.guards.get(model)
+        if guard is None:
+            guard = self.guards[model] = build_llm_guard_from_env()
+        return guard
+
+    async def _complete(self, user_prompt: str, model: str = DEFAULT_MODEL) -> Tuple[str, int]:
+        """One chat completion; returns the content and the total tokens it used"""
+        start = time.perf_counter()
+        with span("llm", model=model) as attributes:
+            try:
+                completion = await self.guard_for(model).call(lambda timeout: self.client.chat.completions.create(
+                    model=model,
+                    messages=self._messages(user_prompt),
+                    **self._timeout_kwargs(timeout)
+                ))
+            except Exception:
+                self.router.record_call(model, time.perf_counter() - start, 0, ok=False)
+                raise
+            content = completion.choices[0].message.content or ""
+            usage = getattr(completion, "usage", None)
+            if usage and usage.total_tokens:
+                prompt_tokens, completion_tokens = usage.prompt_tokens, usage.completion_tokens
+            else:
+                prompt_tokens, completion_tokens = self._estimate_tokens(user_prompt), self._estimate_tokens(content)
+            attributes.update(tokens_in=prompt_tokens, tokens_out=completion_tokens)
+        record_tokens(model, prompt_tokens, completion_tokens)
+        self.router.record_call(model, time.perf_counter() - start, prompt_tokens + completion_tokens)
+        return content, prompt_tokens + completion_tokens
+
+    @staticmethod
+    def _timeout_kwargs(timeout: Optional[float]) -> Dict[str, float]:
+        # Only override the client's default timeout when a request deadline applies
+        return {} if timeout is None else {"timeout": timeout}
+
+    @staticmethod
+    def _estimate_tokens(*texts: str) -> int:
+        # ~4 characters per token; only used when the endpoint does not report usage
+        return sum(len(text) for text in texts) // 4
+
+    async def basic_query(self, user_prompt: str, max_tokens: int = 2048, model: Optional[str] = None) -> str:
+        """Chat completion; without an explicit model the router picks one"""
+        if self.single_flight is None:
+            return await self._basic_query(user_prompt, model)
+        key = ("chat", model, hashlib.sha256(user_prompt.encode("utf-8")).hexdigest())
+        return await self.single_flight.do(key, lambda: self._basic_query(user_prompt, model))
+
+    async def _basic_query(self, user_prompt: str, model: Optional[str]) -> str:
+        try:
+            if model is None:
+                routed = self.router.route(user_prompt, "chat").model
+                if routed != DEFAULT_MODEL:
+                    content = await self._fast_chat(user_prompt, routed)
+                    if content is not None:
+                        return content
+            content, _ = await self._complete(user_prompt, model=model or DEFAULT_MODEL)
+            return content
+
+        except LLMUnavailableError:
+            # Surface shed/open-circuit calls so the endpoint can answer 503 instead of a fake reply
+            raise
+        except Exception as e:
+            logger.error("Error calling LLM: %s", e)
             return f"Error: Unable to get LLM response - {str(e)}"
+
+    async def _fast_chat(self, user_prompt: str, model: str) -> Optional[str]:
+        """Answer with the fast model; None when the answer should be escalated to DEFAULT_MODEL"""
+        try:
+            content, _ = await self._complete(user_prompt, model=model)
+        except LLMUnavailableError:
+            reason = "unavailable"
+        except Exception as e:
+            logger.warning("Fast model %s failed, escalating: %s", model, e)
+            reason = "error"
+        else:
+            reason = self.router.should_escalate("chat", content)
+            if reason is None:
+                return content
+        self.router.record_escalation("chat", reason)
+        return None
     
-    async def query_with_rag(self, plan_request: PlanRequest, collection_name: Optional[str] = None) -> 'PlanResponse':
-        """
-        Perform RAG query using PlanRequest, embed query, search Qdrant, and generate complete PlanResponse via LLM
-        """
-        print(plan_request)
+    def _plan_from_cache(self, cached: Dict[str, Any], plan_request: PlanRequest, tier: str) -> PlanResponse:
+        plan_response = PlanResponse.model_validate(cached)
+        plan_response.query_params = plan_request
+        plan_response.meta = {**plan_response.meta, "cache": tier}
+        return plan_response
+
+    def _degraded_plan(self, plan_request: PlanRequest, rag: Optional[Dict[str, Any]]) -> Optional[PlanResponse]:
+        """Closest cached plan for the same destination, duration and group, used while the LLM is unavailable"""
+        if not rag or not rag.get("use_cache") or rag.get("query_embedding") is None:
+            return None
+        cached = self.plan_cache.get_degraded(plan_request, rag["query_embedding"], self.degraded_similarity)
+        return self._plan_from_cache(cached, plan_request, "degraded") if cached is not None else None
+
+    def build_query_text(self, plan_request: PlanRequest) -> str:
+        """Create the retrieval query string from PlanRequest"""
+        destination = plan_request.destination or "unknown destination"
+        duration = plan_request.duration or 1
+        budget = plan_request.trip_price or 0
+
+        query_text = f"Trip from {plan_request.start_place} to {destination}"
+
+        # Add new fields to query
+        if plan_request.travelDates:
+            query_text += f" on {plan_request.travelDates}"
+        if duration:
+            query_text += f" for {duration} days"
+        if budget:
+            query_text += f" with budget {budget}"
+        if plan_request.theme:
+            query_text += f" {plan_request.theme} themed trip"
+        if plan_request.interests:
+            query_text += f" interested in {', '.join(plan_request.interests)}"
+        if plan_request.budgetTier:
+            query_text += f" {plan_request.budgetTier} budget tier"
+        return query_text
+
+    @staticmethod
+    def extract_points(search_results: Any) -> List[Dict[str, Any]]:
+        """Normalize the different Qdrant search response shapes to a list of points"""
+        results = []
+        if 'result' in search_results:
+            if isinstance(search_results['result'], dict) and 'points' in search_results['result']:
+                # New format: {'result': {'points': [...]}}
+                results = search_results['result']['points']
+            else:
+                # Old format: {'result': [...]}
+                results = search_results['result']
+        elif 'points' in search_results:
+            # Direct points key (just in case)
+            results = search_results['points']
+        return results
+
+    async def vector_names(self, collection: str) -> Tuple[Optional[str], Optional[str]]:
+        """(dense, sparse) vector names of a collection, looked up once. While Qdrant cannot be
+        asked, the collection is treated as a single unnamed vector and asked again after 30s."""
+        names = self._vector_names.get(collection)
+        if names is not None:
+            return names
+        if self.qdrant is None:
+            return None, None
+        if time.monotonic() - self._vector_names_failed_at.get(collection, -30.0) < 30.0:
+            return None, None
         try:
-            # 1. Create query string from PlanRequest - updated for new fields
-            destination = plan_request.destination or plan_request.destination_place or "unknown destination"
-            duration = plan_request.duration or plan_request.trip_duration_days or 1
-            budget = plan_request.trip_price or 0
-            
-            query_text = f"Trip from {plan_request.start_place} to {destination}"
-            
-            # Add new fields to query
-            if plan_request.travelDates:
-                query_text += f" on {plan_request.travelDates}"
-            if duration:
-                query_text += f" for {duration} days"
-            if budget:
-                query_text += f" with budget {budget}"
-            if plan_request.theme:
-                query_text += f" {plan_request.theme} themed trip"
-            if plan_request.interests:
-                query_text += f" interested in {', '.join(plan_request.interests)}"
-            if plan_request.budgetTier:
-                query_text += f" {plan_request.budgetTier} budget tier"
-            
-            # 2. Generate embedding for the query
-            query_embedding = self.embedding_model.encode(query_text, normalize_embeddings=True).tolist()
-            
-            # 3. Search Qdrant for similar content
-            collection = collection_name or self.collection_name
-            top_k = self.top_k
-            
-            search_results = self.qdrant.search(
+            names = self._vector_names[collection] = collection_vectors(await self.qdrant.get_collection(collection))
+        except Exception as e:
+            logger.warning("Could not read the vector config of '%s', searching it as dense-only: %s", collection, e)
+            self._vector_names_failed_at[collection] = time.monotonic()
+            return None, None
+        return names
+
+    async def embed_queries(self, texts: List[str], collection: str) -> Tuple[List[List[float]], Optional[List[Dict[int, float]]]]:
+        """Dense query vectors, plus lexical weights from the same forward pass when the collection has a sparse vector"""
+        if self.embedder.sparse_enabled and (await self.vector_names(collection))[1] is not None:
+            return await self.embedder.aencode_hybrid(texts)
+        return await self.embedder.aencode(texts), None
+
+    async def retrieve(self, query_embeddings: List[List[float]], collection: str,
+                       plan_request: Optional[PlanRequest] = None,
+                       query_sparse: Optional[List[Dict[int, float]]] = None,
+                       query_text: Optional[str] = None) -> Tuple[List[RetrievedItem], str]:
+        """Search with every query embedding in one batch request, fuse the rankings with
+        reciprocal-rank fusion and return the retrieved items together with the LLM context text.
+
+        In hybrid collections the lexical queries (`query_sparse`) go into the same batch request
+        against the sparse vector, so exact place names are matched as well.
+
+        With a plan request, Qdrant is asked only for the payload fields the context needs and,
+        unless RAG_FILTER=false, only for points matching its destination, duration and budget.
+        When that leaves fewer than RAG_TOP_K candidates the search is repeated without the filter.
+
+        With the reranker enabled and a `query_text`, the best RERANK_CANDIDATES fused results are
+        re-scored by the cross-encoder and only the top RAG_TOP_K of that order go into the context.
+
+        With RETRIEVAL_BACKEND=local (or without a Qdrant client) the local index mirror serves the dense
+        search, with the same filter; otherwise Qdrant does, failing over to the local index when Qdrant errors."""
+        use_local = self.local_index is not None and self.local_index.meta.get("collection") == collection
+        if use_local and (self.retrieval_backend == "local" or self.qdrant is None):
+            with span("local_search"):
+                result_lists = self._local_search(query_embeddings, plan_request)
+        elif self.qdrant is None:
+            raise RuntimeError(f"Qdrant is not configured and the local index does not mirror '{collection}'")
+        else:
+            try:
+                with span("qdrant_search"):
+                    result_lists = await self._filtered_search(query_embeddings, collection, query_sparse, plan_request)
+            except Exception as e:
+                if not use_local:
+                    raise
+                logger.warning("Qdrant search failed, falling back to local index: %s", e)
+                with span("local_search"):
+                    result_lists = self._local_search(query_embeddings, plan_request)
+        rerank = self.reranker is not None and query_text is not None
+        with span("context_build"):
+            # Dense rankings come first, any lexical ones after them
+            weights = [1.0] * len(query_embeddings) + [self.sparse_weight] * (len(result_lists) - len(query_embeddings))
+            results = reciprocal_rank_fusion(
+                result_lists, limit=max(self.rerank_candidates, self.top_k) if rerank else self.top_k, weights=weights
+            )
+        if rerank and len(results) > 1:
+            with span("rerank") as attributes:
+                results = await self._rerank(query_text, results, plan_request)
+                attributes["reranked"] = "rerank_score" in results[0]
+        with span("context_build"):
+            return self.build_context(results[:self.top_k], plan_request)
+
+    async def _rerank(self, query_text: str, results: List[Dict[str, Any]],
+                      plan_request: Optional[PlanRequest]) -> List[Dict[str, Any]]:
+        """Results in cross-encoder order, scored on the same fields the context will show; the fused
+        order when the rerank budget runs out"""
+        documents = ["\n".join(select_fields(result.get("payload") or {}, plan_request)) for result in results]
+        ranked = await self.reranker.rerank(query_text, documents)
+        if ranked is None:
+            return results
+        return [{**results[i], "rerank_score": score} for i, score in ranked]
+
+    async def _filtered_search(self, query_embeddings: List[List[float]], collection: str,
+                               query_sparse: Optional[List[Dict[int, float]]],
+                               plan_request: Optional[PlanRequest]) -> List[List[Dict[str, Any]]]:
+        if plan_request is None:
+            return await self._search_qdrant(query_embeddings, collection, query_sparse)
+        with_payload = {"include": payload_fields(plan_request)}
+        query_filter = None
+        if self.search_filter:
+            query_filter = build_search_filter(plan_request, self.duration_tolerance, self.budget_slack)
+        result_lists = await self._search_qdrant(query_embeddings, collection, query_sparse, query_filter, with_payload)
+        if query_filter and self._too_few(result_lists):
+            logger.debug("Search filter matched too few points for %s, searching without it", plan_request.destination)
+            result_lists = await self._search_qdrant(query_embeddings, collection, query_sparse, None, with_payload)
+        return result_lists
+
+    def _local_search(self, query_embeddings: List[List[float]],
+                      plan_request: Optional[PlanRequest]) -> List[List[Dict[str, Any]]]:
+        """Dense search of the local index with the request filter and unfiltered fallback of _filtered_search"""
+        query_filter = None
+        if plan_request is not None and self.search_filter:
+            query_filter = build_search_filter(plan_request, self.duration_tolerance, self.budget_slack)
+        result_lists = self.local_index.search_batch(query_embeddings, self.candidates_per_query, query_filter)
+        if query_filter and self._too_few(result_lists):
+            result_lists = self.local_index.search_batch(query_embeddings, self.candidates_per_query)
+        return result_lists
+
+    def _too_few(self, result_lists: List[List[Dict[str, Any]]]) -> bool:
+        return len({point["id"] for results in result_lists for point in results}) < self.top_k
+
+    async def _search_qdrant(self, query_embeddings: List[List[float]], collection: str,
+                             query_sparse: Optional[List[Dict[int, float]]] = None,
+                             query_filter: Optional[Dict[str, Any]] = None,
+                             with_payload: Any = True) -> List[List[Dict[str, Any]]]:
+        dense_name, sparse_name = await self.vector_names(collection)
+        if dense_name is not None:
+            searches = hybrid_searches(query_embeddings, query_sparse if sparse_name else [], self.candidates_per_query,
+                                       query_filter, with_payload)
+            result_lists = await self.qdrant.search_batch(collection_name=collection, searches=searches, timeout=30)
+            return split_hybrid_results(result_lists, len(query_embeddings))
+        if len(query_embeddings) == 1:
+            result_lists = [self.extract_points(await self.qdrant.search(
+                collection_name=collection,
+                query_vector=query_embeddings[0],
+                limit=self.candidates_per_query,
+                with_payload=with_payload,
+                timeout=30,
+                query_filter=query_filter
+            ))]
+        else:
+            search = {"limit": self.candidates_per_query, "with_payload": with_payload}
+            if query_filter:
+                search["filter"] = query_filter
+            result_lists = await self.qdrant.search_batch(
                 collection_name=collection,
-                query_vector=query_embedding,
-                limit=top_k,
-                with_payload=True,
+                searches=[{"vector": embedding, **search} for embedding in query_embeddings],
                 timeout=30
             )
-            
-            # 4. Convert search results to RetrievedItem format
-            retrieved_data = []
-            context_text = ""
-
-            results = []
-            if 'result' in search_results:
-                if isinstance(search_results['result'], dict) and 'points' in search_results['result']:
-                    # New format: {'result': {'points': [...]}}
-                    results = search_results['result']['points']
-                else:
-                    # Old format: {'result': [...]}
-                    results = search_results['result']
-            elif 'points' in search_results:
-                # Direct points key (just in case)
-                results = search_results['points']
-
-            for result in results:
-                place_id = result.get('id') or result.get('point_id', 'Unknown')
-                payload = result.get('payload', {})
-                retrieved_item = RetrievedItem(
-                    place_id=place_id,
-                    place_name=payload.get("place_name") or payload.get("name", "Unknown"),
-                    score=result.get('score', 0.0),
-                )
-                retrieved_data.append(retrieved_item)
-                visited_places = ""
-                if isinstance(payload.get('visited_place'), list):
-                    visited_places = "Visited: " + ", ".join(
-                        [
-                            f"{p.get('name', '')} (lat: {p.get('latitude', '')}, lon: {p.get('longitude', '')})"
-                            for p in payload.get('visited_place', [])
-                        ]
-                    )
-                    
-                # Build context from all relevant fields in payload
-                context_fields = [
-                    payload.get("name", ""),
-                    f"Start: {payload.get('start_place', {}).get('name', '')}" if isinstance(payload.get('start_place'), dict) else "",
-                    f"Destination: {payload.get('destination_place', {}).get('name', '')}" if isinstance(payload.get('destination_place'), dict) else "",
-                    f"Country: {payload.get('country', '')}",
-                    visited_places,
-                    f"Duration: {payload.get('duration', '')} days" if payload.get('duration') else "",
-                    f"Budget: {payload.get('budget', '')} THB" if payload.get('budget') else "",
-                    f"Transportation: {payload.get('transportation', '')}",
-                    f"Accommodation: {payload.get('accommodation', '')}",
-                    f"Safety: {payload.get('safety', '')}",
-                    f"Theme: {payload.get('theme', '')}",
-                    f"Plan details: {payload.get('plan_details', '')}",
-                    f"Source: {payload.get('source', '')}",
-                    payload.get("text", ""),  # fallback for generic text field
-                ]
-                # Filter out empty strings and join with newlines
-                context_text += "\n" + "\n".join([field for field in context_fields if field])
-
-            print(context_text)
-            # 5. Create detailed prompt for LLM - updated with new fields
-            llm_prompt = f"""Generate a travel plan in JSON format for:
-            From: {plan_request.start_place} → To: {destination}
+        return result_lists
+
+    def build_context(self, results: List[Dict[str, Any]],
+                      plan_request: Optional[PlanRequest] = None) -> Tuple[List[RetrievedItem], str]:
+        """Convert search results to RetrievedItem format and context text within the context token budget"""
+        retrieved_data = []
+        for result in results:
+            place_id = result.get('id') or result.get('point_id', 'Unknown')
+            payload = result.get('payload', {})
+            retrieved_item = RetrievedItem(
+                place_id=str(place_id),
+                place_name=payload.get("place_name") or payload.get("name", "Unknown"),
+                # Report the raw similarity rather than the fused rank score
+                score=result.get('vector_score', result.get('score', 0.0)),
+            )
+            retrieved_data.append(retrieved_item)
+
+        context_text, context_tokens = self.context_builder.build(results, plan_request)
+        logger.debug("Context (%d/%d tokens): %s", context_tokens, self.context_builder.token_budget, context_text)
+        return retrieved_data, context_text
+
+    def _plan_brief(self, plan_request: PlanRequest, context_text: str) -> str:
+        """Trip parameters and retrieved context shared by the full-plan and sectioned prompts"""
+        destination = plan_request.destination or "unknown destination"
+        duration = plan_request.duration or 1
+        budget = plan_request.trip_price or 0
+        return f"""            From: {plan_request.start_place} → To: {destination}
             Duration: {duration} days | Budget: {budget} ({plan_request.budgetTier or 'Mid-range'})
             Group: {plan_request.groupSize} people | Theme: {plan_request.theme or 'General'}
             Interests: {', '.join(plan_request.interests) if plan_request.interests else 'Sightseeing'}
@@ -165,7 +516,14 @@ class LLMCaller:
             Dates: {plan_request.travelDates or 'Flexible'}
             *Provide a latitude and longitude for each place in timeline and spots.*.
 
-            Context: {context_text[:4000]}{"..." if len(context_text) > 4000 else ""}
+            Context: {context_text}"""
+
+    def build_plan_prompt(self, plan_request: PlanRequest, context_text: str) -> str:
+        """Create detailed prompt for LLM - updated with new fields"""
+        destination = plan_request.destination or "unknown destination"
+        duration = plan_request.duration or 1
+        return f"""Generate a travel plan in JSON format for:
+{self._plan_brief(plan_request, context_text)}
 
             Return ONLY this JSON structure:
             {{
@@ -205,165 +563,470 @@ class LLMCaller:
             Create preparation checklist based on destination, theme ({plan_request.theme or 'general'}), duration ({duration} days), and group size ({plan_request.groupSize} people).
             Include destination-specific requirements, climate considerations, and activity-specific gear.
             """
-            
-            # 6. Call LLM to generate structured trip plan
-            llm_response = await self.basic_query(user_prompt=llm_prompt, max_tokens=24048)
-            print(f"LLM Response: {llm_response}")
-            
-            # 7. Parse LLM response as JSON
+
+    @staticmethod
+    def load_llm_json(llm_response: str) -> Dict[str, Any]:
+        """Extract the outermost JSON object from the response, repairing common defects"""
+        return loads_tolerant(llm_response)[0]
+
+    @staticmethod
+    def _get_path(data: Dict[str, Any], path: tuple) -> Any:
+        for key in path:
+            if not isinstance(data, dict) or key not in data:
+                return None
+            data = data[key]
+        return data
+
+    @staticmethod
+    def _set_path(data: Dict[str, Any], path: tuple, value: Any):
+        for key in path[:-1]:
+            if not isinstance(data.get(key), dict):
+                data[key] = {}
+            data = data[key]
+        if value is None:
+            data.pop(path[-1], None)
+        else:
+            data[path[-1]] = value
+
+    def validate_sections(self, llm_data: Dict[str, Any]) -> Dict[str, str]:
+        """Validate each plan section against its schema; returns the invalid ones with their errors"""
+        invalid = {}
+        for name, (path, schema, required) in PLAN_SECTIONS.items():
+            value = self._get_path(llm_data, path)
+            if value is None or value == "":
+                if required:
+                    invalid[name] = "section is missing"
+                continue
             try:
-                # Clean the response and parse JSON
-                json_str = llm_response.strip()
-                if json_str.startswith("```json"):
-                    json_str = json_str[7:]
-                if json_str.endswith("```"):
-                    json_str = json_str[:-3]
-                
-                llm_data = json.loads(json_str)
-                print(f"LLM Data: {llm_data}")
-                
-                # Convert to PlanResponse structure
-                trip_plan_data = llm_data.get("trip_plan", {})
-
-                # Parse timeline
-                timeline_data = trip_plan_data.get("timeline", [])
-                timeline = []
-                for day_entry in timeline_data:
-                    if isinstance(day_entry, dict) and "day" in day_entry and "activities" in day_entry:
-                        activities = []
-                        for activity in day_entry["activities"]:
-                            if isinstance(activity, dict) and "t" in activity and "detail" in activity:
-                                activities.append(TimelineEntry(t=activity["t"], detail=activity["detail"]))
-                        
-                        day_timeline = DayTimeline(day=day_entry["day"], activities=activities)
-                        timeline.append(day_timeline)
-
-                # Parse spots
-                spots_data = trip_plan_data.get("spots", [])
-                spots = [Spot(name=item["name"], latitude=item.get("latitude"), longitude=item.get("longitude"), time=item["time"], notes=item["notes"]) for item in spots_data]
-
-                # Parse budget
-                budget_data = trip_plan_data.get("budget", {})
-                budget = Budget(
-                    transport=budget_data.get("transport"),
-                    entrance=budget_data.get("entrance"),
-                    meals=budget_data.get("meals"),
-                    accommodation=budget_data.get("accommodation"),
-                    activities=budget_data.get("activities"),
-                    total=budget_data.get("total")
-                )
+                schema.validate_python(value)
+            except ValidationError as e:
+                invalid[name] = str(e)[:500]
+        return invalid
 
-                # Parse permits
-                permits_data = trip_plan_data.get("permits", {})
-                permits = Permits(
-                    needed=permits_data.get("needed", False),
-                    notes=permits_data.get("notes", ""),
-                    seasonal=permits_data.get("seasonal", "")
-                ) if permits_data else None
-
-                # Parse safety
-                safety_data = trip_plan_data.get("safety", {})
-                safety = None
-                if safety_data:
-                    contacts_data = safety_data.get("contacts", {})
-                    contacts = SafetyContacts(
-                        ranger=Contact(**contacts_data["ranger"]) if contacts_data.get("ranger") else None,
-                        hospital=Contact(**contacts_data["hospital"]) if contacts_data.get("hospital") else None,
-                        police=Contact(**contacts_data["police"]) if contacts_data.get("police") else None
-                    )
-                    safety = Safety(
-                        registration=safety_data.get("registration", ""),
-                        checkins=safety_data.get("checkins", ""),
-                        sos=safety_data.get("sos", ""),
-                        contacts=contacts
-                    )
-                
-                preparation_data = llm_data.get("preparation", {})
-                preparation = None
-                if preparation_data:
-                    prep_items = []
-                    for item_data in preparation_data.get("items", []):
-                        prep_item = PreparationItem(
-                            category=item_data.get("category", ""),
-                            items=item_data.get("items", []),
-                            notes=item_data.get("notes", "")
-                        )
-                        prep_items.append(prep_item)
-                    
-                    preparation = Preparation(
-                        overview=preparation_data.get("overview", ""),
-                        items=prep_items,
-                        timeline=preparation_data.get("timeline", "")
-                    )
-
-                trip_plan = TripPlan(
-                    title=trip_plan_data.get("title", ""),
-                    date=trip_plan_data.get("date", ""),
-                    timeline=timeline,
-                    spots=spots,
-                    budget=budget,
-                    permits=permits,
-                    safety=safety
-                )
+    def build_section_prompt(self, name: str, plan_request: PlanRequest, previous: Any, error: str) -> str:
+        return f"""The "{name}" section of a travel plan you generated is invalid: {error}
 
-                return PlanResponse(
-                    tripOverview=llm_data.get("tripOverview", ""),
-                    query_params=plan_request,
-                    retrieved_data=retrieved_data,
-                    trip_plan=trip_plan,
-                    preparation=preparation,  # Add this line
-                    meta={
-                        "status": "success",
-                        "query_text": query_text,
-                        "results_count": len(retrieved_data),
-                        "theme": plan_request.theme,
-                        "interests": plan_request.interests,
-                        "budget_tier": plan_request.budgetTier,
-                        "group_size": plan_request.groupSize
-                    }
-                )
-                
+            Trip: {plan_request.start_place} → {plan_request.destination or 'unknown destination'}, {plan_request.duration or 1} days
+            Budget: {plan_request.trip_price or 0} ({plan_request.budgetTier or 'Mid-range'}) | Group: {plan_request.groupSize} people
+            Theme: {plan_request.theme or 'General'} | Interests: {', '.join(plan_request.interests) if plan_request.interests else 'Sightseeing'}
+
+            Previous value: {json.dumps(previous, ensure_ascii=False)[:1500]}
+
+            Return ONLY this JSON object with the section corrected:
+            {{"{name}": {SECTION_TEMPLATES[name]}}}
+            """
+
+    async def _repair_section(self, name: str, llm_data: Dict[str, Any], error: str,
+                              plan_request: PlanRequest, model: str = DEFAULT_MODEL) -> Tuple[bool, int]:
+        """Re-request a single section; returns whether it was fixed and the tokens spent"""
+        path, schema, _ = PLAN_SECTIONS[name]
+        tokens = 0
+        for _ in range(self.section_retries):
+            self.repair_stats["section_retries"] += 1
+            prompt = self.build_section_prompt(name, plan_request, self._get_path(llm_data, path), error)
+            try:
+                content, used = await self._complete(prompt, model=model)
+                tokens += used
+                value = loads_tolerant(content)[0].get(name)
+                value = schema.validate_python(value)
+            except (json.JSONDecodeError, ValidationError) as e:
+                error = str(e)[:500]
+                continue
+            self._set_path(llm_data, path, schema.dump_python(value, exclude_none=True))
+            return True, tokens
+        return False, tokens
+
+    async def finalize_llm_json(self, llm_response: str, usage_tokens: int, plan_request: PlanRequest,
+                                model: str = DEFAULT_MODEL) -> Dict[str, Any]:
+        """Parse and validate a full plan response.
+
+        Syntax defects are repaired locally; sections that fail their schema are re-requested
+        on their own (from `model`) instead of regenerating the whole plan. Optional sections
+        that stay invalid are dropped, required ones raise PlanParseError.
+        """
+        self.repair_stats["plans"] += 1
+        with span("json_parse"):
+            try:
+                llm_data, repaired = loads_tolerant(llm_response)
             except json.JSONDecodeError as e:
-                print(f"Error parsing LLM JSON response: {e}")
-                print(f"LLM Response: {llm_response}")
-                
-                fallback_budget = Budget(
-                    transport=0.0,
-                    entrance=0.0,
-                    meals=0.0,
-                    accommodation=0.0,
-                    activities=0.0,
-                    total=0.0
-                )
-                
-            return PlanResponse(
-                tripOverview=llm_response[:500] + "..." if len(llm_response) > 500 else llm_response,
-                query_params=plan_request,
-                retrieved_data=retrieved_data,
-                trip_plan=TripPlan(
-                    title="Error occurred",
-                    date="",
-                    timeline=[],
-                    spots=[],
-                    budget=fallback_budget,
-                    permits=None,
-                    safety=None
-                ),
-                preparation=None,  # Add this line
-                meta={"status": "error", "error": str(e)}
+                self.repair_stats["failures"] += 1
+                raise PlanParseError(f"LLM response is not valid JSON: {e}") from e
+            if repaired:
+                self.repair_stats["repaired"] += 1
+
+            invalid = self.validate_sections(llm_data)
+        if not invalid:
+            if repaired:
+                self.repair_stats["tokens_saved"] += usage_tokens
+            return llm_data
+
+        logger.info("Re-requesting invalid plan sections: %s", list(invalid))
+        results = await asyncio.gather(*(
+            self._repair_section(name, llm_data, error, plan_request, model) for name, error in invalid.items()
+        ))
+        for name, (fixed, _) in zip(invalid, results):
+            if fixed:
+                self.repair_stats["sections_fixed"] += 1
+            elif PLAN_SECTIONS[name][2]:
+                self.repair_stats["failures"] += 1
+                raise PlanParseError(f"Plan section '{name}' is still invalid after {self.section_retries} re-request(s)")
+            else:
+                self.repair_stats["sections_dropped"] += 1
+                self._set_path(llm_data, PLAN_SECTIONS[name][0], None)
+        # Compared with the full regeneration the endpoint used to fall back to
+        self.repair_stats["tokens_saved"] += max(usage_tokens - sum(tokens for _, tokens in results), 0)
+        return llm_data
+
+    def get_repair_stats(self) -> Dict[str, Any]:
+        stats = dict(self.repair_stats)
+        plans = stats["plans"]
+        stats["repair_rate"] = round(stats["repaired"] / plans, 4) if plans else 0.0
+        stats["section_retry_rate"] = round(stats["section_retries"] / plans, 4) if plans else 0.0
+        stats["failure_rate"] = round(stats["failures"] / plans, 4) if plans else 0.0
+        return stats
+
+    @staticmethod
+    def parse_day_timeline(day_entry: Any) -> Optional[DayTimeline]:
+        if not (isinstance(day_entry, dict) and "day" in day_entry and "activities" in day_entry):
+            return None
+        activities = []
+        for activity in day_entry["activities"]:
+            if isinstance(activity, dict) and "t" in activity and "detail" in activity:
+                activities.append(TimelineEntry(t=activity["t"], detail=activity["detail"]))
+        return DayTimeline(day=day_entry["day"], activities=activities)
+
+    @staticmethod
+    def parse_spot(item: Dict[str, Any]) -> Spot:
+        return Spot(name=item["name"], latitude=item.get("latitude"), longitude=item.get("longitude"), time=item["time"], notes=item["notes"])
+
+    @staticmethod
+    def parse_budget(budget_data: Dict[str, Any]) -> Budget:
+        return Budget(
+            transport=budget_data.get("transport"),
+            entrance=budget_data.get("entrance"),
+            meals=budget_data.get("meals"),
+            accommodation=budget_data.get("accommodation"),
+            activities=budget_data.get("activities"),
+            total=budget_data.get("total")
+        )
+
+    @staticmethod
+    def parse_preparation(preparation_data: Dict[str, Any]) -> Optional[Preparation]:
+        if not preparation_data:
+            return None
+        prep_items = []
+        for item_data in preparation_data.get("items", []):
+            prep_item = PreparationItem(
+                category=item_data.get("category", ""),
+                items=item_data.get("items", []),
+                notes=item_data.get("notes", "")
             )
-            
-        except Exception as e:
-            print(f"Error in RAG query: {e}")
-            
-            fallback_budget = Budget(
-                transport=0.0,
-                entrance=0.0,
-                meals=0.0,
-                accommodation=0.0,
-                activities=0.0,
-                total=0.0
+            prep_items.append(prep_item)
+
+        return Preparation(
+            overview=preparation_data.get("overview", ""),
+            items=prep_items,
+            timeline=preparation_data.get("timeline", "")
+        )
+
+    def parse_trip_plan(self, trip_plan_data: Dict[str, Any]) -> TripPlan:
+        # Parse timeline
+        timeline = []
+        for day_entry in trip_plan_data.get("timeline", []):
+            day_timeline = self.parse_day_timeline(day_entry)
+            if day_timeline is not None:
+                timeline.append(day_timeline)
+
+        # Parse spots
+        spots = [self.parse_spot(item) for item in trip_plan_data.get("spots", [])]
+
+        # Parse budget
+        budget = self.parse_budget(trip_plan_data.get("budget", {}))
+
+        # Parse permits
+        permits_data = trip_plan_data.get("permits", {})
+        permits = Permits(
+            needed=permits_data.get("needed", False),
+            notes=permits_data.get("notes", ""),
+            seasonal=permits_data.get("seasonal", "")
+        ) if permits_data else None
+
+        # Parse safety
+        safety_data = trip_plan_data.get("safety", {})
+        safety = None
+        if safety_data:
+            contacts_data = safety_data.get("contacts", {})
+            contacts = SafetyContacts(
+                ranger=Contact(**contacts_data["ranger"]) if contacts_data.get("ranger") else None,
+                hospital=Contact(**contacts_data["hospital"]) if contacts_data.get("hospital") else None,
+                police=Contact(**contacts_data["police"]) if contacts_data.get("police") else None
+            )
+            safety = Safety(
+                registration=safety_data.get("registration", ""),
+                checkins=safety_data.get("checkins", ""),
+                sos=safety_data.get("sos", ""),
+                contacts=contacts
             )
+
+        return TripPlan(
+            title=trip_plan_data.get("title", ""),
+            date=trip_plan_data.get("date", ""),
+            timeline=timeline,
+            spots=spots,
+            budget=budget,
+            permits=permits,
+            safety=safety
+        )
+
+    def build_plan_response(self, llm_data: Dict[str, Any], plan_request: PlanRequest,
+                            retrieved_data: List[RetrievedItem], query_text: str) -> PlanResponse:
+        """Convert parsed LLM JSON to PlanResponse structure"""
+        return PlanResponse(
+            tripOverview=llm_data.get("tripOverview", ""),
+            query_params=plan_request,
+            retrieved_data=retrieved_data,
+            trip_plan=self.parse_trip_plan(llm_data.get("trip_plan", {})),
+            preparation=self.parse_preparation(llm_data.get("preparation", {})),
+            meta={
+                "status": "success",
+                "query_text": query_text,
+                "results_count": len(retrieved_data),
+                "theme": plan_request.theme,
+                "interests": plan_request.interests,
+                "budget_tier": plan_request.budgetTier,
+                "group_size": plan_request.groupSize
+            }
+        )
+
+    def build_section_jobs(self, plan_request: PlanRequest, context_text: str) -> List[Tuple[str, str, Dict[str, TypeAdapter]]]:
+        """Independent sub-prompts for sectioned generation: (name, prompt, fields the answer must contain)"""
+        brief = self._plan_brief(plan_request, context_text)
+        duration = plan_request.duration or 1
+
+        def prompt(task: str, template: str) -> str:
+            return f"""{task}
+{brief}
+
+            Return ONLY this JSON object:
+            {template}
+            """
+
+        jobs = [
+            ("overview", prompt("Write the overview of this trip in JSON format:", OVERVIEW_TEMPLATE),
+             {"tripOverview": PLAN_SECTIONS["tripOverview"][1], "title": TypeAdapter(str), "date": TypeAdapter(str)}),
+        ]
+        for first, last in day_ranges(duration, self.section_max_day_prompts):
+            if first == last:
+                jobs.append((f"day:{first}", prompt(
+                    f"Plan day {first} of this {duration}-day trip in JSON format. {self._day_focus(plan_request, first, last, duration)}",
+                    DAY_TEMPLATE.format(day=first)
+                ), {"activities": TypeAdapter(List[TimelineEntry])}))
+            else:
+                jobs.append((f"days:{first}-{last}", prompt(
+                    f"Plan days {first} to {last} of this {duration}-day trip in JSON format, one timeline entry per day. "
+                    f"{self._day_focus(plan_request, first, last, duration)}",
+                    f'{{"timeline": [{DAY_TEMPLATE.format(day=first)}, ..., {DAY_TEMPLATE.format(day=last)}]}}'
+                ), {"timeline": TypeAdapter(List[DayTimeline])}))
+        jobs.append(("spots", prompt(
+            f"List the points of interest to visit over all {duration} days of this trip in JSON format:",
+            f'{{"spots": {SECTION_TEMPLATES["spots"]}}}'
+        ), {"spots": PLAN_SECTIONS["spots"][1]}))
+        jobs.append(("logistics", prompt(
+            "Estimate the budget and describe permits and safety for this trip in JSON format:",
+            f'{{"budget": {SECTION_TEMPLATES["budget"]}, "permits": {SECTION_TEMPLATES["permits"]}, "safety": {SECTION_TEMPLATES["safety"]}}}'
+        ), {name: PLAN_SECTIONS[name][1] for name in ("budget", "permits", "safety")}))
+        jobs.append(("preparation", prompt(
+            f"Create the preparation checklist for this trip in JSON format, based on the destination, theme "
+            f"({plan_request.theme or 'general'}), duration ({duration} days) and group size ({plan_request.groupSize} people). "
+            "Include destination-specific requirements, climate considerations, and activity-specific gear.",
+            f'{{"preparation": {SECTION_TEMPLATES["preparation"]}}}'
+        ), {"preparation": PLAN_SECTIONS["preparation"][1]}))
+        return jobs
+
+    @staticmethod
+    def _day_focus(plan_request: PlanRequest, first: int, last: int, duration: int) -> str:
+        """Hint that keeps independently generated days (days first..last) from repeating each other"""
+        hints = []
+        if first == 1:
+            hints.append(f"Day 1 starts with the journey from {plan_request.start_place}.")
+        if last == duration and duration > 1:
+            hints.append(f"Day {duration} is the last day, so end with the trip home.")
+        if plan_request.interests:
+            interests = plan_request.interests
+            focus = list(dict.fromkeys(interests[(day - 1) % len(interests)] for day in range(first, last + 1)))
+            hints.append(f"Focus {'this day' if first == last else 'these days'} on {', '.join(focus)}.")
+        hints.append("Do not repeat places that suit other days of the trip.")
+        return " ".join(hints)
+
+    async def _generate_section(self, semaphore: asyncio.Semaphore, name: str, prompt: str,
+                                fields: Dict[str, TypeAdapter]) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """Run one sub-prompt and validate its fields, re-requesting it up to section_retries times.
+        Short prompts start on the fast model; once it fails, re-requests go to DEFAULT_MODEL."""
+        model = self.router.route(prompt, "plan_section").model
+        for attempt in range(1 + self.section_retries):
+            if attempt:
+                self.repair_stats["section_retries"] += 1
+            try:
+                async with semaphore:
+                    content, _ = await self._complete(prompt, model=model)
+                with span("json_parse"):
+                    data = loads_tolerant(content)[0]
+                    return name, {
+                        field: schema.dump_python(schema.validate_python(data.get(field)), exclude_none=True)
+                        for field, schema in fields.items()
+                    }
+            except LLMUnavailableError:
+                if model == DEFAULT_MODEL:
+                    raise
+                reason = "unavailable"
+            except (json.JSONDecodeError, ValidationError) as e:
+                logger.warning("Sectioned generation: '%s' attempt %d is invalid: %s", name, attempt + 1, e)
+                reason = "invalid_output"
+            if model != DEFAULT_MODEL:
+                self.router.record_escalation("plan_section", reason)
+                model = DEFAULT_MODEL
+        return name, None
+
+    async def generate_sectioned(self, plan_request: PlanRequest, context_text: str) -> Dict[str, Any]:
+        """Generate the plan as concurrent sub-prompts (overview, one per day, spots, budget/permits/safety,
+        preparation) and merge them into the same dict shape as a single-completion plan.
+
+        At most section_concurrency completions run at once, so wall-clock time stays flat
+        as the duration grows until the fan-out limit is reached. Beyond section_max_day_prompts
+        days, each day prompt covers a run of consecutive days, so a request never makes more
+        than section_max_day_prompts + 4 sub-prompts."""
+        self.repair_stats["plans"] += 1
+        semaphore = asyncio.Semaphore(self.section_concurrency)
+        jobs = self.build_section_jobs(plan_request, context_text)
+        results = dict(await asyncio.gather(*(self._generate_section(semaphore, *job) for job in jobs)))
+
+        overview = results.pop("overview")
+        timeline = {}
+        for name, result in results.items():
+            if result is None:
+                continue
+            if name.startswith("day:"):
+                day = int(name.split(":")[1])
+                timeline[day] = {"day": day, **result}
+            elif name.startswith("days:"):
+                first, last = map(int, name.split(":")[1].split("-"))
+                for entry in result["timeline"]:
+                    if first <= entry["day"] <= last:
+                        timeline.setdefault(entry["day"], entry)
+        timeline = [timeline[day] for day in sorted(timeline)]
+        if overview is None or not timeline:
+            self.repair_stats["failures"] += 1
+            raise PlanParseError("Sectioned generation failed for the overview or every day of the timeline")
+        for name, result in results.items():
+            if result is None:
+                self.repair_stats["sections_dropped"] += 1
+
+        logistics = results["logistics"] or {}
+        return {
+            "tripOverview": overview["tripOverview"],
+            "preparation": (results["preparation"] or {}).get("preparation"),
+            "trip_plan": {
+                "title": overview["title"],
+                "date": overview["date"],
+                "timeline": timeline,
+                "spots": (results["spots"] or {}).get("spots", []),
+                **{name: value for name, value in logistics.items() if value is not None},
+            },
+        }
+
+    async def _prepare_rag(self, plan_request: PlanRequest, collection_name: Optional[str]) -> Dict[str, Any]:
+        """Embed, check the cache and retrieve context; returns either a cached plan or everything needed to prompt"""
+        # Cached plans are only valid for the default collection they were generated from
+        use_cache = self.plan_cache is not None and collection_name is None
+        if use_cache:
+            with span("cache_lookup"):
+                cached = self.plan_cache.get_exact(plan_request)
+            if cached is not None:
+                return {"cached": self._plan_from_cache(cached, plan_request, "exact")}
+
+        # 1. Create query string from PlanRequest
+        with span("query_build"):
+            query_text = self.build_query_text(plan_request)
+            sub_queries = build_sub_queries(plan_request, max_queries=self.max_sub_queries)
+
+        # 2. Embed the full query and the focused sub-queries in one batched encode
+        collection = collection_name or self.collection_name
+        with span("embedding"):
+            query_embeddings, query_sparse = await self.embed_queries([query_text] + sub_queries, collection)
+        query_embedding = query_embeddings[0]
+        if use_cache:
+            with span("cache_lookup"):
+                cached = self.plan_cache.get_semantic(plan_request, query_embedding)
+            if cached is not None:
+                return {"cached": self._plan_from_cache(cached, plan_request, "semantic")}
+
+        # 3. Search Qdrant for similar content
+        retrieved_data, context_text = await self.retrieve(
+            query_embeddings, collection, plan_request, query_sparse, query_text=query_text
+        )
+
+        return {
+            "cached": None,
+            "use_cache": use_cache,
+            "query_text": query_text,
+            "query_embedding": query_embedding,
+            "retrieved_data": retrieved_data,
+            "context_text": context_text,
+            "prompt": self.build_plan_prompt(plan_request, context_text),
+        }
+
+    async def query_with_rag(self, plan_request: PlanRequest, collection_name: Optional[str] = None) -> 'PlanResponse':
+        """
+        Perform RAG query using PlanRequest, embed query, search Qdrant, and generate complete PlanResponse via LLM
+        """
+        if self.single_flight is None:
+            return await self._query_with_rag(plan_request, collection_name)
+        key = ("plan", request_key(plan_request), collection_name)
+        return await self.single_flight.do(key, lambda: self._query_with_rag(plan_request, collection_name))
+
+    async def _query_with_rag(self, plan_request: PlanRequest, collection_name: Optional[str]) -> 'PlanResponse':
+        logger.debug("Plan request: %s", plan_request)
+        rag = None
+        try:
+            rag = await self._prepare_rag(plan_request, collection_name)
+            if rag["cached"] is not None:
+                return rag["cached"]
+
+            if self.generation_mode == "sectioned":
+                llm_data = await self.generate_sectioned(plan_request, rag["context_text"])
+            else:
+                # Call LLM to generate structured trip plan
+                model = self.router.route(rag["prompt"], "plan").model
+                llm_response, usage_tokens = await self._complete(rag["prompt"], model=model)
+                logger.debug("LLM response: %s", llm_response)
+
+                # Parse LLM response as JSON, repairing it and re-requesting only invalid sections
+                llm_data = await self.finalize_llm_json(llm_response, usage_tokens, plan_request, model)
+            logger.debug("LLM data: %s", llm_data)
+
+            with span("pydantic_build"):
+                plan_response = self.build_plan_response(llm_data, plan_request, rag["retrieved_data"], rag["query_text"])
+            if rag["use_cache"]:
+                self.plan_cache.put(plan_request, rag["query_embedding"], plan_response.model_dump())
+            return plan_response
+
+        except LLMUnavailableError as e:
+            degraded = self._degraded_plan(plan_request, rag)
+            if degraded is not None:
+                return degraded
+            logger.warning("LLM unavailable: %s", e)
+            raise HTTPException(
+                status_code=503,
+                detail={
+                    "error": "LLM unavailable",
+                    "message": str(e),
+                    "details": "The planning model is overloaded or unreachable. Please retry later."
+                },
+                headers={"Retry-After": str(max(1, round(e.retry_after)))}
+            )
+
+        except Exception as e:
+            logger.error("Error in RAG query: %s", e)
             raise HTTPException(
                 status_code=500,
                 detail={
@@ -373,5 +1036,113 @@ class LLMCaller:
                 }
             )
 
-            
+    async def draft_with_rag(self, plan_request: PlanRequest) -> 'PlanResponse':
+        """
+        Plan from the fast model for draft-then-refine: returned right away while the full plan is
+        generated separately. Drafts are never cached; PlanParseError or LLMUnavailableError
+        mean no draft could be produced, DraftUnavailableError that routing has no fast model.
+        """
+        if not self.drafts_enabled:
+            # The strong model would generate the same plan twice, racing the refine job
+            raise DraftUnavailableError("Draft plans need MODEL_ROUTING=true and an LLM_FAST_MODEL other than the strong model")
+        rag = await self._prepare_rag(plan_request, None)
+        if rag["cached"] is not None:
+            return rag["cached"]
+
+        model = self.router.route(rag["prompt"], "draft").model
+        llm_response, usage_tokens = await self._complete(rag["prompt"], model=model)
+        llm_data = await self.finalize_llm_json(llm_response, usage_tokens, plan_request, model)
+        with span("pydantic_build"):
+            plan_response = self.build_plan_response(llm_data, plan_request, rag["retrieved_data"], rag["query_text"])
+        plan_response.meta = {**plan_response.meta, "draft": True, "model": model}
+        return plan_response
+
+    async def stream_with_rag(self, plan_request: PlanRequest, collection_name: Optional[str] = None) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Streaming variant of query_with_rag. Yields (event, data) pairs as soon as each section of
+        the plan is complete in the LLM output, and finally ("plan", PlanResponse) for the full result.
+        """
+        rag = await self._prepare_rag(plan_request, collection_name)
+        if rag["cached"] is not None:
+            yield "plan", rag["cached"].model_dump()
+            return
+
+        yield "retrieved", {"retrieved_data": [item.model_dump() for item in rag["retrieved_data"]]}
+
+        parser = IncrementalJSONParser(STREAMED_SECTIONS)
+        chunks = []
+        model = self.router.route(rag["prompt"], "plan").model
+        start = time.perf_counter()
+        # Streaming separates prefill (time to the first token) from decode
+        first_token_at = None
+        try:
+            # The guard spans the whole stream: the concurrency slot is held until the last chunk, and
+            # the full latency or an overload error part-way through reaches the limiter and breaker
+            async with self.guard_for(model).session() as timeout:
+                stream = await self.client.chat.completions.create(
+                    model=model,
+                    messages=self._messages(rag["prompt"]),
+                    stream=True,
+                    **self._timeout_kwargs(timeout)
+                )
+                async for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if not delta:
+                        continue
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                        record_stage("llm_prefill", first_token_at - start)
+                    chunks.append(delta)
+                    for path, value in parser.feed(delta):
+                        event = self._section_event(path, value)
+                        if event is not None:
+                            yield event
+        except LLMUnavailableError as e:
+            self.router.record_call(model, time.perf_counter() - start, 0, ok=False)
+            degraded = self._degraded_plan(plan_request, rag)
+            if degraded is not None:
+                yield "plan", degraded.model_dump()
+            else:
+                yield "error", {"error": "LLM unavailable", "message": str(e), "retry_after": e.retry_after}
+            return
 
+        llm_response = "".join(chunks)
+        end = time.perf_counter()
+        record_stage("llm_decode", end - (first_token_at or end))
+        prompt_tokens, completion_tokens = self._estimate_tokens(rag["prompt"]), self._estimate_tokens(llm_response)
+        usage_tokens = prompt_tokens + completion_tokens
+        record_tokens(model, prompt_tokens, completion_tokens)
+        self.router.record_call(model, end - start, usage_tokens)
+        try:
+            llm_data = await self.finalize_llm_json(llm_response, usage_tokens, plan_request, model)
+        except PlanParseError as e:
+            logger.warning("Error parsing streamed LLM JSON response: %s", e)
+            yield "error", {"error": "Invalid LLM response", "message": str(e)}
+            return
+
+        with span("pydantic_build"):
+            plan_response = self.build_plan_response(llm_data, plan_request, rag["retrieved_data"], rag["query_text"])
+        if rag["use_cache"]:
+            self.plan_cache.put(plan_request, rag["query_embedding"], plan_response.model_dump())
+        yield "plan", plan_response.model_dump()
+
+    def _section_event(self, path: tuple, value: Any) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """Map a completed JSON section to an SSE event; malformed sections are skipped and surface in the final plan"""
+        try:
+            if path == ("tripOverview",):
+                return "tripOverview", {"tripOverview": value}
+            if path == ("preparation",):
+                preparation = self.parse_preparation(value)
+                return ("preparation", preparation.model_dump()) if preparation else None
+            if path == ("trip_plan", "budget"):
+                return "budget", self.parse_budget(value).model_dump()
+            if path[:2] == ("trip_plan", "timeline"):
+                day_timeline = self.parse_day_timeline(value)
+                return ("day", day_timeline.model_dump()) if day_timeline else None
+            if path[:2] == ("trip_plan", "spots"):
+                return "spot", self.parse_spot(value).model_dump()
+        except (KeyError, TypeError, AttributeError, ValueError) as e:
+            logger.warning("Skipping malformed streamed section %s: %s", path, e)
+        return None
@@ -0,0 +1,264 @@
+import os
+import time
+import asyncio
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, TypeVar
+
+import openai
+from dotenv import load_dotenv
+
+load_dotenv()
+
+T = TypeVar("T")
+
+# Absolute time.monotonic() deadline of the HTTP request currently being served, if any
+_deadline: ContextVar[Optional[float]] = ContextVar("llm_deadline", default=None)
+
+
+class LLMUnavailableError(Exception):
+    """The LLM call was not attempted or abandoned to protect the backend or the caller's deadline."""
+
+    def __init__(self, message: str, retry_after: float = 0.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(LLMUnavailableError):
+    pass
+
+
+class DeadlineExceededError(LLMUnavailableError):
+    pass
+
+
+@contextmanager
+def deadline_scope(timeout_s: Optional[float]):
+    """Set the deadline that LLM calls made inside this scope (including spawned tasks) must finish by."""
+    token = _deadline.set(time.monotonic() + timeout_s if timeout_s else None)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_time() -> Optional[float]:
+    """Seconds left before the current request's deadline, or None without one."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def is_overload(error: BaseException) -> bool:
+    """Errors that mean the backend is saturated or down, as opposed to a bad request."""
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError, asyncio.TimeoutError)):
+        return True
+    status = getattr(error, "status_code", None)
+    return status is not None and (status == 429 or status >= 500)
+
+
+def _retry_after(error: BaseException, default: float = 1.0) -> float:
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers.get("retry-after", default))
+    except (AttributeError, TypeError, ValueError):
+        return default
+
+
+class AdaptiveConcurrencyLimiter:
+    """AIMD limit on concurrent LLM calls.
+
+    The limit grows by about one per limit's worth of fast successes while callers are
+    actually queueing on it, and is multiplied by `backoff` on an overload error or a call
+    slower than `latency_target_ms`, at most once per `cooldown_s` so a burst of failures
+    from one congestion event only counts once.
+    """
+
+    def __init__(self, initial_limit: int = 32, min_limit: int = 1, max_limit: int = 500,
+                 latency_target_ms: float = 60000, backoff: float = 0.5, cooldown_s: float = 1.0,
+                 max_waiters: int = 1000):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target_s = latency_target_ms / 1000
+        self.backoff = backoff
+        self.cooldown_s = cooldown_s
+        self.max_waiters = max_waiters
+        self.in_flight = 0
+        self.waiters = 0
+        self._last_decrease = 0.0
+        self._cond = asyncio.Condition()
+
+    @asynccontextmanager
+    async def slot(self, deadline: Optional[float] = None):
+        async with self._cond:
+            if self.in_flight >= int(self.limit) and self.waiters >= self.max_waiters:
+                raise LLMUnavailableError("Too many requests waiting for the LLM backend", retry_after=1.0)
+            self.waiters += 1
+            try:
+                while self.in_flight >= int(self.limit):
+                    timeout = None if deadline is None else deadline - time.monotonic()
+                    if timeout is not None and timeout <= 0:
+                        raise DeadlineExceededError("Request deadline passed while waiting for an LLM slot")
+                    try:
+                        await asyncio.wait_for(self._cond.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        raise DeadlineExceededError("Request deadline passed while waiting for an LLM slot")
+            except BaseException:
+                # This waiter may have been woken for a free slot it will not take; pass the wake-up on
+                if self.in_flight < int(self.limit):
+                    self._cond.notify(1)
+                raise
+            finally:
+                self.waiters -= 1
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            async with self._cond:
+                self.in_flight -= 1
+                self._cond.notify(max(int(self.limit) - self.in_flight, 1))
+
+    def on_success(self, latency_s: float):
+        if latency_s > self.latency_target_s:
+            self.on_overload()
+        elif self.in_flight + self.waiters >= int(self.limit):
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+    def on_overload(self):
+        now = time.monotonic()
+        if now - self._last_decrease >= self.cooldown_s:
+            self.limit = max(self.min_limit, self.limit * self.backoff)
+            self._last_decrease = now
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive overload failures and rejects calls for
+    `reset_timeout` seconds, then lets a single probe through (half-open) to decide whether
+    to close again."""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+
+    def before_call(self) -> bool:
+        """Raise CircuitOpenError while calls are rejected; True when this call is the half-open probe"""
+        if self.state == "open":
+            waited = time.monotonic() - self.opened_at
+            if waited < self.reset_timeout:
+                raise CircuitOpenError("LLM circuit is open", retry_after=self.reset_timeout - waited)
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self._probe_in_flight:
+                raise CircuitOpenError("LLM circuit is half-open and probing", retry_after=1.0)
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def on_success(self):
+        self.state, self.failures, self._probe_in_flight = "closed", 0, False
+
+    def on_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.state, self.opened_at = "open", time.monotonic()
+        self._probe_in_flight = False
+
+    def on_neutral(self):
+        # A client-side error or an abandoned call says nothing about backend health; just free the probe slot
+        self._probe_in_flight = False
+
+
+class LLMGuard:
+    """Circuit breaker, adaptive concurrency limit and deadline checks around one LLM backend."""
+
+    def __init__(self, limiter: AdaptiveConcurrencyLimiter, breaker: CircuitBreaker):
+        self.limiter = limiter
+        self.breaker = breaker
+        self._stats = {"calls": 0, "successes": 0, "overloads": 0, "errors": 0, "rejected_open": 0, "deadline_exceeded": 0}
+        self._latency_ewma_ms: Optional[float] = None
+
+    async def call(self, fn: Callable[[Optional[float]], Awaitable[T]]) -> T:
+        """Run `fn(timeout)` where timeout is what is left of the request deadline (None without one)."""
+        async with self.session() as timeout:
+            return await fn(timeout)
+
+    @asynccontextmanager
+    async def session(self) -> AsyncIterator[Optional[float]]:
+        """Guard everything run inside the block as one LLM call and yield the remaining timeout.
+
+        Streamed completions wrap the whole iteration so the concurrency slot is held, and the
+        latency and any overload error are recorded, until the last chunk has arrived. A block
+        that is cancelled or closed early only releases its slot and, if it was the half-open
+        probe, the probe.
+        """
+        self._stats["calls"] += 1
+        deadline = _deadline.get()
+        try:
+            probe = self.breaker.before_call()
+        except CircuitOpenError:
+            self._stats["rejected_open"] += 1
+            raise
+        succeeded = False
+        try:
+            async with self.limiter.slot(deadline):
+                timeout = None if deadline is None else deadline - time.monotonic()
+                if timeout is not None and timeout <= 0:
+                    raise DeadlineExceededError("Request deadline passed before the LLM call")
+                start = time.perf_counter()
+                try:
+                    yield timeout
+                except Exception as e:
+                    if deadline is not None and time.monotonic() >= deadline and is_overload(e):
+                        # Cut off by the caller's own deadline, not evidence the backend is saturated
+                        raise DeadlineExceededError("Request deadline passed during the LLM call") from e
+                    if not is_overload(e):
+                        self._stats["errors"] += 1
+                        raise
+                    self._stats["overloads"] += 1
+                    self.limiter.on_overload()
+                    self.breaker.on_failure()
+                    # Surface saturation uniformly so callers can degrade or fail fast with Retry-After
+                    raise LLMUnavailableError(f"LLM backend overloaded: {e}", retry_after=_retry_after(e)) from e
+                latency = time.perf_counter() - start
+            self._stats["successes"] += 1
+            self.limiter.on_success(latency)
+            self.breaker.on_success()
+            succeeded = True
+            latency_ms = latency * 1000
+            self._latency_ewma_ms = latency_ms if self._latency_ewma_ms is None else 0.9 * self._latency_ewma_ms + 0.1 * latency_ms
+        except DeadlineExceededError:
+            self._stats["deadline_exceeded"] += 1
+            raise
+        finally:
+            if probe and not succeeded:
+                # Errors, deadlines and cancellation (CancelledError, GeneratorExit) must not leave the probe taken
+                self.breaker.on_neutral()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "limit": round(self.limiter.limit, 2),
+            "in_flight": self.limiter.in_flight,
+            "waiting": self.limiter.waiters,
+            "circuit": self.breaker.state,
+            "latency_ewma_ms": round(self._latency_ewma_ms, 1) if self._latency_ewma_ms is not None else None,
+        }
+
+
+def build_llm_guard_from_env() -> LLMGuard:
+    return LLMGuard(
+        AdaptiveConcurrencyLimiter(
+            initial_limit=int(os.getenv("LLM_CONCURRENCY_INITIAL", "32")),
+            min_limit=int(os.getenv("LLM_CONCURRENCY_MIN", "1")),
+            max_limit=int(os.getenv("LLM_CONCURRENCY_MAX", os.getenv("LLM_MAX_CONNECTIONS", "500"))),
+            latency_target_ms=float(os.getenv("LLM_LATENCY_TARGET_MS", "60000")),
+        ),
+        CircuitBreaker(
+            failure_threshold=int(os.getenv("LLM_CIRCUIT_FAILURES", "5")),
+            reset_timeout=float(os.getenv("LLM_CIRCUIT_RESET_S", "30")),
+        ),
+    )
@@ -0,0 +1,360 @@
+import os
+import re
+import json
+import logging
+import operator
+import time
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+from utils.retrieval import DENSE_VECTOR
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+
+_RANGE_CHECKS = {"gt": operator.gt, "gte": operator.ge, "lt": operator.lt, "lte": operator.le}
+
+
+def _payload_values(payload: Dict[str, Any], key: str) -> List[Any]:
+    """Values at a Qdrant key path such as "destination_place.name" or "visited_place[].name"; arrays are flattened"""
+    values = [payload]
+    for part in key.split("."):
+        name = part[:-2] if part.endswith("[]") else part
+        found = []
+        for value in values:
+            if isinstance(value, dict) and value.get(name) is not None:
+                found.extend(value[name] if isinstance(value[name], list) else [value[name]])
+        values = found
+    return values
+
+
+def _words(text: Any) -> List[str]:
+    # Same tokenization as the "word" full-text payload indexes (lowercased)
+    return re.findall(r"\w+", str(text).lower())
+
+
+def _conditions(clause: Any) -> List[Dict[str, Any]]:
+    if clause is None:
+        return []
+    return clause if isinstance(clause, list) else [clause]
+
+
+def _matches_condition(payload: Dict[str, Any], condition: Dict[str, Any]) -> bool:
+    if any(clause in condition for clause in ("must", "should", "must_not")):
+        return matches_filter(payload, condition)
+    if "is_empty" in condition:
+        return not _payload_values(payload, condition["is_empty"]["key"])
+    values = _payload_values(payload, condition["key"])
+    if "match" in condition:
+        match = condition["match"]
+        if "text" in match:
+            words = set(_words(match["text"]))
+            return any(words <= set(_words(value)) for value in values)
+        if "value" in match:
+            return match["value"] in values
+        if "any" in match:
+            return any(value in match["any"] for value in values)
+    if "range" in condition:
+        bounds = [(_RANGE_CHECKS[op], bound) for op, bound in condition["range"].items() if bound is not None]
+        return any(
+            isinstance(value, (int, float)) and not isinstance(value, bool) and all(check(value, bound) for check, bound in bounds)
+            for value in values
+        )
+    raise ValueError(f"Filter condition not supported by the local index: {condition}")
+
+
+def matches_filter(payload: Dict[str, Any], query_filter: Optional[Dict[str, Any]]) -> bool:
+    """Evaluate a Qdrant filter (must / should / must_not with match, range and is_empty conditions) on a payload"""
+    if not query_filter:
+        return True
+    should = _conditions(query_filter.get("should"))
+    return (
+        all(_matches_condition(payload, condition) for condition in _conditions(query_filter.get("must")))
+        and (not should or any(_matches_condition(payload, condition) for condition in should))
+        and not any(_matches_condition(payload, condition) for condition in _conditions(query_filter.get("must_not")))
+    )
+
+
+class LocalVectorIndex:
+    """In-process mirror of a Qdrant collection for offline/edge retrieval.
+
+    Vectors live in a memory-mapped float32 matrix (`vectors.f32`), payloads in a SQLite
+    store keyed by row, and an optional hnswlib graph (`hnsw.bin`) is used for search when
+    hnswlib is installed; otherwise search is an exact dot product over the matrix. Search
+    results have the same shape as Qdrant REST points, so they can go straight into the
+    context builder. Deleted points keep their matrix row but lose their payload row and
+    are never returned again.
+    """
+
+    SCROLL_PAGE = 256
+    # Points per page when listing the ids that still exist in Qdrant
+    ID_SCROLL_PAGE = 2048
+
+    def __init__(self, directory: str, dim: int = 1024, use_hnsw: bool = True, ef_search: int = 64):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self.hnsw_path = os.path.join(directory, "hnsw.bin")
+        self.meta_path = os.path.join(directory, "meta.json")
+        self.dim = dim
+        self.ef_search = ef_search
+        self._lock = threading.RLock()
+
+        self.meta = {"dim": dim, "count": 0, "collection": None, "synced_at": None}
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                self.meta.update(json.load(f))
+            self.dim = self.meta["dim"]
+
+        self._payloads = sqlite3.connect(os.path.join(directory, "payloads.sqlite3"), check_same_thread=False)
+        self._payloads.execute("CREATE TABLE IF NOT EXISTS points (row INTEGER PRIMARY KEY, id TEXT UNIQUE, payload TEXT)")
+        self._row_by_id = {point_id: row for row, point_id in self._payloads.execute("SELECT row, id FROM points")}
+        # Matrix rows of points that still exist; deleted points leave a dead row behind
+        self._alive = np.zeros(self.count, dtype=bool)
+        self._alive[list(self._row_by_id.values())] = True
+
+        self._vectors = self._open_vectors()
+        self._hnsw = None
+        if use_hnsw and hnswlib is not None:
+            self._hnsw = hnswlib.Index(space="ip", dim=self.dim)
+            if os.path.exists(self.hnsw_path) and self.count:
+                self._hnsw.load_index(self.hnsw_path, max_elements=max(self.count, 1024))
+                # Rows upserted after the graph was last saved are re-added from the matrix
+                saved = self._hnsw.get_current_count()
+                if saved < self.count:
+                    self._hnsw.add_items(np.asarray(self._vectors[saved:]), np.arange(saved, self.count))
+            else:
+                self._hnsw.init_index(max_elements=max(self.count, 1024), ef_construction=200, M=16)
+                if self.count:
+                    self._hnsw.add_items(np.asarray(self._vectors), np.arange(self.count))
+            for row in np.flatnonzero(~self._alive):
+                self._mark_deleted(int(row))
+            self._hnsw.set_ef(ef_search)
+
+    @property
+    def count(self) -> int:
+        """Rows in the vector matrix, including those of deleted points"""
+        return self.meta["count"]
+
+    def __len__(self) -> int:
+        return len(self._row_by_id)
+
+    def _mark_deleted(self, row: int):
+        try:
+            self._hnsw.mark_deleted(row)
+        except RuntimeError:
+            # Already marked in the saved graph
+            pass
+
+    def _open_vectors(self) -> Optional[np.memmap]:
+        if not self.count:
+            return None
+        return np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(self.count, self.dim))
+
+    def _save_meta(self):
+        tmp_path = f"{self.meta_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f)
+        os.replace(tmp_path, self.meta_path)
+
+    def upsert(self, points: List[Dict[str, Any]]):
+        """Insert or overwrite points given as Qdrant REST dicts with `id`, `vector` and `payload`."""
+        if not points:
+            return
+        with self._lock:
+            appended_vectors, appended_rows = [], []
+            for point in points:
+                point_id = str(point["id"])
+                vector = point["vector"]
+                if isinstance(vector, dict):
+                    # Hybrid collections return named vectors; only the dense one is mirrored
+                    vector = vector[DENSE_VECTOR]
+                vector = np.asarray(vector, dtype=np.float32)
+                vector /= max(float(np.linalg.norm(vector)), 1e-12)
+                payload = json.dumps(point.get("payload") or {}, ensure_ascii=False)
+                row = self._row_by_id.get(point_id)
+                if row is None:
+                    row = self.count + len(appended_rows)
+                    self._row_by_id[point_id] = row
+                    appended_rows.append(row)
+                    appended_vectors.append(vector)
+                else:
+                    self._vectors[row] = vector
+                    if self._hnsw is not None:
+                        self._hnsw.add_items(vector[None, :], np.asarray([row]))
+                self._payloads.execute("INSERT OR REPLACE INTO points VALUES (?, ?, ?)", (row, point_id, payload))
+            self._payloads.commit()
+
+            if appended_vectors:
+                with open(self.vectors_path, "ab") as f:
+                    f.write(np.stack(appended_vectors).astype(np.float32).tobytes())
+                self.meta["count"] += len(appended_vectors)
+                self._alive = np.concatenate([self._alive, np.ones(len(appended_vectors), dtype=bool)])
+                if self._vectors is not None:
+                    self._vectors.flush()
+                self._vectors = self._open_vectors()
+                if self._hnsw is not None:
+                    if self.count > self._hnsw.get_max_elements():
+                        self._hnsw.resize_index(max(self.count, 2 * self._hnsw.get_max_elements()))
+                    self._hnsw.add_items(np.stack(appended_vectors), np.asarray(appended_rows))
+            else:
+                self._vectors.flush()
+            self._save_meta()
+
+    def delete(self, ids: List[Any]) -> int:
+        """Remove points by id; returns how many were in the index"""
+        with self._lock:
+            rows = [self._row_by_id.pop(str(point_id)) for point_id in ids if str(point_id) in self._row_by_id]
+            if not rows:
+                return 0
+            self._payloads.executemany("DELETE FROM points WHERE row = ?", [(row,) for row in rows])
+            self._payloads.commit()
+            self._alive[rows] = False
+            if self._hnsw is not None:
+                for row in rows:
+                    self._mark_deleted(row)
+            return len(rows)
+
+    def search(self, query_vector: List[float], limit: int = 5,
+               query_filter: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Nearest points to `query_vector`. With a Qdrant `query_filter` (see matches_filter) candidates
+        are taken in score order until `limit` of them match it."""
+        with self._lock:
+            if not self._row_by_id or limit <= 0:
+                return []
+            query = np.asarray(query_vector, dtype=np.float32)
+            query /= max(float(np.linalg.norm(query)), 1e-12)
+            # Without a filter the first `limit` candidates are the answer
+            page = limit if query_filter is None else max(4 * limit, 64)
+            results = []
+            for rows, scores in self._ranked(query, page, exhaustive=query_filter is not None):
+                results.extend(point for point in self._points(rows, scores) if matches_filter(point["payload"], query_filter))
+                if len(results) >= limit:
+                    break
+            return results[:limit]
+
+    def _ranked(self, query: np.ndarray, page: int, exhaustive: bool):
+        """Pages of (rows, scores) of live points from the most to the least similar"""
+        live = len(self._row_by_id)
+        if self._hnsw is not None:
+            seen, k = set(), page
+            while True:
+                k = min(k, live)
+                rows, distances = self._hnsw.knn_query(query[None, :], k=k)
+                fresh = [(int(row), 1.0 - float(distance)) for row, distance in zip(rows[0], distances[0]) if row not in seen]
+                seen.update(row for row, _ in fresh)
+                yield [row for row, _ in fresh], [score for _, score in fresh]
+                if not exhaustive or k >= live:
+                    return
+                k *= 2
+        all_scores = np.asarray(self._vectors) @ query
+        all_scores[~self._alive] = -np.inf
+        if not exhaustive:
+            k = min(page, live)
+            rows = np.argpartition(-all_scores, k - 1)[:k]
+            rows = rows[np.argsort(-all_scores[rows])]
+            yield rows, all_scores[rows]
+            return
+        order = np.argsort(-all_scores, kind="stable")[:live]
+        for start in range(0, live, page):
+            rows = order[start:start + page]
+            yield rows, all_scores[rows]
+
+    def search_batch(self, query_vectors: List[List[float]], limit: int = 5,
+                     query_filter: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+        return [self.search(query_vector, limit, query_filter) for query_vector in query_vectors]
+
+    def _points(self, rows, scores) -> List[Dict[str, Any]]:
+        rows = [int(row) for row in rows]
+        placeholders = ",".join("?" * len(rows))
+        found = {
+            row: (point_id, payload)
+            for row, point_id, payload in self._payloads.execute(
+                f"SELECT row, id, payload FROM points WHERE row IN ({placeholders})", rows
+            )
+        }
+        return [
+            {"id": found[row][0], "score": float(score), "payload": json.loads(found[row][1])}
+            for row, score in zip(rows, scores) if row in found
+        ]
+
+    def save(self):
+        with self._lock:
+            if self._hnsw is not None and self.count:
+                self._hnsw.save_index(self.hnsw_path)
+            self._save_meta()
+
+    def sync_from_qdrant(self, qdrant, collection: str, full: bool = False) -> int:
+        """Copy points from Qdrant through the scroll API.
+
+        A full sync (snapshot) pages through the whole collection. An incremental sync only
+        asks for points whose `ingested_at` payload field is newer than the last sync. Either
+        way the ids still in Qdrant are then listed (without payloads or vectors) and local
+        points missing from it are deleted. Returns the number of points copied.
+        """
+        started_at = time.time()
+        scroll_filter = None
+        if not full and self.meta.get("synced_at") and self.meta.get("collection") == collection:
+            scroll_filter = {"must": [{"key": "ingested_at", "range": {"gt": self.meta["synced_at"]}}]}
+
+        copied, offset = 0, None
+        while True:
+            response = qdrant.scroll(
+                collection,
+                limit=self.SCROLL_PAGE,
+                offset=offset,
+                with_payload=True,
+                with_vector=True,
+                scroll_filter=scroll_filter,
+            )
+            page = response.get("result", {})
+            points = page.get("points", [])
+            self.upsert(points)
+            copied += len(points)
+            offset = page.get("next_page_offset")
+            if offset is None:
+                break
+        live_ids = self._qdrant_ids(qdrant, collection)
+        deleted = self.delete([point_id for point_id in list(self._row_by_id) if point_id not in live_ids])
+
+        with self._lock:
+            self.meta["collection"] = collection
+            # Start the next incremental window from when this sync began, so points written during it are not missed
+            self.meta["synced_at"] = started_at
+            self.save()
+        logger.info("Local index sync of '%s' copied %d and deleted %d point(s), %d total",
+                    collection, copied, deleted, len(self))
+        return copied
+
+    def _qdrant_ids(self, qdrant, collection: str) -> set:
+        ids, offset = set(), None
+        while True:
+            response = qdrant.scroll(collection, limit=self.ID_SCROLL_PAGE, offset=offset, with_payload=False, with_vector=False)
+            page = response.get("result", {})
+            ids.update(str(point["id"]) for point in page.get("points", []))
+            offset = page.get("next_page_offset")
+            if offset is None:
+                return ids
+
+
+def build_local_index_from_env() -> Optional[LocalVectorIndex]:
+    """LOCAL_INDEX_DIR enables the local index; returns None when it is not configured."""
+    directory = os.getenv("LOCAL_INDEX_DIR")
+    if not directory:
+        return None
+    return LocalVectorIndex(
+        directory,
+        dim=int(os.getenv("LOCAL_INDEX_DIM", "1024")),
+        use_hnsw=os.getenv("LOCAL_INDEX_HNSW", "true").lower() == "true",
+        ef_search=int(os.getenv("LOCAL_INDEX_EF_SEARCH", "64")),
+    )
@@ -0,0 +1,166 @@
+import os
+import re
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_FAST_MODEL = "aisingapore/Gemma-SEA-LION-v3-9B-IT"
+# USD per 1k tokens (prompt + completion) of comparable hosted deployments; override with
+# LLM_MODEL_COSTS="model=price,model=price". Only used for the relative cost in routing stats.
+MODEL_COST_PER_1K_TOKENS = {
+    "aisingapore/Llama-SEA-LION-v3-70B-IT": 0.00088,
+    "aisingapore/Gemma-SEA-LION-v3-9B-IT": 0.0002,
+}
+# Cheap lexical cues weighted into the complexity score of a chat prompt
+COMPLEXITY_CUES = [
+    # Planning, logistics and money questions need the large model's knowledge and reasoning
+    (re.compile(r"\b(plan|itinerary|schedule|route|budget|cost|price|visa|permit|transport|accommodation|\d+\s*(days?|nights?))\b", re.I), 1.0),
+    # Explanations and comparisons
+    (re.compile(r"\b(why|how (do|does|can|should)|explain|compare|difference|versus|vs\.?|pros and cons|best way)\b", re.I), 1.0),
+    # Greetings, thanks and small talk in English and the main SEA languages
+    (re.compile(r"^\W*(hi|hello|hey|thanks|thank you|ok(ay)?|bye|good (morning|afternoon|evening)|sawasdee|"
+                r"สวัสดี|ขอบคุณ|xin chào|cảm ơn|halo|selamat|terima kasih|salamat|kumusta)\b", re.I), -2.0),
+]
+# Replies from the small model that mean it could not really answer
+LOW_CONFIDENCE = re.compile(
+    r"\b(i('m| am) not sure|i don't know|i do not know|i cannot (help|answer)|i can't (help|answer)|"
+    r"as an ai|i don't have (enough )?information)\b", re.I
+)
+
+
+@dataclass
+class RouteDecision:
+    model: str
+    reason: str
+
+
+class ModelRouter:
+    """Picks the model for each completion and records per-model latency, cost and escalations.
+
+    Request types:
+      - "chat": the fast model unless the prompt is longer than `fast_max_prompt_tokens` or
+        the complexity score reaches `complexity_threshold`
+      - "plan_section": sectioned sub-prompts, routed by length only
+      - "draft": always the fast model (draft-then-refine plans)
+      - "plan" / "plan_repair": always the strong model (one completion for the whole nested plan)
+
+    Callers escalate to the strong model when the fast one errors, is unavailable or gives
+    an empty, low-confidence or invalid answer, and report it with record_escalation().
+    """
+
+    def __init__(self, strong_model: str, fast_model: Optional[str] = DEFAULT_FAST_MODEL,
+                 fast_max_prompt_tokens: int = 1500, complexity_threshold: float = 1.5,
+                 costs: Optional[Dict[str, float]] = None, latency_window: int = 1000):
+        self.strong_model = strong_model
+        self.fast_model = fast_model if fast_model and fast_model != strong_model else None
+        self.fast_max_prompt_tokens = fast_max_prompt_tokens
+        self.complexity_threshold = complexity_threshold
+        self.costs = {**MODEL_COST_PER_1K_TOKENS, **(costs or {})}
+        self.latency_window = latency_window
+        self._models: Dict[str, Dict[str, Any]] = {}
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._routes: Dict[str, Dict[str, Any]] = {}
+
+    @staticmethod
+    def estimate_tokens(prompt: str) -> int:
+        return len(prompt) // 4
+
+    def complexity(self, prompt: str) -> float:
+        """Linear score over length, structure and lexical cues; higher means the large model is needed"""
+        score = min(self.estimate_tokens(prompt) / 200, 2.0)
+        score += 0.5 * max(prompt.count("?") - 1, 0) + 0.5 * min(prompt.count("\n"), 4)
+        for pattern, weight in COMPLEXITY_CUES:
+            score += weight * min(len(pattern.findall(prompt)), 2)
+        return score
+
+    def route(self, prompt: str, request_type: str) -> RouteDecision:
+        if self.fast_model is None:
+            decision = RouteDecision(self.strong_model, "routing_disabled")
+        elif request_type == "draft":
+            decision = RouteDecision(self.fast_model, "draft")
+        elif request_type not in ("chat", "plan_section"):
+            decision = RouteDecision(self.strong_model, "request_type")
+        elif self.estimate_tokens(prompt) > self.fast_max_prompt_tokens:
+            decision = RouteDecision(self.strong_model, "length")
+        elif request_type == "chat" and self.complexity(prompt) >= self.complexity_threshold:
+            decision = RouteDecision(self.strong_model, "classifier")
+        else:
+            decision = RouteDecision(self.fast_model, "simple")
+        route = self._route_stats(request_type)
+        route["routed"][decision.model] = route["routed"].get(decision.model, 0) + 1
+        route["reasons"][decision.reason] = route["reasons"].get(decision.reason, 0) + 1
+        return decision
+
+    def should_escalate(self, request_type: str, content: str) -> Optional[str]:
+        """Reason to redo a fast-model answer with the strong model, or None to keep it"""
+        if not content or not content.strip():
+            return "empty"
+        if request_type == "chat" and LOW_CONFIDENCE.search(content[:500]):
+            return "low_confidence"
+        return None
+
+    def record_escalation(self, request_type: str, reason: str):
+        escalations = self._route_stats(request_type)["escalations"]
+        escalations[reason] = escalations.get(reason, 0) + 1
+
+    def record_call(self, model: str, latency_s: float, tokens: int, ok: bool = True):
+        stats = self._models.setdefault(model, {"calls": 0, "errors": 0, "tokens": 0, "cost_usd": 0.0})
+        stats["calls"] += 1
+        if not ok:
+            stats["errors"] += 1
+            return
+        stats["tokens"] += tokens
+        stats["cost_usd"] += tokens / 1000 * self.costs.get(model, 0.0)
+        self._latencies.setdefault(model, deque(maxlen=self.latency_window)).append(latency_s * 1000)
+
+    def _route_stats(self, request_type: str) -> Dict[str, Any]:
+        return self._routes.setdefault(request_type, {"routed": {}, "reasons": {}, "escalations": {}})
+
+    def stats(self) -> Dict[str, Any]:
+        models = {}
+        for model, stats in self._models.items():
+            latencies = np.asarray(self._latencies.get(model) or [0.0])
+            models[model] = {
+                **stats,
+                "cost_usd": round(stats["cost_usd"], 6),
+                "latency_p50_ms": round(float(np.percentile(latencies, 50)), 1),
+                "latency_p95_ms": round(float(np.percentile(latencies, 95)), 1),
+            }
+        routes = {}
+        for request_type, route in self._routes.items():
+            fast_calls = route["routed"].get(self.fast_model, 0)
+            escalations = sum(route["escalations"].values())
+            routes[request_type] = {
+                **route,
+                "escalation_rate": round(escalations / fast_calls, 4) if fast_calls else 0.0,
+            }
+        return {
+            "strong_model": self.strong_model,
+            "fast_model": self.fast_model,
+            "models": models,
+            "routes": routes,
+        }
+
+
+def _parse_costs(spec: str) -> Dict[str, float]:
+    costs = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        model, _, price = item.rpartition("=")
+        costs[model.strip()] = float(price)
+    return costs
+
+
+def build_model_router_from_env(strong_model: str) -> ModelRouter:
+    enabled = os.getenv("MODEL_ROUTING", "true").lower() == "true"
+    return ModelRouter(
+        strong_model,
+        fast_model=os.getenv("LLM_FAST_MODEL", DEFAULT_FAST_MODEL) if enabled else None,
+        fast_max_prompt_tokens=int(os.getenv("LLM_FAST_MAX_PROMPT_TOKENS", "1500")),
+        complexity_threshold=float(os.getenv("LLM_ROUTER_THRESHOLD", "1.5")),
+        costs=_parse_costs(os.getenv("LLM_MODEL_COSTS", "")),
+    )
@@ -0,0 +1,306 @@
+import os
+import re
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from interface import PlanRequest
+
+load_dotenv()
+
+
+@dataclass
+class CacheEntry:
+    value: Dict[str, Any]
+    embedding: Optional[List[float]]
+    partition: str
+    created_at: float
+
+
+class CacheBackend(ABC):
+    """Storage interface for PlanCache. Backends own TTL filtering and LRU eviction."""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[CacheEntry]:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, entry: CacheEntry) -> int:
+        """Store an entry and return how many entries were evicted to make room."""
+
+    @abstractmethod
+    def candidates(self, partition: str) -> Iterable[Tuple[str, CacheEntry]]:
+        """Live entries in a partition, used for the semantic lookup."""
+
+    @abstractmethod
+    def touch(self, key: str) -> None:
+        ...
+
+    @abstractmethod
+    def __len__(self) -> int:
+        ...
+
+
+class InMemoryCacheBackend(CacheBackend):
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+
+    def _expired(self, entry: CacheEntry) -> bool:
+        return time.time() - entry.created_at > self.ttl
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self._expired(entry):
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def set(self, key: str, entry: CacheEntry) -> int:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        evicted = 0
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            evicted += 1
+        return evicted
+
+    def candidates(self, partition: str) -> Iterable[Tuple[str, CacheEntry]]:
+        return [
+            (key, entry) for key, entry in self._entries.items()
+            if entry.partition == partition and entry.embedding is not None and not self._expired(entry)
+        ]
+
+    def touch(self, key: str) -> None:
+        if key in self._entries:
+            self._entries.move_to_end(key)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """Disk-backed cache so entries survive restarts and are shared by workers on one node."""
+
+    def __init__(self, path: str, max_entries: int = 10000, ttl: float = 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS plan_cache (
+                key TEXT PRIMARY KEY,
+                partition TEXT NOT NULL,
+                embedding BLOB,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS plan_cache_partition ON plan_cache(partition)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS plan_cache_last_access ON plan_cache(last_access)")
+
+    def _row_to_entry(self, row) -> CacheEntry:
+        partition, embedding, value, created_at = row
+        return CacheEntry(
+            value=json.loads(value),
+            embedding=np.frombuffer(embedding, dtype=np.float32).tolist() if embedding else None,
+            partition=partition,
+            created_at=created_at,
+        )
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        row = self._conn.execute(
+            "SELECT partition, embedding, value, created_at FROM plan_cache WHERE key = ? AND created_at > ?",
+            (key, time.time() - self.ttl),
+        ).fetchone()
+        if row is None:
+            return None
+        self.touch(key)
+        return self._row_to_entry(row)
+
+    def set(self, key: str, entry: CacheEntry) -> int:
+        embedding = np.asarray(entry.embedding, dtype=np.float32).tobytes() if entry.embedding is not None else None
+        now = time.time()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO plan_cache VALUES (?, ?, ?, ?, ?, ?)",
+            (key, entry.partition, embedding, json.dumps(entry.value), entry.created_at, now),
+        )
+        expired = self._conn.execute("DELETE FROM plan_cache WHERE created_at <= ?", (now - self.ttl,)).rowcount
+        overflow = len(self) - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM plan_cache WHERE key IN (SELECT key FROM plan_cache ORDER BY last_access ASC LIMIT ?)",
+                (overflow,),
+            )
+            return expired + overflow
+        return expired
+
+    def candidates(self, partition: str) -> Iterable[Tuple[str, CacheEntry]]:
+        rows = self._conn.execute(
+            "SELECT key, partition, embedding, value, created_at FROM plan_cache "
+            "WHERE partition = ? AND embedding IS NOT NULL AND created_at > ?",
+            (partition, time.time() - self.ttl),
+        ).fetchall()
+        return [(row[0], self._row_to_entry(row[1:])) for row in rows]
+
+    def touch(self, key: str) -> None:
+        self._conn.execute("UPDATE plan_cache SET last_access = ? WHERE key = ?", (time.time(), key))
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM plan_cache").fetchone()[0]
+
+
+def _normalize(value: Optional[str]) -> str:
+    return " ".join((value or "").lower().split())
+
+
+def canonical_request(plan_request: PlanRequest) -> Dict[str, Any]:
+    """PlanRequest with case, whitespace and interest order normalized away."""
+    return {
+        "start_place": _normalize(plan_request.start_place),
+        "destination": _normalize(plan_request.destination),
+        "travelDates": _normalize(plan_request.travelDates),
+        "duration": plan_request.duration,
+        "groupSize": plan_request.groupSize,
+        "interests": sorted({_normalize(i) for i in plan_request.interests if i and i.strip()}),
+        "budgetTier": _normalize(plan_request.budgetTier),
+        "trip_price": plan_request.trip_price,
+        "stayPref": _normalize(plan_request.stayPref),
+        "transportPref": _normalize(plan_request.transportPref),
+        "theme": _normalize(plan_request.theme),
+    }
+
+
+def request_key(plan_request: PlanRequest) -> str:
+    canonical = json.dumps(canonical_request(plan_request), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _place(value: Optional[str]) -> str:
+    return re.sub(r"[^0-9a-z]", "", (value or "").lower())
+
+
+def request_partition(plan_request: PlanRequest) -> str:
+    # Semantic matches are only considered between requests that agree on the fields an embedding
+    # cannot be trusted to tell apart ("Chiang Mai" vs "Chiang Rai", 3 vs 4 days, Budget vs Luxury,
+    # a different origin, price, set of interests, dates or theme), so a hit never carries the wrong
+    # dates or theme; only the stay and transport preferences are left to the embedding
+    canonical = canonical_request(plan_request)
+    return "|".join([
+        _place(plan_request.start_place),
+        _place(plan_request.destination),
+        str(plan_request.duration),
+        str(plan_request.groupSize),
+        canonical["budgetTier"],
+        "" if plan_request.trip_price is None else repr(float(plan_request.trip_price)),
+        ",".join(canonical["interests"]),
+        canonical["travelDates"],
+        canonical["theme"],
+    ])
+
+
+class PlanCache:
+    """Two-tier cache for generated trip plans.
+
+    Tier one is an exact match on the canonicalized PlanRequest. Tier two compares the
+    query embedding against cached entries in the same partition and returns the best
+    one above `similarity_threshold`.
+    """
+
+    def __init__(self, backend: CacheBackend, similarity_threshold: float = 0.95):
+        self.backend = backend
+        self.similarity_threshold = similarity_threshold
+        self._lock = threading.Lock()
+        self._stats = {"exact_hits": 0, "semantic_hits": 0, "degraded_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def get_exact(self, plan_request: PlanRequest) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self.backend.get(request_key(plan_request))
+            if entry is not None:
+                self._stats["exact_hits"] += 1
+                return entry.value
+        return None
+
+    def _best_match(self, plan_request: PlanRequest, embedding: List[float]):
+        """Most similar cached entry in the request's partition as (score, key, entry), or None. Call with the lock held."""
+        candidates = list(self.backend.candidates(request_partition(plan_request)))
+        if not candidates:
+            return None
+        matrix = np.asarray([entry.embedding for _, entry in candidates], dtype=np.float32)
+        # Embeddings are L2-normalized, so the dot product is the cosine similarity
+        scores = matrix @ np.asarray(embedding, dtype=np.float32)
+        best = int(np.argmax(scores))
+        key, entry = candidates[best]
+        return float(scores[best]), key, entry
+
+    def get_semantic(self, plan_request: PlanRequest, embedding: List[float]) -> Optional[Dict[str, Any]]:
+        """Call after get_exact() missed; counts a miss when nothing is similar enough."""
+        with self._lock:
+            match = self._best_match(plan_request, embedding)
+            if match is not None and match[0] >= self.similarity_threshold:
+                self.backend.touch(match[1])
+                self._stats["semantic_hits"] += 1
+                return match[2].value
+            self._stats["misses"] += 1
+        return None
+
+    def get_degraded(self, plan_request: PlanRequest, embedding: List[float], threshold: float) -> Optional[Dict[str, Any]]:
+        """Looser semantic lookup used only when the LLM backend is unavailable; a close-enough plan beats an error."""
+        with self._lock:
+            match = self._best_match(plan_request, embedding)
+            if match is not None and match[0] >= threshold:
+                self._stats["degraded_hits"] += 1
+                return match[2].value
+        return None
+
+    def put(self, plan_request: PlanRequest, embedding: Optional[List[float]], value: Dict[str, Any]) -> None:
+        entry = CacheEntry(
+            value=value,
+            embedding=list(embedding) if embedding is not None else None,
+            partition=request_partition(plan_request),
+            created_at=time.time(),
+        )
+        with self._lock:
+            self._stats["evictions"] += self.backend.set(request_key(plan_request), entry)
+            self._stats["stores"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self.backend)
+        lookups = stats["exact_hits"] + stats["semantic_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["exact_hits"] + stats["semantic_hits"]) / lookups, 4) if lookups else 0.0
+        stats["backend"] = type(self.backend).__name__
+        stats["similarity_threshold"] = self.similarity_threshold
+        return stats
+
+
+def build_plan_cache_from_env() -> Optional[PlanCache]:
+    """PLAN_CACHE_BACKEND=memory|sqlite|off; returns None when caching is disabled."""
+    backend_name = os.getenv("PLAN_CACHE_BACKEND", "memory").lower()
+    if backend_name in ("off", "none", ""):
+        return None
+    ttl = float(os.getenv("PLAN_CACHE_TTL", "3600"))
+    max_entries = int(os.getenv("PLAN_CACHE_MAX_ENTRIES", "1024"))
+    if backend_name == "sqlite":
+        backend = SQLiteCacheBackend(os.getenv("PLAN_CACHE_PATH", "plan_cache.sqlite3"), max_entries=max_entries, ttl=ttl)
+    elif backend_name == "memory":
+        backend = InMemoryCacheBackend(max_entries=max_entries, ttl=ttl)
+    else:
+        raise ValueError(f"Unknown PLAN_CACHE_BACKEND '{backend_name}', expected memory, sqlite or off")
+    return PlanCache(backend, similarity_threshold=float(os.getenv("PLAN_CACHE_SIMILARITY", "0.95")))
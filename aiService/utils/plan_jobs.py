@@ -0,0 +1,502 @@
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import asyncio
+import ipaddress
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Set, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+from dotenv import load_dotenv
+
+from interface import PlanRequest
+from utils.plan_cache import request_key
+
+load_dotenv()
+
+
+class WebhookURLError(ValueError):
+    """A webhook URL the service refuses to call."""
+
+
+def _host_allowed(host: str, allowed_hosts: Sequence[str]) -> bool:
+    # Entries are exact host names or `*.example.com` for any subdomain of example.com
+    return any(
+        host == allowed or (allowed.startswith("*.") and host.endswith(allowed[1:]))
+        for allowed in allowed_hosts
+    )
+
+
+async def check_webhook_url(url: str, allowed_hosts: Sequence[str] = (), allow_http: bool = False):
+    """Reject webhook targets that would let callers reach internal services (SSRF).
+
+    The URL must be https (http only with `allow_http`), carry no credentials, match
+    `allowed_hosts` when that is set, and every address its host resolves to must be public:
+    loopback, private, link-local (cloud metadata), shared, multicast and reserved ranges are
+    refused. Raises WebhookURLError.
+    """
+    parts = urlsplit(url)
+    if parts.scheme != "https" and not (allow_http and parts.scheme == "http"):
+        raise WebhookURLError("Webhook URL must use https")
+    if parts.username or parts.password:
+        raise WebhookURLError("Webhook URL must not contain credentials")
+    host = (parts.hostname or "").lower()
+    if not host:
+        raise WebhookURLError("Webhook URL has no host")
+    if allowed_hosts and not _host_allowed(host, allowed_hosts):
+        raise WebhookURLError(f"Webhook host '{host}' is not allowed")
+    try:
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        addresses = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except (socket.gaierror, ValueError) as e:
+        raise WebhookURLError(f"Webhook host '{host}' cannot be resolved: {e}")
+    for *_, sockaddr in addresses:
+        address = ipaddress.ip_address(sockaddr[0].split("%")[0])
+        mapped = getattr(address, "ipv4_mapped", None)
+        if not address.is_global or address.is_multicast or (mapped is not None and not mapped.is_global):
+            raise WebhookURLError(f"Webhook host '{host}' resolves to a non-public address")
+
+
+@dataclass
+class PlanJob:
+    job_id: str
+    request_key: str
+    plan_request: PlanRequest
+    status: str = "queued"
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    # Submissions coalesced into this job, including the first one
+    submissions: int = 1
+    webhooks: Dict[str, str] = field(default_factory=dict)
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("succeeded", "failed")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "submissions": self.submissions,
+            # Delivery outcomes only; URLs belong to individual submitters and are not echoed back
+            "webhooks": {
+                state: sum(status.split(":")[0] == state for status in self.webhooks.values())
+                for state in ("pending", "delivered", "failed")
+            },
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+
+class JobStore(ABC):
+    """Where PlanJobQueue keeps job state. Implementations own coalescing and retention."""
+
+    @abstractmethod
+    def submit(self, job: PlanJob, webhook_url: Optional[str]) -> Tuple[PlanJob, bool]:
+        """Store `job`, or join a queued/running job with the same request key instead;
+        returns the stored job and whether it was joined."""
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[PlanJob]:
+        ...
+
+    @abstractmethod
+    def update(self, job: PlanJob) -> None:
+        """Persist status, result, error and timestamps (not submissions or webhooks)."""
+
+    @abstractmethod
+    def set_webhook(self, job_id: str, url: str, state: str) -> None:
+        ...
+
+    @abstractmethod
+    def heartbeat(self, job_ids: Sequence[str]) -> None:
+        """Mark unfinished jobs as still owned by a live process."""
+
+    @abstractmethod
+    def purge(self, finished_before: float, stale_before: float, max_finished: int) -> None:
+        """Drop finished jobs older than `finished_before` and beyond `max_finished` (oldest first),
+        and fail unfinished ones whose owner has not sent a heartbeat since `stale_before`."""
+
+    @abstractmethod
+    def counts(self) -> Dict[str, int]:
+        """Number of stored jobs per status"""
+
+
+class InMemoryJobStore(JobStore):
+    """Per-process store; only correct with a single uvicorn worker."""
+
+    def __init__(self):
+        self._jobs: Dict[str, PlanJob] = {}
+        self._in_flight: Dict[str, PlanJob] = {}
+
+    def submit(self, job: PlanJob, webhook_url: Optional[str]) -> Tuple[PlanJob, bool]:
+        existing = self._in_flight.get(job.request_key)
+        if existing is not None:
+            existing.submissions += 1
+        else:
+            existing = self._jobs[job.job_id] = self._in_flight[job.request_key] = job
+        if webhook_url:
+            existing.webhooks.setdefault(webhook_url, "pending")
+        return existing, existing is not job
+
+    def get(self, job_id: str) -> Optional[PlanJob]:
+        return self._jobs.get(job_id)
+
+    def update(self, job: PlanJob) -> None:
+        if job.done and self._in_flight.get(job.request_key) is job:
+            del self._in_flight[job.request_key]
+
+    def set_webhook(self, job_id: str, url: str, state: str) -> None:
+        job = self._jobs.get(job_id)
+        if job is not None:
+            job.webhooks[url] = state
+
+    def heartbeat(self, job_ids: Sequence[str]) -> None:
+        pass
+
+    def purge(self, finished_before: float, stale_before: float, max_finished: int) -> None:
+        finished = sorted((job for job in self._jobs.values() if job.done), key=lambda job: job.finished_at)
+        overflow = max(len(finished) - max_finished, 0)
+        for i, job in enumerate(finished):
+            if i < overflow or job.finished_at < finished_before:
+                del self._jobs[job.job_id]
+
+    def counts(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for job in self._jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return counts
+
+
+class SQLiteJobStore(JobStore):
+    """Jobs in a SQLite file shared by every worker process on the node (by default the plan
+    cache's file), so any worker can answer a poll and identical submissions coalesce across
+    workers. Each job still runs in the process that accepted it."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS plan_jobs (
+                job_id TEXT PRIMARY KEY,
+                request_key TEXT NOT NULL,
+                plan_request TEXT NOT NULL,
+                status TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                submissions INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                heartbeat_at REAL NOT NULL
+            )"""
+        )
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS plan_job_webhooks (
+                job_id TEXT NOT NULL,
+                url TEXT NOT NULL,
+                state TEXT NOT NULL,
+                PRIMARY KEY (job_id, url)
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS plan_jobs_request ON plan_jobs(request_key, status)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS plan_jobs_finished ON plan_jobs(finished_at)")
+
+    def submit(self, job: PlanJob, webhook_url: Optional[str]) -> Tuple[PlanJob, bool]:
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so two workers cannot both miss and insert
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT job_id FROM plan_jobs WHERE request_key = ? AND status IN ('queued', 'running') "
+                    "ORDER BY created_at DESC LIMIT 1",
+                    (job.request_key,),
+                ).fetchone()
+                if row is not None:
+                    job_id, coalesced = row[0], True
+                    self._conn.execute("UPDATE plan_jobs SET submissions = submissions + 1 WHERE job_id = ?", (job_id,))
+                else:
+                    job_id, coalesced = job.job_id, False
+                    self._conn.execute(
+                        "INSERT INTO plan_jobs VALUES (?, ?, ?, ?, NULL, NULL, ?, ?, NULL, NULL, ?)",
+                        (job.job_id, job.request_key, job.plan_request.model_dump_json(), job.status,
+                         job.submissions, job.created_at, time.time()),
+                    )
+                if webhook_url:
+                    self._conn.execute(
+                        "INSERT OR IGNORE INTO plan_job_webhooks VALUES (?, ?, 'pending')", (job_id, webhook_url)
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if coalesced:
+            return self.get(job_id), True
+        if webhook_url:
+            job.webhooks.setdefault(webhook_url, "pending")
+        return job, False
+
+    def get(self, job_id: str) -> Optional[PlanJob]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT job_id, request_key, plan_request, status, result, error, submissions, created_at, "
+                "started_at, finished_at FROM plan_jobs WHERE job_id = ?",
+                (job_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            webhooks = dict(self._conn.execute(
+                "SELECT url, state FROM plan_job_webhooks WHERE job_id = ?", (job_id,)
+            ).fetchall())
+        return PlanJob(
+            job_id=row[0],
+            request_key=row[1],
+            plan_request=PlanRequest.model_validate_json(row[2]),
+            status=row[3],
+            result=json.loads(row[4]) if row[4] is not None else None,
+            error=row[5],
+            submissions=row[6],
+            webhooks=webhooks,
+            created_at=row[7],
+            started_at=row[8],
+            finished_at=row[9],
+        )
+
+    def update(self, job: PlanJob) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE plan_jobs SET status = ?, result = ?, error = ?, started_at = ?, finished_at = ?, "
+                "heartbeat_at = ? WHERE job_id = ?",
+                (job.status, json.dumps(job.result) if job.result is not None else None, job.error,
+                 job.started_at, job.finished_at, time.time(), job.job_id),
+            )
+
+    def set_webhook(self, job_id: str, url: str, state: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE plan_job_webhooks SET state = ? WHERE job_id = ? AND url = ?", (state, job_id, url)
+            )
+
+    def heartbeat(self, job_ids: Sequence[str]) -> None:
+        if not job_ids:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE plan_jobs SET heartbeat_at = ? WHERE job_id = ?", [(time.time(), job_id) for job_id in job_ids]
+            )
+
+    def purge(self, finished_before: float, stale_before: float, max_finished: int) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE plan_jobs SET status = 'failed', error = 'Abandoned: the worker running this job stopped', "
+                "finished_at = ? WHERE status IN ('queued', 'running') AND heartbeat_at < ?",
+                (now, stale_before),
+            )
+            self._conn.execute(
+                "DELETE FROM plan_jobs WHERE finished_at IS NOT NULL AND (finished_at < ? OR job_id IN ("
+                "SELECT job_id FROM plan_jobs WHERE finished_at IS NOT NULL ORDER BY finished_at DESC LIMIT -1 OFFSET ?))",
+                (finished_before, max_finished),
+            )
+            self._conn.execute("DELETE FROM plan_job_webhooks WHERE job_id NOT IN (SELECT job_id FROM plan_jobs)")
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._conn.execute("SELECT status, COUNT(*) FROM plan_jobs GROUP BY status").fetchall())
+
+
+class PlanJobQueue:
+    """Runs trip-plan generation in the background behind a bounded pool of asyncio workers.
+
+    Submitting a request that is identical (same canonical PlanRequest) to a queued or running
+    job returns that job instead of queueing another, so a burst of client retries costs one
+    pipeline run. Finished jobs are kept for `result_ttl` seconds (at most `max_stored` of
+    them) for polling, and their result is POSTed to every webhook registered on the job.
+
+    Job state lives in `store`; with more than one uvicorn worker it must be a SQLiteJobStore
+    so that polls and coalescing see every worker's jobs.
+    """
+
+    def __init__(
+        self,
+        run_plan: Callable[[PlanRequest], Awaitable[Any]],
+        workers: int = 4,
+        max_queued: int = 1000,
+        result_ttl: float = 3600,
+        webhook_timeout: float = 10.0,
+        webhook_retries: int = 3,
+        webhook_allowed_hosts: Sequence[str] = (),
+        webhook_allow_http: bool = False,
+        store: Optional[JobStore] = None,
+        max_stored: int = 10000,
+        stale_after: float = 60.0,
+    ):
+        self.run_plan = run_plan
+        self.workers = workers
+        self.result_ttl = result_ttl
+        self.webhook_timeout = webhook_timeout
+        self.webhook_retries = webhook_retries
+        self.webhook_allowed_hosts = tuple(webhook_allowed_hosts)
+        self.webhook_allow_http = webhook_allow_http
+        self.store = store if store is not None else InMemoryJobStore()
+        self.max_stored = max_stored
+        self.stale_after = stale_after
+        # Unfinished jobs accepted by this process, kept alive in the store by the heartbeat
+        self._local: Dict[str, PlanJob] = {}
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queued)
+        self._tasks: List[asyncio.Task] = []
+        # Strong references to webhook deliveries still running, so they are not garbage collected
+        self._deliveries: Set[asyncio.Task] = set()
+        self._http: Optional[httpx.AsyncClient] = None
+        self._stats = {"submitted": 0, "coalesced": 0, "succeeded": 0, "failed": 0, "webhooks_failed": 0}
+
+    def start(self):
+        """Spawn the workers; must be called from the running event loop (app lifespan)."""
+        # A redirect could point a vetted URL at an internal address, so none are followed
+        self._http = httpx.AsyncClient(timeout=self.webhook_timeout, follow_redirects=False)
+        self._tasks = [asyncio.create_task(self._worker(), name=f"plan-job-{i}") for i in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._heartbeat(), name="plan-job-heartbeat"))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._http is not None:
+            await self._http.aclose()
+
+    async def check_webhook(self, url: str):
+        """Raise WebhookURLError unless `url` is an acceptable webhook target; call before submit()"""
+        await check_webhook_url(url, self.webhook_allowed_hosts, self.webhook_allow_http)
+
+    def submit(self, plan_request: PlanRequest, webhook_url: Optional[str] = None) -> Tuple[PlanJob, bool]:
+        """Queue a plan; returns the job and whether it was coalesced into an in-flight one.
+
+        Raises asyncio.QueueFull when `max_queued` jobs are already waiting.
+        """
+        self._purge()
+        self._stats["submitted"] += 1
+        job = PlanJob(job_id=str(uuid.uuid4()), request_key=request_key(plan_request), plan_request=plan_request)
+        job, coalesced = self.store.submit(job, webhook_url)
+        if coalesced:
+            self._stats["coalesced"] += 1
+            return job, True
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            # Finish the stored job so later identical submissions do not coalesce into it
+            job.status, job.error, job.finished_at = "failed", "Rejected: the job queue is full", time.time()
+            self.store.update(job)
+            raise
+        self._local[job.job_id] = job
+        return job, False
+
+    def get_job(self, job_id: str) -> Optional[PlanJob]:
+        self._purge()
+        return self.store.get(job_id)
+
+    def _purge(self):
+        now = time.time()
+        self.store.purge(now - self.result_ttl, now - self.stale_after, self.max_stored)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "queued": self._queue.qsize(),
+            "running": sum(job.status == "running" for job in self._local.values()),
+            "stored": sum(self.store.counts().values()),
+            "workers": self.workers,
+        }
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.stale_after / 3)
+            self.store.heartbeat(list(self._local))
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            job.status, job.started_at = "running", time.time()
+            self.store.update(job)
+            try:
+                plan_response = await self.run_plan(job.plan_request)
+                job.result = plan_response.model_dump() if hasattr(plan_response, "model_dump") else plan_response
+                job.status = "succeeded"
+                self._stats["succeeded"] += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                job.error = str(getattr(e, "detail", None) or e)
+                job.status = "failed"
+                self._stats["failed"] += 1
+            finally:
+                job.finished_at = time.time()
+                if job.done:
+                    self.store.update(job)
+                self._local.pop(job.job_id, None)
+                self._queue.task_done()
+            # Re-read for webhooks (and submissions) added by coalesced submissions on other workers
+            job = self.store.get(job.job_id) or job
+            # Deliver in the background so a slow webhook never holds a worker slot
+            for url in list(job.webhooks):
+                task = asyncio.create_task(self._deliver(job, url))
+                self._deliveries.add(task)
+                task.add_done_callback(self._deliveries.discard)
+
+    async def _deliver(self, job: PlanJob, url: str):
+        for attempt in range(self.webhook_retries):
+            try:
+                # Checked again at delivery: the host may resolve elsewhere than at submission
+                await self.check_webhook(url)
+            except WebhookURLError as e:
+                self.store.set_webhook(job.job_id, url, f"failed: {e}")
+                break
+            try:
+                response = await self._http.post(url, json=job.to_dict())
+                response.raise_for_status()
+                self.store.set_webhook(job.job_id, url, "delivered")
+                return
+            except httpx.HTTPError as e:
+                self.store.set_webhook(job.job_id, url, f"failed: {e}")
+                if attempt < self.webhook_retries - 1:
+                    await asyncio.sleep(2 ** attempt)
+        self._stats["webhooks_failed"] += 1
+
+
+def build_plan_job_queue_from_env(run_plan: Callable[[PlanRequest], Awaitable[Any]]) -> PlanJobQueue:
+    store_kind = os.getenv("PLAN_JOB_STORE", "memory").lower()
+    if store_kind == "sqlite":
+        store = SQLiteJobStore(os.getenv("PLAN_JOB_STORE_PATH") or os.getenv("PLAN_CACHE_PATH", "plan_cache.sqlite3"))
+    elif store_kind == "memory":
+        # uvicorn reads --workers from WEB_CONCURRENCY; per-process job state would split across them
+        if int(os.getenv("WEB_CONCURRENCY", "1")) > 1:
+            raise ValueError("PLAN_JOB_STORE=memory only supports a single worker; use PLAN_JOB_STORE=sqlite")
+        store = InMemoryJobStore()
+    else:
+        raise ValueError(f"Unknown PLAN_JOB_STORE '{store_kind}', expected memory or sqlite")
+    return PlanJobQueue(
+        run_plan,
+        workers=int(os.getenv("PLAN_JOB_WORKERS", "4")),
+        max_queued=int(os.getenv("PLAN_JOB_MAX_QUEUED", "1000")),
+        result_ttl=float(os.getenv("PLAN_JOB_RESULT_TTL", "3600")),
+        webhook_timeout=float(os.getenv("PLAN_JOB_WEBHOOK_TIMEOUT", "10")),
+        webhook_allowed_hosts=[h.strip().lower() for h in os.getenv("PLAN_JOB_WEBHOOK_HOSTS", "").split(",") if h.strip()],
+        webhook_allow_http=os.getenv("PLAN_JOB_WEBHOOK_ALLOW_HTTP", "false").lower() == "true",
+        store=store,
+        max_stored=int(os.getenv("PLAN_JOB_MAX_STORED", "10000")),
+        stale_after=float(os.getenv("PLAN_JOB_STALE_S", "60")),
+    )
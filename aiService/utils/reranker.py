@@ -0,0 +1,183 @@
+import os
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from utils.llm_guard import remaining_time
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Small enough to score a few dozen candidates on CPU in well under the default budget;
+# BAAI/bge-reranker-v2-m3 is the multilingual (and ~2x slower) alternative
+DEFAULT_RERANK_MODEL = "BAAI/bge-reranker-base"
+
+
+class CrossEncoderReranker:
+    """Re-scores retrieval candidates with a cross-encoder over (query, document) pairs.
+
+    Uncached pairs of a call are scored in one batched forward pass on a dedicated thread.
+    Scores are kept in an LRU keyed by a hash of the model, query and document. A call that
+    does not finish within `budget_ms` (or the request's remaining deadline) returns None so
+    the caller keeps the vector order; the forward pass still completes and fills the cache.
+    While a pass is running, calls whose pairs are not all cached are not queued behind it
+    and keep the vector order too, so a model slower than the budget never builds a backlog.
+
+    `model` is any object with CrossEncoder's `predict`; by default `model_name` is loaded.
+    """
+
+    def __init__(self, model_name: str = DEFAULT_RERANK_MODEL, device: Optional[str] = None,
+                 max_length: int = 512, batch_size: int = 32, budget_ms: float = 300.0,
+                 cache_entries: int = 20000, latency_window: int = 1000, model: Optional[Any] = None):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.budget_s = budget_ms / 1000
+        self.cache_entries = cache_entries
+        start = time.perf_counter()
+        if model is None:
+            from sentence_transformers import CrossEncoder
+
+            model = CrossEncoder(model_name, device=device, max_length=max_length)
+        self.model = model
+        self.load_time_s = time.perf_counter() - start
+        # One forward pass at a time; late passes after a budget timeout must not pile up threads
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+        # Set while a pass is queued or running on the executor
+        self._busy = False
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[bytes, float]" = OrderedDict()
+        self._latencies: Deque[float] = deque(maxlen=latency_window)
+        self._stats = {"calls": 0, "pairs": 0, "cache_hits": 0, "scored": 0, "timeouts": 0, "skipped": 0, "errors": 0}
+
+    def _key(self, query: str, document: str) -> bytes:
+        return hashlib.blake2b(f"{self.model_name}\x00{query}\x00{document}".encode("utf-8"), digest_size=16).digest()
+
+    def _cached(self, keys: List[bytes]) -> List[Optional[float]]:
+        scores: List[Optional[float]] = [None] * len(keys)
+        with self._lock:
+            for i, key in enumerate(keys):
+                cached = self._cache.get(key)
+                if cached is not None:
+                    self._cache.move_to_end(key)
+                    scores[i] = cached
+        return scores
+
+    def score(self, query: str, documents: List[str]) -> List[float]:
+        """Relevance score per document; only pairs missing from the cache reach the model"""
+        keys = [self._key(query, document) for document in documents]
+        scores = self._cached(keys)
+        missing = [i for i, score in enumerate(scores) if score is None]
+        if missing:
+            predicted = self.model.predict(
+                [(query, documents[i]) for i in missing], batch_size=self.batch_size, convert_to_numpy=True
+            )
+            with self._lock:
+                for i, value in zip(missing, np.asarray(predicted, dtype=np.float32).reshape(-1)):
+                    scores[i] = float(value)
+                    self._cache[keys[i]] = float(value)
+                    self._cache.move_to_end(keys[i])
+                while len(self._cache) > self.cache_entries:
+                    self._cache.popitem(last=False)
+        with self._lock:
+            self._stats["pairs"] += len(documents)
+            self._stats["cache_hits"] += len(documents) - len(missing)
+            self._stats["scored"] += len(missing)
+        return scores
+
+    async def rerank(self, query: str, documents: List[str]) -> Optional[List[Tuple[int, float]]]:
+        """(index, score) of `documents` from most to least relevant, or None when the budget ran
+        out or scoring failed and the vector order should be kept"""
+        with self._lock:
+            self._stats["calls"] += 1
+        if not documents:
+            return []
+        budget = self.budget_s
+        remaining = remaining_time()
+        if remaining is not None:
+            budget = min(budget, max(remaining, 0.0))
+        start = time.perf_counter()
+        with self._lock:
+            busy, self._busy = self._busy, True
+        if busy:
+            scores = self._cached([self._key(query, document) for document in documents])
+            if any(score is None for score in scores):
+                with self._lock:
+                    self._stats["skipped"] += 1
+                logger.debug("Reranker busy with an earlier pass, keeping the vector order")
+                return None
+            with self._lock:
+                self._stats["pairs"] += len(documents)
+                self._stats["cache_hits"] += len(documents)
+            return sorted(enumerate(scores), key=lambda item: -item[1])
+        try:
+            future = asyncio.get_running_loop().run_in_executor(self._executor, self.score, query, documents)
+        except BaseException:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        try:
+            scores = await asyncio.wait_for(asyncio.shield(future), budget)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._stats["timeouts"] += 1
+            logger.debug("Rerank of %d candidates exceeded %.0f ms, keeping the vector order", len(documents), budget * 1000)
+            return None
+        except Exception as e:
+            with self._lock:
+                self._stats["errors"] += 1
+            logger.warning("Rerank failed, keeping the vector order: %s", e)
+            return None
+        self._latencies.append((time.perf_counter() - start) * 1000)
+        # Stable sort so equal scores keep their fused rank
+        return sorted(enumerate(scores), key=lambda item: -item[1])
+
+    def _release(self, future):
+        with self._lock:
+            self._busy = False
+
+    def warmup(self) -> float:
+        """One forward pass so the first request does not pay for lazy initialisation; returns ms"""
+        start = time.perf_counter()
+        self.model.predict([("Trip to Chiang Mai", "Doi Suthep temple and the old city")], convert_to_numpy=True)
+        return round((time.perf_counter() - start) * 1000, 2)
+
+    def stats(self) -> Dict[str, Any]:
+        latencies = np.asarray(self._latencies or [0.0])
+        with self._lock:
+            stats = dict(self._stats)
+            stats["cache_size"] = len(self._cache)
+        stats["cache_hit_rate"] = round(stats["cache_hits"] / stats["pairs"], 4) if stats["pairs"] else 0.0
+        return {
+            "model": self.model_name,
+            "budget_ms": round(self.budget_s * 1000, 1),
+            **stats,
+            "latency_p50_ms": round(float(np.percentile(latencies, 50)), 2),
+            "latency_p95_ms": round(float(np.percentile(latencies, 95)), 2),
+        }
+
+
+def build_reranker_from_env() -> Optional[CrossEncoderReranker]:
+    """RERANK=true enables the stage; returns None when it is off or the model cannot be loaded."""
+    if os.getenv("RERANK", "false").lower() != "true":
+        return None
+    model_name = os.getenv("RERANK_MODEL", DEFAULT_RERANK_MODEL)
+    try:
+        return CrossEncoderReranker(
+            model_name,
+            device=os.getenv("RERANK_DEVICE") or None,
+            max_length=int(os.getenv("RERANK_MAX_LENGTH", "512")),
+            batch_size=int(os.getenv("RERANK_BATCH_SIZE", "32")),
+            budget_ms=float(os.getenv("RERANK_BUDGET_MS", "300")),
+            cache_entries=int(os.getenv("RERANK_CACHE_SIZE", "20000")),
+        )
+    except Exception as e:
+        logger.warning("Could not load reranker '%s', reranking is disabled: %s", model_name, e)
+        return None
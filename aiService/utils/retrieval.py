@@ -0,0 +1,135 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+from interface import PlanRequest
+
+# Standard RRF damping constant from Cormack et al.; larger values flatten the rank weighting
+RRF_K = 60
+# Named vectors of a hybrid collection: BGE-M3 dense embedding and lexical weights
+DENSE_VECTOR = "dense"
+SPARSE_VECTOR = "sparse"
+_TEXT_INDEX = {"type": "text", "tokenizer": "word", "lowercase": True}
+# Payload indexes created with a collection: field -> Qdrant field schema. Location fields are
+# full-text indexed so "Chiang Mai" matches "Chiang Mai Old City"; ingested_at serves the local index sync.
+PAYLOAD_INDEXES = {
+    "country": _TEXT_INDEX,
+    "destination_place.name": _TEXT_INDEX,
+    "visited_place[].name": _TEXT_INDEX,
+    "duration": "integer",
+    "budget": "float",
+    "theme": "keyword",
+    "transportation": "keyword",
+    "ingested_at": "float",
+}
+
+
+def _or_missing(key: str, conditions: List[Dict[str, Any]]) -> Dict[str, Any]:
+    # Points without the structured field (e.g. transcript chunks) are never filtered out by it
+    return {"should": conditions + [{"is_empty": {"key": key}}]}
+
+
+def build_search_filter(plan_request: PlanRequest, duration_tolerance: int = 2,
+                        budget_slack: float = 0.25) -> Optional[Dict[str, Any]]:
+    """Qdrant filter narrowing retrieval to the request's destination, duration and budget.
+
+    The destination (and each comma separated part of it, e.g. "Chiang Mai, Thailand") is
+    matched against the country, destination and visited place names; duration must be within
+    `duration_tolerance` days and budget at most `budget_slack` over `trip_price`. Each
+    condition also lets through points that do not have the field at all.
+    """
+    must = []
+    parts = [part.strip() for part in plan_request.destination.split(",") if part.strip()]
+    if parts:
+        locations = [
+            {"key": key, "match": {"text": part}}
+            for part in parts
+            for key in ("destination_place.name", "country", "visited_place[].name")
+        ]
+        must.append(_or_missing("destination_place", locations))
+    if plan_request.duration:
+        must.append(_or_missing("duration", [{"key": "duration", "range": {
+            "gte": max(plan_request.duration - duration_tolerance, 1),
+            "lte": plan_request.duration + duration_tolerance,
+        }}]))
+    if plan_request.trip_price:
+        must.append(_or_missing("budget", [{"key": "budget", "range": {"lte": plan_request.trip_price * (1 + budget_slack)}}]))
+    return {"must": must} if must else None
+
+
+def collection_vectors(collection_info: Dict[str, Any]) -> Tuple[Optional[str], Optional[str]]:
+    """(dense vector name, sparse vector name) of a Qdrant collection info response.
+
+    Collections created before hybrid retrieval have a single unnamed vector, reported as (None, None).
+    """
+    params = collection_info.get("result", collection_info).get("config", {}).get("params", {})
+    vectors = params.get("vectors") or {}
+    dense_name = DENSE_VECTOR if DENSE_VECTOR in vectors and "size" not in vectors else None
+    sparse_name = SPARSE_VECTOR if SPARSE_VECTOR in (params.get("sparse_vectors") or {}) else None
+    return dense_name, sparse_name
+
+
+def sparse_vector(weights: Dict[int, float]) -> Dict[str, List]:
+    """Lexical weights in Qdrant's sparse vector format"""
+    return {"indices": list(weights), "values": list(weights.values())}
+
+
+def hybrid_searches(dense: List[List[float]], sparse: List[Dict[int, float]], limit: int,
+                    query_filter: Optional[Dict[str, Any]] = None, with_payload: Any = True) -> List[Dict[str, Any]]:
+    """Search-batch bodies: every dense query against the dense vector, then every lexical query
+    against the sparse one, so both run in the same round-trip"""
+    common = {"limit": limit, "with_payload": with_payload}
+    if query_filter:
+        common["filter"] = query_filter
+    searches = [{"vector": {"name": DENSE_VECTOR, "vector": vector}, **common} for vector in dense]
+    searches += [{"vector": {"name": SPARSE_VECTOR, "vector": sparse_vector(weights)}, **common} for weights in sparse]
+    return searches
+
+
+def split_hybrid_results(result_lists: List[List[Dict[str, Any]]], dense_count: int) -> List[List[Dict[str, Any]]]:
+    """Move the lexical match score of sparse results to `sparse_score`, so the fused
+    `vector_score` stays a cosine similarity"""
+    sparse_lists = [
+        [{**{k: v for k, v in point.items() if k != "score"}, "sparse_score": point.get("score", 0.0)} for point in results]
+        for results in result_lists[dense_count:]
+    ]
+    return result_lists[:dense_count] + sparse_lists
+
+
+def build_sub_queries(plan_request: PlanRequest, max_queries: int = 8) -> List[str]:
+    """Split a PlanRequest into focused retrieval queries: destination, each interest, theme and transport."""
+    destination = plan_request.destination
+    queries = [f"Trip from {plan_request.start_place} to {destination} for {plan_request.duration} days"]
+    for interest in plan_request.interests:
+        if interest and interest.strip():
+            queries.append(f"{interest.strip()} in {destination}")
+    if plan_request.theme:
+        queries.append(f"{plan_request.theme} trip to {destination}")
+    if plan_request.transportPref:
+        queries.append(f"Travel to {destination} by {plan_request.transportPref}")
+
+    unique, seen = [], set()
+    for query in queries:
+        if query.lower() not in seen:
+            seen.add(query.lower())
+            unique.append(query)
+    return unique[:max_queries]
+
+
+def reciprocal_rank_fusion(result_lists: List[List[Dict[str, Any]]], limit: int, k: int = RRF_K,
+                           weights: Optional[List[float]] = None) -> List[Dict[str, Any]]:
+    """Fuse ranked Qdrant point lists by summing weight / (k + rank) per point id.
+
+    The returned points keep their payload; `score` becomes the fused score and the best
+    raw similarity is kept as `vector_score`. `weights` (one per list, default 1) lets
+    e.g. the lexical rankings of a hybrid search count less than the dense ones.
+    """
+    fused: Dict[Any, Dict[str, Any]] = {}
+    for i, results in enumerate(result_lists):
+        weight = weights[i] if weights is not None else 1.0
+        for rank, point in enumerate(results, start=1):
+            entry = fused.get(point["id"])
+            if entry is None:
+                entry = fused[point["id"]] = {**point, "score": 0.0, "vector_score": point.get("score", 0.0)}
+            entry["score"] += weight / (k + rank)
+            entry["vector_score"] = max(entry["vector_score"], point.get("score", 0.0))
+    ranked = sorted(fused.values(), key=lambda p: (p["score"], p["vector_score"]), reverse=True)
+    return ranked[:limit]
@@ -0,0 +1,93 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Collapses concurrent async calls with the same key into one execution.
+
+    The first caller for a key runs `fn`; callers arriving while it is in flight await the
+    same future and receive the same result object (treat it as read-only) or exception.
+    Nothing is cached once the call completes.
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+        self._stats = {"calls": 0, "executions": 0, "saved": 0}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        self._stats["calls"] += 1
+        while (future := self._in_flight.get(key)) is not None:
+            self._stats["saved"] += 1
+            try:
+                # Shield so a follower that is cancelled does not cancel the shared call
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # Cancelled because the leader was, not this caller: run the call again (or join its new leader)
+                if not future.cancelled() or asyncio.current_task().cancelling():
+                    raise
+                self._stats["saved"] -= 1
+
+        future = asyncio.get_running_loop().create_future()
+        # Mark the exception as retrieved when nobody else was waiting on it
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._in_flight[key] = future
+        self._stats["executions"] += 1
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._stats, "in_flight": len(self._in_flight)}
+
+
+class SyncSingleFlight:
+    """Thread-based counterpart of SingleFlight for blocking calls served from the threadpool."""
+
+    def __init__(self):
+        self._in_flight: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "executions": 0, "saved": 0}
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> T:
+        with self._lock:
+            self._stats["calls"] += 1
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+                self._stats["executions"] += 1
+            else:
+                self._stats["saved"] += 1
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, "in_flight": len(self._in_flight)}
@@ -0,0 +1,169 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+
+# Stage totals of the request currently being served; parallel stages are summed
+_trace: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_trace", default=None)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    """Cumulative-bucket histogram rendered in the Prometheus text exposition format."""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = STAGE_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> (bucket counts, sum, count)
+        self._series: Dict[Tuple[str, ...], List[Any]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    labels = _format_labels(self.label_names, key, f'le="{bound}"')
+                    lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+                labels = _format_labels(self.label_names, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _format_labels(self.label_names, key)
+                lines.append(f"{self.name}_sum{labels} {total}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: List[Histogram] = []
+
+    def histogram(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = STAGE_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, label_names, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+STAGE_SECONDS = REGISTRY.histogram(
+    "aiservice_stage_duration_seconds", "Time spent in each stage of the request pipeline", ["stage"]
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    "aiservice_request_duration_seconds", "HTTP request latency until the response starts", ["method", "route", "status"]
+)
+LLM_TOKENS = REGISTRY.histogram(
+    "aiservice_llm_tokens", "Prompt and completion tokens per LLM call", ["model", "kind"], TOKEN_BUCKETS
+)
+
+
+def _load_tracer():
+    """OpenTelemetry tracer when OTEL_ENABLED=true and the API is installed.
+
+    Exporters are configured the usual way (the opentelemetry-sdk and an exporter package,
+    e.g. run under `opentelemetry-instrument` with OTEL_EXPORTER_OTLP_ENDPOINT set).
+    """
+    if os.getenv("OTEL_ENABLED", "false").lower() != "true":
+        return None
+    try:
+        from opentelemetry import trace
+    except ImportError:
+        logger.warning("OTEL_ENABLED is set but opentelemetry is not installed; spans are disabled")
+        return None
+    return trace.get_tracer("aiservice")
+
+
+_tracer = _load_tracer()
+
+
+def record_stage(stage: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    trace = _trace.get()
+    if trace is not None:
+        trace[stage] = trace.get(stage, 0.0) + seconds
+
+
+def record_tokens(model: str, prompt_tokens: int, completion_tokens: int):
+    LLM_TOKENS.observe(prompt_tokens, model=model, kind="prompt")
+    LLM_TOKENS.observe(completion_tokens, model=model, kind="completion")
+    trace = _trace.get()
+    if trace is not None:
+        trace["tokens_in"] = trace.get("tokens_in", 0) + prompt_tokens
+        trace["tokens_out"] = trace.get("tokens_out", 0) + completion_tokens
+
+
+@contextmanager
+def span(stage: str, **attributes: Any) -> Iterator[Dict[str, Any]]:
+    """Time a pipeline stage into the stage histogram, the request trace and, when enabled, an
+    OpenTelemetry span. Attributes added to the yielded dict are set on the span at the end."""
+    start = time.perf_counter()
+    otel = _tracer.start_as_current_span(stage) if _tracer is not None else nullcontext()
+    with otel as otel_span:
+        try:
+            yield attributes
+        finally:
+            record_stage(stage, time.perf_counter() - start)
+            if otel_span is not None:
+                for key, value in attributes.items():
+                    otel_span.set_attribute(key, value)
+
+
+@contextmanager
+def request_trace() -> Iterator[Dict[str, float]]:
+    """Collect the stage totals of everything run inside the block (including spawned tasks)."""
+    trace: Dict[str, float] = {}
+    token = _trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _trace.reset(token)
+
+
+def server_timing(trace: Dict[str, float]) -> str:
+    """Stage totals as a Server-Timing header value (durations in milliseconds)"""
+    return ", ".join(
+        f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in trace.items() if not stage.startswith("tokens_")
+    )
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
@@ -12,6 +12,21 @@ class YoutubeExtractor:
         except Exception as e:
             print(f"An error occurred: {e}")
             return None
+    def fetch_segments(self, video_id: str) -> List[Dict]:
+        """Transcript as [{"text", "start", "duration"}] with times in seconds; raises on failure"""
+        transcript = self.ytt_api.fetch(video_id, languages=['en', 'th'])
+        return [
+            {"text": entry.text, "start": entry.start, "duration": entry.duration}
+            for entry in transcript
+        ]
+
+    def get_segments(self, video_id: str) -> Optional[List[Dict]]:
+        try:
+            return self.fetch_segments(video_id) or None
+        except Exception as e:
+            print(f"An error occurred: {e}")
+            return None
+
     def get_text_only(self, video_id: str) -> Optional[List[str]]:
         transcript = self.extract_transcript(video_id)
         if transcript:
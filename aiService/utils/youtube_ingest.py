@@ -0,0 +1,265 @@
+import os
+import re
+import csv
+import json
+import time
+import logging
+import uuid
+import random
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field, asdict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from utils.chunker import chunk_transcript, TranscriptChunk
+
+logger = logging.getLogger(__name__)
+
+try:
+    from youtube_transcript_api import TranscriptsDisabled, NoTranscriptFound, VideoUnavailable
+    PERMANENT_ERRORS: Tuple[type, ...] = (TranscriptsDisabled, NoTranscriptFound, VideoUnavailable)
+except ImportError:
+    PERMANENT_ERRORS = ()
+
+# Beside the service code rather than the working directory, so every entry point shares one index
+DEFAULT_INDEX_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "youtube_index.sqlite3")
+
+VIDEO_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{11}$")
+VIDEO_URL_PATTERN = re.compile(r"(?:v=|youtu\.be/|/shorts/|/embed/)([A-Za-z0-9_-]{11})")
+
+
+def parse_video_ids(text: str) -> List[str]:
+    """Extract unique video ids, in order, from plain ids, watch/short URLs, a JSON list or a playlist CSV export."""
+    text = text.strip()
+    if text.startswith("["):
+        cells = [str(item) for item in json.loads(text)]
+    else:
+        cells = [cell for row in csv.reader(text.splitlines()) for cell in row]
+
+    video_ids = []
+    for cell in cells:
+        cell = cell.strip()
+        match = VIDEO_URL_PATTERN.search(cell)
+        video_id = match.group(1) if match else (cell if VIDEO_ID_PATTERN.match(cell) else None)
+        if video_id and video_id not in video_ids:
+            video_ids.append(video_id)
+    return video_ids
+
+
+class RateLimiter:
+    """Thread-safe token bucket allowing `rate` acquisitions per second with bursts up to `burst`."""
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class IngestedVideoIndex:
+    """Local SQLite record of video ids already stored in Qdrant, so re-seeding a region skips them."""
+
+    def __init__(self, path: str):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS ingested_videos (video_id TEXT PRIMARY KEY, chunk_count INTEGER, ingested_at REAL)"
+        )
+
+    def contains(self, video_id: str) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM ingested_videos WHERE video_id = ?", (video_id,)).fetchone() is not None
+
+    def add(self, video_id: str, chunk_count: int):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO ingested_videos VALUES (?, ?, ?)", (video_id, chunk_count, time.time())
+            )
+
+
+@dataclass
+class YoutubeIngestJob:
+    job_id: str
+    total: int
+    status: str = "queued"
+    fetched: int = 0
+    ingested: int = 0
+    skipped: int = 0
+    failed: int = 0
+    chunks: int = 0
+    errors: Dict[str, str] = field(default_factory=dict)
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+
+    def to_dict(self) -> Dict:
+        data = asdict(self)
+        done = self.ingested + self.skipped + self.failed
+        data["progress"] = round(done / self.total, 4) if self.total else 1.0
+        return data
+
+
+class YoutubeBulkIngestor:
+    """Fetches transcripts concurrently and embeds/upserts them in batches spanning several videos.
+
+    `fetch_segments` is any callable returning [{"text", "start", "duration"}] for a video id and
+    raising on failure; it defaults to the importer's YoutubeExtractor and can be swapped for a
+    local stand-in. Finished jobs stay pollable for `job_ttl` seconds, at most `max_jobs` of them.
+    """
+
+    def __init__(
+        self,
+        importer,
+        index: IngestedVideoIndex,
+        fetch_segments: Optional[Callable[[str], List[Dict]]] = None,
+        fetch_workers: int = 8,
+        requests_per_second: float = 5.0,
+        max_retries: int = 3,
+        embed_batch_chunks: int = 128,
+        job_ttl: float = 86400,
+        max_jobs: int = 1000,
+    ):
+        self.importer = importer
+        self.index = index
+        self.fetch_segments = fetch_segments or importer.youtube_extractor.fetch_segments
+        self.fetch_workers = fetch_workers
+        self.rate_limiter = RateLimiter(requests_per_second)
+        self.max_retries = max_retries
+        self.embed_batch_chunks = embed_batch_chunks
+        self.job_ttl = job_ttl
+        self.max_jobs = max_jobs
+        self.jobs: Dict[str, YoutubeIngestJob] = {}
+        self._jobs_lock = threading.Lock()
+        self._embed_lock = threading.Lock()
+
+    def start(self, video_ids: Iterable[str]) -> YoutubeIngestJob:
+        """Queue a background ingestion job and return it immediately."""
+        video_ids = list(dict.fromkeys(video_ids))
+        job = YoutubeIngestJob(job_id=str(uuid.uuid4()), total=len(video_ids))
+        with self._jobs_lock:
+            self._purge()
+            self.jobs[job.job_id] = job
+        threading.Thread(target=self.run, args=(job, video_ids), daemon=True, name=f"youtube-{job.job_id[:8]}").start()
+        return job
+
+    def get_job(self, job_id: str) -> Optional[YoutubeIngestJob]:
+        with self._jobs_lock:
+            self._purge()
+            return self.jobs.get(job_id)
+
+    def _purge(self):
+        """Drop finished jobs past `job_ttl` and the oldest finished ones beyond `max_jobs`; hold `_jobs_lock`."""
+        cutoff = time.time() - self.job_ttl
+        finished = sorted((job for job in self.jobs.values() if job.finished_at is not None), key=lambda job: job.finished_at)
+        overflow = len(self.jobs) - self.max_jobs
+        for job in finished:
+            if job.finished_at < cutoff or overflow > 0:
+                del self.jobs[job.job_id]
+                overflow -= 1
+
+    def _fetch_with_retry(self, video_id: str) -> List[Dict]:
+        for attempt in range(self.max_retries):
+            self.rate_limiter.acquire()
+            try:
+                return self.fetch_segments(video_id)
+            except PERMANENT_ERRORS:
+                raise
+            except Exception:
+                if attempt == self.max_retries - 1:
+                    raise
+                # Exponential backoff with full jitter
+                time.sleep(random.uniform(0, 2 ** attempt))
+        return []
+
+    def run(self, job: YoutubeIngestJob, video_ids: List[str]) -> YoutubeIngestJob:
+        job.status = "running"
+        pending_ids = []
+        for video_id in dict.fromkeys(video_ids):
+            if self.index.contains(video_id):
+                job.skipped += 1
+            else:
+                pending_ids.append(video_id)
+
+        buffered: List[Tuple[str, List[TranscriptChunk]]] = []
+        with ThreadPoolExecutor(max_workers=self.fetch_workers, thread_name_prefix="youtube-fetch") as executor:
+            futures = {executor.submit(self._fetch_with_retry, video_id): video_id for video_id in pending_ids}
+            for future in as_completed(futures):
+                video_id = futures[future]
+                try:
+                    segments = future.result()
+                    job.fetched += 1
+                    chunks = chunk_transcript(
+                        segments,
+                        self.importer.embedder.tokenizer,
+                        max_tokens=self.importer.youtube_chunk_tokens,
+                        overlap_tokens=self.importer.youtube_chunk_overlap,
+                    )
+                    if not chunks:
+                        raise ValueError("empty transcript")
+                    buffered.append((video_id, chunks))
+                except Exception as e:
+                    job.failed += 1
+                    job.errors[video_id] = str(e)
+                    continue
+                if sum(len(chunks) for _, chunks in buffered) >= self.embed_batch_chunks:
+                    self._flush(job, buffered)
+                    buffered = []
+        if buffered:
+            self._flush(job, buffered)
+
+        job.status = "completed"
+        job.finished_at = time.time()
+        logger.info("YouTube ingest job %s finished: %s", job.job_id, job.to_dict())
+        return job
+
+    def _flush(self, job: YoutubeIngestJob, buffered: List[Tuple[str, List[TranscriptChunk]]]):
+        """Embed every buffered chunk in one encode call and upsert them in one request."""
+        texts = [chunk.text for _, chunks in buffered for chunk in chunks]
+        try:
+            collection = self.importer.collection_name
+            with self._embed_lock:
+                embeddings, sparse = self.importer.encode_for(collection, texts)
+            points, offset = [], 0
+            for video_id, chunks in buffered:
+                video_embeddings = embeddings[offset:offset + len(chunks)]
+                video_sparse = sparse[offset:offset + len(chunks)] if sparse else None
+                offset += len(chunks)
+                points.extend(self.importer.build_transcript_points(video_id, chunks, video_embeddings, sparse=video_sparse))
+            self.importer.upsert_points(collection, points)
+        except Exception as e:
+            for video_id, _ in buffered:
+                job.failed += 1
+                job.errors[video_id] = f"embed/upsert failed: {e}"
+            return
+        for video_id, chunks in buffered:
+            self.index.add(video_id, len(chunks))
+            job.ingested += 1
+            job.chunks += len(chunks)
+
+
+def build_youtube_ingestor_from_env(importer) -> YoutubeBulkIngestor:
+    return YoutubeBulkIngestor(
+        importer,
+        index=IngestedVideoIndex(os.getenv("YOUTUBE_INDEX_PATH") or DEFAULT_INDEX_PATH),
+        fetch_workers=int(os.getenv("YOUTUBE_FETCH_WORKERS", "8")),
+        requests_per_second=float(os.getenv("YOUTUBE_REQUESTS_PER_SECOND", "5")),
+        max_retries=int(os.getenv("YOUTUBE_FETCH_RETRIES", "3")),
+        embed_batch_chunks=int(os.getenv("YOUTUBE_EMBED_BATCH_CHUNKS", "128")),
+        job_ttl=float(os.getenv("YOUTUBE_JOB_TTL", "86400")),
+        max_jobs=int(os.getenv("YOUTUBE_MAX_JOBS", "1000")),
+    )